@@ -11,7 +11,8 @@ class AgentAdmin(admin.ModelAdmin):
     list_display = ('user', 'agency_name', 'license_number', 'verification_status', 'rating', 'is_featured', 'is_active')
     list_filter = ('verification_status', 'is_featured', 'is_active', 'created_at')
     search_fields = ('user__email', 'agency_name', 'license_number')
-    readonly_fields = ('created_at', 'updated_at')
+    # Maintained by apps/agents/stats.py; fix drift with `manage.py reconcile_agent_stats`.
+    readonly_fields = ('rating', 'rating_count', 'total_listings', 'created_at', 'updated_at')
     actions = ['deactivate_agents']
 
     fieldsets = (
@@ -25,7 +26,7 @@ class AgentAdmin(admin.ModelAdmin):
             'fields': ('office_address', 'website', 'facebook', 'twitter', 'linkedin', 'instagram')
         }),
         ('Verification and Rating', {
-            'fields': ('verification_status', 'rating', 'total_listings', 'total_sales', 'is_featured', 'is_active')
+            'fields': ('verification_status', 'rating', 'rating_count', 'total_listings', 'total_sales', 'is_featured', 'is_active')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class AgentsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.agents'
+
+    def ready(self):
+        from . import signals  # noqa: F401
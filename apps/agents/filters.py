@@ -1,5 +1,6 @@
 import django_filters
-from .models import Agent
+from .models import AGENT_SORTS, DEFAULT_AGENT_SORT, Agent
+from .search import search_agents
 
 
 class AgentFilter(django_filters.FilterSet):
@@ -10,16 +11,26 @@ class AgentFilter(django_filters.FilterSet):
     max_rating = django_filters.NumberFilter(field_name='rating', lookup_expr='lte')
     min_experience = django_filters.NumberFilter(field_name='years_of_experience', lookup_expr='gte')
     max_experience = django_filters.NumberFilter(field_name='years_of_experience', lookup_expr='lte')
+    sort = django_filters.ChoiceFilter(
+        choices=[(name, label) for name, (label, _) in AGENT_SORTS.items()],
+        method='filter_sort', empty_label=None,
+    )
 
     class Meta:
         model = Agent
-        fields = ['query', 'agency_name', 'specialization', 'min_rating', 'max_rating', 'min_experience', 'max_experience']
+        fields = [
+            'query', 'agency_name', 'specialization', 'min_rating', 'max_rating', 'min_experience',
+            'max_experience', 'sort',
+        ]
 
     def filter_query(self, queryset, name, value):
-        return queryset.filter(
-            user__username__icontains=value
-        ) | queryset.filter(
-            agency_name__icontains=value
-        ) | queryset.filter(
-            specialization__icontains=value
-        )
+        return search_agents(queryset, value)
+
+    def filter_sort(self, queryset, name, value):
+        return queryset.order_by(*self.ordering())
+
+    def ordering(self):
+        """The ordering of the chosen sort (see AGENT_SORTS)."""
+        self.is_valid()
+        sort = self.form.cleaned_data.get('sort') or DEFAULT_AGENT_SORT
+        return AGENT_SORTS[sort][1]
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from apps.agents.stats import drifted_agents, reconcile_agent_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes every agent\'s rating totals, average rating and listing count '
+        'from the ratings and listings tables.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report agents whose stored totals have drifted.',
+        )
+
+    def handle(self, *args, **options):
+        drifted = drifted_agents()
+        for agent in drifted:
+            self.stdout.write(
+                f'{agent}: ratings {agent.rating_sum}/{agent.rating_count} '
+                f'(actual {agent.actual_rating_sum}/{agent.actual_rating_count}), '
+                f'listings {agent.total_listings} (actual {agent.actual_total_listings})'
+            )
+        if options['check']:
+            self.stdout.write(f'{len(drifted)} agents have drifted.')
+            return
+
+        count = reconcile_agent_stats()
+        self.stdout.write(self.style.SUCCESS(f'Reconciled {count} agents ({len(drifted)} had drifted).'))
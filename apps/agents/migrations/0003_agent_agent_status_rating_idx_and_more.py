@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['verification_status', '-rating', '-id'], name='agent_status_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['verification_status', 'is_featured'], name='agent_status_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['agent', '-created_at'], name='rating_agent_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_agent_totals(apps, schema_editor):
+    Agent = apps.get_model('agents', 'Agent')
+    Rating = apps.get_model('agents', 'Rating')
+    Listing = apps.get_model('listings', 'Listing')
+    ratings = Rating.objects.filter(agent=OuterRef('pk')).order_by().values('agent')
+    listings = Listing.objects.filter(agent=OuterRef('pk')).order_by().values('agent')
+    Agent.objects.update(
+        rating_sum=Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0),
+        rating_count=Coalesce(Subquery(ratings.annotate(total=Count('pk')).values('total')), 0),
+        total_listings=Coalesce(Subquery(listings.annotate(total=Count('pk')).values('total')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_agent_agent_status_rating_idx_and_more'),
+        ('listings', '0006_listing_listing_public_recent_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_agent_totals, migrations.RunPython.noop),
+    ]
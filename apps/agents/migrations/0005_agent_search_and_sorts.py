@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+from apps.agents.search import create_search_index, drop_search_index, index_agents
+
+
+def populate_search_text(apps, schema_editor):
+    index_agents(apps.get_model('agents', 'Agent').objects.all())
+
+
+def add_search_index(apps, schema_editor):
+    create_search_index(schema_editor)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0004_agent_rating_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+        migrations.RunPython(add_search_index, remove_search_index),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['verification_status', '-total_listings', '-id'], name='agent_status_listings_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['verification_status', '-created_at', '-id'], name='agent_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['verification_status', '-years_of_experience', '-id'], name='agent_status_experience_idx'),
+        ),
+    ]
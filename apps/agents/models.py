@@ -1,9 +1,46 @@
 
 from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
+from .search import build_search_text
+
 User = get_user_model()
 
+# agent_list sort options: (label, ordering). Each ordering has an index
+# (see Agent.Meta) and ends in -id for cursor pagination. "Most listings" is
+# by the total_listings counter, which counts every listing assigned to the
+# agent; cards show the live count of their published ones.
+AGENT_SORTS = {
+    'rating': ('Highest rated', ('-rating', '-id')),
+    'listings': ('Most listings', ('-total_listings', '-id')),
+    'newest': ('Newest', ('-created_at', '-id')),
+    'experience': ('Most experienced', ('-years_of_experience', '-id')),
+}
+DEFAULT_AGENT_SORT = 'rating'
+
+
+class AgentQuerySet(models.QuerySet):
+    def directory(self):
+        """
+        Verified agents with everything an agent_list card shows: the user,
+        their profile, and the number of published available listings and
+        when the newest of them was created (active_listings,
+        latest_listing_at). The listing figures are subqueries, so they are
+        only computed for the agents on the page.
+        """
+        from apps.listings.models import Listing
+
+        listings = Listing.objects.published().filter(agent=OuterRef('pk')).order_by()
+        return self.filter(verification_status='verified').select_related('user__profile').annotate(
+            active_listings=Coalesce(
+                Subquery(listings.values('agent').annotate(count=Count('pk')).values('count')),
+                0, output_field=IntegerField(),
+            ),
+            latest_listing_at=Subquery(listings.order_by('-created_at').values('created_at')[:1]),
+        ).order_by(*AGENT_SORTS[DEFAULT_AGENT_SORT][1])
+
 
 class Agent(models.Model):
     VERIFICATION_STATUS = (
@@ -17,6 +54,8 @@ class Agent(models.Model):
     license_number = models.CharField(max_length=100, unique=True)
     years_of_experience = models.PositiveIntegerField(default=0)
     specialization = models.CharField(max_length=200, blank=True)
+    # Username, agency name and specialization, lower-cased; see search.py.
+    search_text = models.TextField(blank=True, default='', editable=False)
     description = models.TextField(blank=True)
     office_address = models.TextField(blank=True)
     website = models.URLField(blank=True)
@@ -29,19 +68,53 @@ class Agent(models.Model):
         choices=VERIFICATION_STATUS, 
         default='pending'
     )
+    # rating is rating_sum / rating_count, kept in step with them by
+    # apps/agents/stats.py; total_listings counts listings assigned to the agent.
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
     total_listings = models.PositiveIntegerField(default=0)
     total_sales = models.PositiveIntegerField(default=0)
     is_featured = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    objects = AgentQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Agent'
         verbose_name_plural = 'Agents'
         ordering = ['-created_at']
+        indexes = [
+            # agent_list: verified agents by rating (id breaks ties for cursor pagination)
+            models.Index(fields=['verification_status', '-rating', '-id'], name='agent_status_rating_idx'),
+            # HomeView: featured verified agents
+            models.Index(fields=['verification_status', 'is_featured'], name='agent_status_featured_idx'),
+            # agent_list's other sorts (AGENT_SORTS)
+            models.Index(fields=['verification_status', '-total_listings', '-id'], name='agent_status_listings_idx'),
+            models.Index(fields=['verification_status', '-created_at', '-id'], name='agent_status_created_idx'),
+            models.Index(
+                fields=['verification_status', '-years_of_experience', '-id'], name='agent_status_experience_idx',
+            ),
+        ]
     
+    # Updated in place with F() expressions (see stats.py). save() on an
+    # existing agent leaves them alone so a stale instance cannot overwrite
+    # increments made since it was loaded.
+    COUNTER_FIELDS = ('rating', 'rating_sum', 'rating_count', 'total_listings')
+
+    def save(self, *args, **kwargs):
+        self.search_text = build_search_text(self.user.username, self.agency_name, self.specialization)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'search_text'}
+        elif not self._state.adding:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'{self.user.email} - {self.agency_name}'
     
@@ -63,3 +136,14 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ('agent', 'user')
+        indexes = [
+            models.Index(fields=['agent', '-created_at'], name='rating_agent_recent_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored score, so signal handlers can apply the difference on save/delete.
+        if 'agent_id' in instance.__dict__ and 'rating' in instance.__dict__:
+            instance._loaded_rating = (instance.agent_id, instance.rating)
+        return instance
@@ -0,0 +1,137 @@
+"""
+Agent directory search.
+
+Agents are searched by username, agency name and specialization. The three
+are copied, lower-cased, into Agent.search_text (the username lives on the
+user, so it could not be indexed together with the others), which the
+database indexes for substring matches:
+
+- PostgreSQL: a trigram (``pg_trgm``) GIN index, which ``LIKE '%term%'``
+  uses.
+- SQLite: an FTS5 table with the trigram tokenizer, kept in sync by
+  triggers, for terms of three characters or more.
+
+Shorter terms, and other backends, match on the column itself. Every term
+of a query must match.
+
+Views should only ever call ``search_agents``.
+"""
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'agents_agent_search_fts'
+# Shortest term the trigram indexes can look up.
+TRIGRAM = 3
+
+# SQL run by the migration that adds Agent.search_text.
+POSTGRESQL_INDEX_SQL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX agents_search_text_trgm ON agents_agent USING GIN (search_text gin_trgm_ops)',
+]
+POSTGRESQL_DROP_INDEX_SQL = [
+    'DROP INDEX IF EXISTS agents_search_text_trgm',
+]
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(search_text, tokenize='trigram')",
+    f"INSERT INTO {FTS_TABLE}(rowid, search_text) SELECT id, search_text FROM agents_agent",
+    f"""
+    CREATE TRIGGER agents_search_ai AFTER INSERT ON agents_agent BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER agents_search_ad AFTER DELETE ON agents_agent BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    # Counter updates (stats.py) don't touch search_text and skip this.
+    f"""
+    CREATE TRIGGER agents_search_au AFTER UPDATE OF search_text ON agents_agent BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END
+    """,
+]
+SQLITE_DROP_INDEX_SQL = [
+    'DROP TRIGGER IF EXISTS agents_search_ai',
+    'DROP TRIGGER IF EXISTS agents_search_ad',
+    'DROP TRIGGER IF EXISTS agents_search_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_search_index(schema_editor):
+    """Create the backend-specific index. Called from the migration."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_INDEX_SQL
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return
+        statements = SQLITE_INDEX_SQL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_DROP_INDEX_SQL
+    elif vendor == 'sqlite':
+        statements = SQLITE_DROP_INDEX_SQL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def build_search_text(username, agency_name, specialization):
+    """Agent.search_text for an agent with these fields."""
+    return ' '.join(part for part in (username, agency_name, specialization) if part).lower()
+
+
+def index_agents(queryset, batch_size=500):
+    """Refresh search_text of every agent in `queryset`. Returns the number of agents."""
+    agents = list(queryset.select_related('user').only(
+        'search_text', 'agency_name', 'specialization', 'user__username',
+    ))
+    for agent in agents:
+        agent.search_text = build_search_text(agent.user.username, agent.agency_name, agent.specialization)
+    queryset.model.objects.bulk_update(agents, ['search_text'], batch_size=batch_size)
+    return len(agents)
+
+
+_fts_table_cache = {}
+
+
+def _has_fts_table(connection):
+    # Checked once per database rather than on every search.
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _fts_table_cache:
+        _fts_table_cache[key] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_table_cache[key]
+
+
+def search_agents(queryset, query):
+    """Agents in `queryset` matching every term of `query`."""
+    # Imported here: listings.models imports Agent, whose module imports this one.
+    from apps.listings.search import search_terms
+
+    terms = search_terms(query)
+    connection = connections[queryset.db]
+    if connection.vendor == 'sqlite' and _has_fts_table(connection):
+        indexed = [term for term in terms if len(term) >= TRIGRAM]
+        if indexed:
+            match = ' '.join(f'"{term}"' for term in indexed)
+            queryset = queryset.filter(
+                pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]),
+            )
+        terms = [term for term in terms if len(term) < TRIGRAM]
+    for term in terms:
+        # search_text is lower-cased: a plain LIKE, which the trigram index serves.
+        queryset = queryset.filter(search_text__contains=term)
+    return queryset
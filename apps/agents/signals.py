@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.listings.cache import bump_versions, listing_namespace
+from apps.listings.models import Listing
+from apps.users.models import Profile
+from .models import Agent, Rating
+from .search import index_agents
+from .stats import apply_listing_change, apply_rating_change
+
+
+def _invalidate_agent_cache(agent_id):
+    # Counter updates bypass Agent.post_save, which normally does this
+    # (apps/listings/signals.py).
+    slugs = Listing.objects.filter(agent_id=agent_id).values_list('slug', flat=True)
+    bump_versions('agents', *[listing_namespace(slug) for slug in slugs])
+
+
+def invalidate_agent_user_cache(user_id):
+    """Agent pages show their user's name and profile; call when those change."""
+    for agent_id in Agent.objects.filter(user_id=user_id).values_list('pk', flat=True):
+        _invalidate_agent_cache(agent_id)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_save, sender=Profile)
+def invalidate_agent_cache_on_user_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logins only save last_login.
+    if raw or created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_agent_user_cache(instance.user_id if sender is Profile else instance.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def reindex_agent_on_username_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Agents are searched by username (see search.py).
+    if raw or created or (update_fields is not None and 'username' not in update_fields):
+        return
+    index_agents(Agent.objects.filter(user=instance))
+
+
+# Rating totals (see stats.py)
+
+@receiver(post_save, sender=Rating)
+def update_agent_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    score = int(instance.rating)
+    loaded_agent_id, loaded_score = getattr(instance, '_loaded_rating', (None, None))
+    if created or loaded_agent_id is None:
+        apply_rating_change(instance.agent_id, score, 1)
+    elif loaded_agent_id != instance.agent_id:
+        apply_rating_change(loaded_agent_id, -int(loaded_score), -1)
+        apply_rating_change(instance.agent_id, score, 1)
+        _invalidate_agent_cache(loaded_agent_id)
+    else:
+        apply_rating_change(instance.agent_id, score - int(loaded_score), 0)
+    instance._loaded_rating = (instance.agent_id, score)
+    _invalidate_agent_cache(instance.agent_id)
+
+
+@receiver(post_delete, sender=Rating)
+def update_agent_rating_on_delete(sender, instance, **kwargs):
+    agent_id, score = getattr(instance, '_loaded_rating', (instance.agent_id, instance.rating))
+    apply_rating_change(agent_id, -int(score), -1)
+    _invalidate_agent_cache(agent_id)
+
+
+# Listing totals
+
+@receiver(post_save, sender=Listing)
+def update_agent_total_listings_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_loaded_agent_id', instance.agent_id)
+    if previous != instance.agent_id:
+        apply_listing_change(previous, -1)
+        apply_listing_change(instance.agent_id, 1)
+    instance._loaded_agent_id = instance.agent_id
+
+
+@receiver(post_delete, sender=Listing)
+def update_agent_total_listings_on_delete(sender, instance, **kwargs):
+    apply_listing_change(getattr(instance, '_loaded_agent_id', instance.agent_id), -1)
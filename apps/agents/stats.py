@@ -0,0 +1,75 @@
+"""
+Incrementally maintained agent aggregates.
+
+Agent.rating_sum / rating_count (and the rating average derived from them)
+and Agent.total_listings are adjusted with single UPDATE ... SET x = x + n
+statements when ratings and listings change (see signals.py), so concurrent
+submissions cannot overwrite each other and no AVG/COUNT runs on the write
+path. `reconcile_agent_stats` recomputes everything from scratch to repair
+drift from bulk updates or raw SQL.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+
+from .models import Agent, Rating
+
+
+def rating_average(rating_sum, rating_count):
+    """Expression for rating_sum / rating_count rounded to 2 places, or 0 without ratings."""
+    return Case(
+        When(GreaterThan(rating_count, 0), then=Round(Cast(rating_sum, FloatField()) / rating_count, 2)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating_change(agent_id, sum_delta, count_delta):
+    """Add `sum_delta` / `count_delta` to an agent's rating totals and recompute the average."""
+    if agent_id is None or (sum_delta == 0 and count_delta == 0):
+        return
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('rating_count') + count_delta
+    # Every expression in an UPDATE sees the row as it was before it, so the
+    # average is computed from the new totals in the same statement.
+    Agent.objects.filter(pk=agent_id).update(
+        rating_sum=new_sum,
+        rating_count=new_count,
+        rating=rating_average(new_sum, new_count),
+    )
+
+
+def apply_listing_change(agent_id, delta):
+    if agent_id is not None and delta:
+        Agent.objects.filter(pk=agent_id).update(total_listings=F('total_listings') + delta)
+
+
+def _stats_subqueries():
+    from apps.listings.models import Listing
+
+    ratings = Rating.objects.filter(agent=OuterRef('pk')).order_by().values('agent')
+    listings = Listing.objects.filter(agent=OuterRef('pk')).order_by().values('agent')
+    return {
+        'rating_sum': Coalesce(Subquery(ratings.annotate(total=Sum('rating')).values('total')), 0),
+        'rating_count': Coalesce(Subquery(ratings.annotate(total=Count('pk')).values('total')), 0),
+        'total_listings': Coalesce(Subquery(listings.annotate(total=Count('pk')).values('total')), 0),
+    }
+
+
+def drifted_agents():
+    """Agents whose stored totals differ from their ratings and listings."""
+    actual = {f'actual_{name}': expression for name, expression in _stats_subqueries().items()}
+    return Agent.objects.annotate(**actual).filter(
+        ~Q(rating_sum=F('actual_rating_sum'))
+        | ~Q(rating_count=F('actual_rating_count'))
+        | ~Q(total_listings=F('actual_total_listings'))
+    )
+
+
+@transaction.atomic
+def reconcile_agent_stats():
+    """Recompute every agent's totals and average in two UPDATE statements. Returns the agent count."""
+    updated = Agent.objects.update(**_stats_subqueries())
+    Agent.objects.update(rating=rating_average(F('rating_sum'), F('rating_count')))
+    return updated
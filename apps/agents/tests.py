@@ -0,0 +1,157 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.listings.models import Listing
+from apps.listings.tests import create_catalogue
+from .models import Agent, Rating
+from .stats import drifted_agents
+
+User = get_user_model()
+
+
+class AgentViewQueryCountTests(TestCase):
+    """Query counts must not grow with the number of listings rendered."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue()
+
+    def test_agent_detail(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('agents:agent_detail', args=[self.agent.pk]))
+        self.assertEqual(len(response.context['listings']), 12)
+
+    def test_agent_list(self):
+        for i in range(11):
+            user = User.objects.create_user(email=f'agent{i}@example.com', username=f'agent{i}', password='password')
+            Agent.objects.create(user=user, agency_name=f'Agency {i}', license_number=f'L{i}', verification_status='verified')
+        # Count and page: users, profiles and listing figures come with the agents.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('agents:agent_list'))
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+    def test_agent_dashboard(self):
+        self.client.force_login(self.agent.user)
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse('agents:agent_dashboard'))
+        self.assertEqual(response.context['listings_count'], 12)
+
+    def test_agent_dashboard_listings_panel(self):
+        self.client.force_login(self.agent.user)
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('agents:agent_dashboard_listings'), {'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+
+class AgentStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=2, images_per_listing=0)
+        cls.raters = [
+            User.objects.create_user(email=f'rater{i}@example.com', username=f'rater{i}', password='password')
+            for i in range(3)
+        ]
+
+    def assertStats(self, rating_sum, rating_count, rating, total_listings):
+        self.agent.refresh_from_db()
+        self.assertEqual(
+            (self.agent.rating_sum, self.agent.rating_count, self.agent.rating, self.agent.total_listings),
+            (rating_sum, rating_count, Decimal(rating), total_listings),
+        )
+
+    def test_ratings_update_totals_in_place(self):
+        self.assertStats(0, 0, '0', 2)
+        for rater, score in zip(self.raters, (5, 4, 4)):
+            Rating.objects.create(agent=self.agent, user=rater, rating=score)
+        self.assertStats(13, 3, '4.33', 2)
+
+        rating = Rating.objects.get(user=self.raters[0])
+        rating.rating = 2
+        rating.save()
+        self.assertStats(10, 3, '3.33', 2)
+
+        Rating.objects.filter(user__in=self.raters[:2]).delete()
+        self.assertStats(4, 1, '4', 2)
+        Rating.objects.all().delete()
+        self.assertStats(0, 0, '0', 2)
+
+    def test_rating_view_does_not_overwrite_concurrent_ratings(self):
+        self.client.force_login(self.raters[0])
+        stale = Agent.objects.get(pk=self.agent.pk)
+        self.client.post(reverse('agents:agent_detail', args=[self.agent.pk]), {'rating': '5'})
+        Rating.objects.create(agent=self.agent, user=self.raters[1], rating=3)
+        stale.save()  # e.g. an admin edit loaded before the ratings came in
+        self.assertStats(8, 2, '4', 2)
+
+    def test_listing_totals_follow_agent_assignment(self):
+        listing = Listing.objects.get(pk=self.listings[0].pk)
+        listing.agent = None
+        listing.save()
+        self.assertStats(0, 0, '0', 1)
+        listing.agent = self.agent
+        listing.save()
+        listing.save()
+        self.assertStats(0, 0, '0', 2)
+        listing.delete()
+        self.assertStats(0, 0, '0', 1)
+
+    def test_reconcile_repairs_drift(self):
+        Rating.objects.create(agent=self.agent, user=self.raters[0], rating=5)
+        Agent.objects.update(rating_sum=0, rating_count=7, total_listings=0, rating=0)
+        self.assertEqual(drifted_agents().count(), 1)
+        call_command('reconcile_agent_stats', stdout=StringIO())
+        self.assertStats(5, 1, '5', 2)
+        self.assertEqual(drifted_agents().count(), 0)
+
+
+class AgentDirectoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=3, images_per_listing=0)
+        Listing.objects.filter(pk=cls.listings[0].pk).update(is_published=False)
+
+        def agent(username, agency, specialization, experience):
+            user = User.objects.create_user(email=f'{username}@example.com', username=username, password='password')
+            return Agent.objects.create(
+                user=user, agency_name=agency, license_number=username, specialization=specialization,
+                years_of_experience=experience, verification_status='verified',
+            )
+
+        cls.coast = agent('wanjiru', 'Coast Homes', 'Beach villas', 12)
+        cls.karen = agent('otieno', 'Karen Estates', 'Family homes', 3)
+
+    def names(self, **params):
+        response = self.client.get(reverse('agents:agent_list'), params)
+        return [agent.user.username for agent in response.context['page_obj']]
+
+    def test_listing_figures(self):
+        agent = Agent.objects.directory().get(pk=self.agent.pk)
+        self.assertEqual(agent.active_listings, 2)
+        self.assertEqual(agent.latest_listing_at, self.listings[2].created_at)
+        self.assertEqual(Agent.objects.directory().get(pk=self.coast.pk).active_listings, 0)
+
+    def test_search(self):
+        self.assertEqual(self.names(query='coast'), ['wanjiru'])
+        self.assertEqual(self.names(query='WANJ'), ['wanjiru'])
+        self.assertEqual(self.names(query='homes otieno'), ['otieno'])
+        self.assertEqual(sorted(self.names(query='homes')), ['otieno', 'wanjiru'])
+        self.assertEqual(self.names(query='ka'), ['otieno'])
+        self.assertEqual(self.names(query='nobody'), [])
+
+    def test_search_follows_username_changes(self):
+        user = self.karen.user
+        user.username = 'achieng'
+        user.save()
+        self.assertEqual(self.names(query='achieng'), ['achieng'])
+        self.assertEqual(self.names(query='otieno'), [])
+
+    def test_sorts(self):
+        self.assertEqual(self.names(sort='listings')[0], 'agent')
+        self.assertEqual(self.names(sort='newest'), ['otieno', 'wanjiru', 'agent'])
+        self.assertEqual(self.names(sort='experience')[:2], ['wanjiru', 'otieno'])
+        self.assertEqual(self.names(sort='experience', paginate='cursor')[:2], ['wanjiru', 'otieno'])
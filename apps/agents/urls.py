@@ -9,5 +9,7 @@ urlpatterns = [
     path('<int:pk>/', views.agent_detail, name='agent_detail'),
     path('<int:pk>/remove/', views.remove_agent, name='remove_agent'),
     path('dashboard/', views.agent_dashboard, name='agent_dashboard'),
+    path('dashboard/listings/', views.agent_dashboard_listings, name='agent_dashboard_listings'),
+    path('dashboard/inquiries/', views.agent_dashboard_inquiries, name='agent_dashboard_inquiries'),
     path('listings/create/', views.create_listing, name='create_listing'),
 ]
@@ -2,15 +2,16 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.core.paginator import Paginator
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
 from .models import Agent, Rating
 from .filters import AgentFilter
 from apps.inquiries.models import Inquiry
 from .forms import AgentCreationForm
-from django.db import connection
 from . import models
 from apps.listings.forms import ListingForm # New import
 from apps.listings.models import Listing # New import
-from django.db.models import Avg, Q
+from apps.listings.conditional import catalogue_condition
+from apps.listings.pagination import CursorPaginator, InvalidCursor, filter_params, is_cursor_mode, read_cursor
 
 def is_admin_or_staff(user):
     return user.is_superuser or user.is_staff
@@ -37,16 +38,31 @@ def create_agent(request):
     return render(request, 'agents/create_agent.html', {'form': form})
 
 def agent_list(request):
-    agents = Agent.objects.filter(verification_status='verified').order_by('-rating')
-    filter_form = AgentFilter(request.GET, queryset=agents)
+    agents = Agent.objects.directory()
+    cursor_mode = is_cursor_mode(request)
+    if cursor_mode:
+        # The cursor token carries the filters it was created with.
+        cursor, params = read_cursor(request)
+    else:
+        params = request.GET
+    filter_form = AgentFilter(params, queryset=agents)
     agents = filter_form.qs
 
-    paginator = Paginator(agents, 12)  # 12 agents per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if cursor_mode:
+        paginator = CursorPaginator(agents, 12, filter_form.ordering(), filters=params)
+        try:
+            page_obj = paginator.page(cursor)
+        except InvalidCursor:
+            page_obj = paginator.page()
+    else:
+        paginator = Paginator(agents, 12)  # 12 agents per page
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
 
     return render(request, 'agents/agent_list.html', {
         'page_obj': page_obj,
+        'cursor_mode': cursor_mode,
+        'filter_querystring': filter_params(params).urlencode(),
         'filter_form': filter_form,
     })
 
@@ -72,72 +88,81 @@ def create_listing(request):
         form = ListingForm()
     return render(request, 'agents/create_listing.html', {'form': form})
 
+@catalogue_condition('agents', 'listings')
 def agent_detail(request, pk):
     agent = get_object_or_404(Agent.objects.select_related('user__profile'), pk=pk, verification_status='verified')
-    listings = agent.user.listings.filter(status='available')
+    listings = agent.user.listings.filter(status='available').for_cards()
     if request.method == 'POST':
         rating = request.POST.get('rating')
-        comment = request.POST.get('comment')
+        comment = request.POST.get('comment', '')
         if rating:
             Rating.objects.update_or_create(
                 agent=agent,
                 user=request.user,
                 defaults={'rating': rating, 'comment': comment}
             )
-            # Recalculate agent's average rating using the imported Avg function
-            agent.rating = agent.ratings.aggregate(Avg('rating'))['rating__avg']
-            agent.save()
+            # The agent's rating totals are updated in place by signals.py.
             messages.success(request, 'Your rating has been submitted.')
             return redirect('agents:agent_detail', pk=pk)
     return render(request, 'agents/agent_detail.html', {'agent': agent, 'listings': listings})
 
 
+DASHBOARD_LISTINGS_PER_PAGE = 9
+DASHBOARD_INQUIRIES_PER_PAGE = 20
+
+
+def _dashboard_querysets(user):
+    """
+    (agent, listings, inquiries) shown on `user`'s dashboard, or None if they
+    may not see it. Superusers see every listing and inquiry.
+    """
+    if user.is_superuser:
+        return None, Listing.objects.all(), Inquiry.objects.all()
+    if hasattr(user, 'agent') and user.agent.is_active:
+        agent = user.agent
+        return agent, agent.user.listings.all(), Inquiry.objects.filter(listing__agent=agent)
+    return None
+
+
 @login_required
 def agent_dashboard(request):
-    agent = None
-    listings_qs = Listing.objects.none()
-    inquiries_qs = Inquiry.objects.none()
-
-    if request.user.is_superuser:
-        listings_qs = Listing.objects.all()
-        inquiries_qs = Inquiry.objects.all()
-    elif hasattr(request.user, 'agent') and request.user.agent.is_active:
-        agent = request.user.agent
-        # Use prefetch_related for efficiency if you access related models in the template
-        listings_qs = agent.user.listings.all().prefetch_related('inquiries')
-        inquiries_qs = Inquiry.objects.filter(listing__agent=agent)
-    else:
+    querysets = _dashboard_querysets(request.user)
+    if querysets is None:
         messages.error(request, "You do not have permission to view this page.")
-        return redirect('pages:home')
-
-    active_listings_count = listings_qs.filter(status='available').count()
-    new_inquiries_count = inquiries_qs.filter(status='pending').count()
-    
-    # Order inquiries for consistent de-duplication
-    ordered_inquiries = inquiries_qs.order_by('listing', 'user', 'subject', 'message', '-created_at')
-
-    # Use performant DB-level distinct on PostgreSQL, fallback to Python for SQLite
-    if connection.vendor == 'postgresql':
-        inquiries = ordered_inquiries.distinct('listing', 'user', 'subject', 'message')
-    else:
-        # For SQLite and other DBs, de-duplicate in Python.
-        seen_inquiries = set()
-        unique_inquiries = []
-        for inquiry in ordered_inquiries:
-            inquiry_identifier = (inquiry.listing_id, inquiry.user_id, inquiry.subject, inquiry.message)
-            if inquiry_identifier not in seen_inquiries:
-                unique_inquiries.append(inquiry)
-                seen_inquiries.add(inquiry_identifier)
-        inquiries = unique_inquiries
+        return redirect('home')
+    agent, listings_qs, inquiries_qs = querysets
 
+    # Only the counts are rendered here; the listings and inquiries panels
+    # load their pages separately (agent_dashboard_listings/_inquiries).
     return render(request, 'agents/agent_dashboard.html', {
         'agent': agent,
-        'listings': listings_qs,
-        'active_listings_count': active_listings_count,
-        'inquiries': inquiries,
-        'new_inquiries_count': new_inquiries_count
+        'listings_count': listings_qs.count(),
+        'active_listings_count': listings_qs.filter(status='available').count(),
+        'inquiries_count': inquiries_qs.distinct_messages().count(),
+        'new_inquiries_count': inquiries_qs.filter(status='new').count(),
     })
 
+
+@login_required
+def agent_dashboard_listings(request):
+    querysets = _dashboard_querysets(request.user)
+    if querysets is None:
+        raise PermissionDenied
+    listings = querysets[1].for_cards().order_by('-created_at', '-id')
+    page_obj = Paginator(listings, DASHBOARD_LISTINGS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'agents/partials/_dashboard_listings.html', {'page_obj': page_obj})
+
+
+@login_required
+def agent_dashboard_inquiries(request):
+    querysets = _dashboard_querysets(request.user)
+    if querysets is None:
+        raise PermissionDenied
+    # Repeated submissions of the same inquiry are shown once (the newest).
+    inquiries = querysets[2].distinct_messages().select_related('listing', 'user').order_by('-created_at', '-id')
+    page_obj = Paginator(inquiries, DASHBOARD_INQUIRIES_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'agents/partials/_dashboard_inquiries.html', {'page_obj': page_obj})
+
 @user_passes_test(is_admin_or_staff)
 def remove_agent(request, pk):
     agent = get_object_or_404(Agent, pk=pk)
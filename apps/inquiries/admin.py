@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Inquiry
+from .models import Inquiry, OutboundEmail
 
 
 @admin.register(Inquiry)
@@ -21,3 +21,12 @@ class InquiryAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'to_email', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    raw_id_fields = ('inquiry',)
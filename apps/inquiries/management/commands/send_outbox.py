@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.inquiries.models import OutboundEmail
+from apps.inquiries.notifications import deliver_outbound_emails, release_stuck
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends every due inquiry email in the outbox: retries, agent digests and '
+        'anything a crashed worker left behind. Web workers (without a broker) '
+        'or Celery beat run the same sweep every minute; use this to run it by hand.'
+    )
+
+    def handle(self, *args, **options):
+        released = release_stuck()
+        if released:
+            self.stdout.write(f'Requeued {released} emails stuck in sending.')
+        sent = deliver_outbound_emails()
+        pending = OutboundEmail.objects.filter(status='pending').count()
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails; {pending} still pending.'))
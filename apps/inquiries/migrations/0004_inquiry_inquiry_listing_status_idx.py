@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiries', '0003_initial'),
+        ('listings', '0006_listing_listing_public_recent_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['listing', 'status', '-created_at'], name='inquiry_listing_status_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:56
+
+from django.conf import settings
+import hashlib
+
+from django.db import migrations, models
+
+
+def populate_message_digests(apps, schema_editor):
+    Inquiry = apps.get_model('inquiries', 'Inquiry')
+    batch = []
+    for inquiry in Inquiry.objects.only('pk', 'message').iterator(chunk_size=1000):
+        inquiry.message_digest = hashlib.md5(inquiry.message.encode(), usedforsecurity=False).hexdigest()
+        batch.append(inquiry)
+        if len(batch) == 1000:
+            Inquiry.objects.bulk_update(batch, ['message_digest'])
+            batch = []
+    Inquiry.objects.bulk_update(batch, ['message_digest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiries', '0005_outboundemail'),
+        ('listings', '0006_listing_listing_public_recent_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inquiry',
+            name='message_digest',
+            field=models.CharField(blank=True, editable=False, help_text='MD5 of message, set on save', max_length=32),
+        ),
+        migrations.RunPython(populate_message_digests, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['listing', 'user', 'subject', 'message_digest', '-created_at'], name='inquiry_duplicate_idx'),
+        ),
+    ]
@@ -1,10 +1,36 @@
+import hashlib
+
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from apps.listings.models import Listing
 
 User = get_user_model()
 
 
+def message_digest(message):
+    return hashlib.md5(message.encode(), usedforsecurity=False).hexdigest()
+
+
+class InquiryQuerySet(models.QuerySet):
+    def distinct_messages(self):
+        """
+        The newest inquiry of each group of identical ones (same listing, user,
+        subject and message), e.g. from a form submitted twice. Uses
+        ROW_NUMBER() so it runs in the database on every backend and can be
+        paginated; messages are compared by their stored digest.
+        """
+        return self.annotate(
+            duplicate_rank=Window(
+                RowNumber(),
+                partition_by=[F('listing_id'), F('user_id'), F('subject'), F('message_digest')],
+                order_by=[F('created_at').desc(), F('id').desc()],
+            )
+        ).filter(duplicate_rank=1)
+
+
 class Inquiry(models.Model):
     STATUS_CHOICES = (
         ('new', 'New'),
@@ -17,6 +43,7 @@ class Inquiry(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='inquiries')
     subject = models.CharField(max_length=200, blank=True)
     message = models.TextField()
+    message_digest = models.CharField(max_length=32, blank=True, editable=False, help_text='MD5 of message, set on save')
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=20, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new')
@@ -24,13 +51,74 @@ class Inquiry(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     responded_at = models.DateTimeField(null=True, blank=True)
 
+    objects = InquiryQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Inquiry'
         verbose_name_plural = 'Inquiries'
         ordering = ['-created_at']
+        indexes = [
+            # agent_dashboard: an agent's inquiries by status, newest first
+            models.Index(fields=['listing', 'status', '-created_at'], name='inquiry_listing_status_idx'),
+            # distinct_messages(): the ROW_NUMBER() partition
+            models.Index(fields=['listing', 'user', 'subject', 'message_digest', '-created_at'], name='inquiry_duplicate_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.message_digest = message_digest(self.message)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'message' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'message_digest'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Inquiry #{self.id} - {self.subject or 'General Inquiry'} from {self.user.email}"
 
     def get_contact_info(self):
         return self.email or self.user.email
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox row for an email sent about an inquiry.
+
+    Views only insert these rows; delivery happens after the request's
+    transaction commits, on a Celery worker or a local thread pool (see
+    apps/inquiries/notifications.py). Failed sends are retried with
+    exponential backoff by the `send_outbox` command / periodic task.
+    """
+    KIND_CHOICES = (
+        ('customer_confirmation', 'Customer confirmation'),
+        ('agent_notification', 'Agent notification'),
+        ('inquiry_response', 'Inquiry response'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    inquiry = models.ForeignKey(Inquiry, on_delete=models.SET_NULL, null=True, blank=True, related_name='outbound_emails')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    to_email = models.EmailField()
+    reply_to = models.EmailField(blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Outbound Email'
+        verbose_name_plural = 'Outbound Emails'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.to_email} ({self.status})"
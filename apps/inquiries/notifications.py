@@ -0,0 +1,264 @@
+"""
+Outbound email pipeline for inquiries.
+
+Views call `queue_inquiry_created` / `queue_inquiry_response`, which only
+insert OutboundEmail rows and schedule delivery for when the surrounding
+transaction commits. Delivery (`deliver_outbound_emails`) runs on a Celery
+worker or the local background thread pool (ikr_project.celery.enqueue) and
+reuses SMTP connections from a bounded pool.
+
+Agent notifications can be batched: with INQUIRY_AGENT_DIGEST_SECONDS > 0
+they are held for that long, and every notification due for the same agent
+goes out as a single digest email.
+
+Failed sends are retried with exponential backoff; the periodic
+`send_outbox_task` (on Celery beat, or on each web worker without a broker,
+see ikr_project/celery.py) or the `send_outbox` command picks up anything
+that is due.
+"""
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 60
+
+
+class SMTPConnectionPool:
+    """
+    At most `size` open email backend connections per process, reused across
+    messages instead of a new SMTP handshake per email.
+    """
+
+    def __init__(self, size):
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = get_connection(fail_silently=False)
+            try:
+                conn.open()  # No-op if it is still open from the last use.
+                yield conn
+            except Exception:
+                conn.close()
+                raise
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPConnectionPool(getattr(settings, 'EMAIL_CONNECTION_POOL_SIZE', 2))
+    return _pool
+
+
+def _schedule_delivery(ids):
+    from ikr_project.celery import enqueue
+    from .tasks import deliver_outbound_emails_task
+
+    transaction.on_commit(lambda: enqueue(deliver_outbound_emails_task, ids))
+
+
+def queue_inquiry_created(inquiry, request_user):
+    """Queue the customer confirmation and the agent notification for a new inquiry."""
+    listing = inquiry.listing
+    emails = [
+        OutboundEmail(
+            inquiry=inquiry,
+            kind='customer_confirmation',
+            to_email=request_user.email,
+            subject=f'Inquiry Sent for {listing.title}',
+            body=f'''
+            Dear {request_user.get_full_name()},
+
+            Your inquiry for "{listing.title}" has been sent successfully.
+
+            Subject: {inquiry.subject}
+            Message: {inquiry.message}
+
+            The agent will respond to you soon.
+
+            Best regards,
+            Your Real Estate Team
+            ''',
+        ),
+    ]
+    if listing.agent_id:
+        digest_delay = getattr(settings, 'INQUIRY_AGENT_DIGEST_SECONDS', 0)
+        emails.append(OutboundEmail(
+            inquiry=inquiry,
+            kind='agent_notification',
+            to_email=listing.agent.user.email,
+            reply_to=request_user.email,
+            subject=f'New Inquiry for {listing.title}',
+            body=f'''
+            You have received a new inquiry for your listing "{listing.title}".
+
+            From: {request_user.email}
+            Subject: {inquiry.subject}
+            Message: {inquiry.message}
+
+            Please log in to your dashboard to respond.
+            ''',
+            next_attempt_at=timezone.now() + timedelta(seconds=digest_delay),
+        ))
+    emails = OutboundEmail.objects.bulk_create(emails)
+    _schedule_delivery([email.pk for email in emails])
+    return emails
+
+
+def queue_inquiry_response(inquiry, response):
+    """Queue the email carrying an agent's response to the inquirer."""
+    email = OutboundEmail.objects.create(
+        inquiry=inquiry,
+        kind='inquiry_response',
+        to_email=inquiry.user.email,
+        subject=f'Response to your inquiry for {inquiry.listing.title}',
+        body=f'''
+        Dear {inquiry.user.get_full_name()},
+
+        You have received a response to your inquiry for "{inquiry.listing.title}".
+
+        Your message: {inquiry.message}
+
+        Agent's response: {response}
+
+        Best regards,
+        {inquiry.listing.agent.get_full_name()}
+        ''',
+    )
+    _schedule_delivery([email.pk])
+    return email
+
+
+def _claim_due(ids=None, now=None):
+    """Mark due pending emails as 'sending' and return them, so no other worker sends them too."""
+    now = now or timezone.now()
+    with transaction.atomic():
+        due = OutboundEmail.objects.select_for_update(skip_locked=True).filter(
+            status='pending', next_attempt_at__lte=now,
+        )
+        if ids is not None:
+            due = due.filter(pk__in=ids)
+        claimed = list(due.order_by('to_email', 'created_at'))
+        # next_attempt_at doubles as the claim time, for release_stuck().
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in claimed]).update(
+            status='sending', next_attempt_at=now,
+        )
+    return claimed
+
+
+def _digest(emails):
+    """Combine several agent notifications for one recipient into a single message."""
+    sections = '\n'.join(
+        f'{i}. {email.subject}\n{email.body}' for i, email in enumerate(emails, start=1)
+    )
+    return EmailMessage(
+        f'{len(emails)} new inquiries for your listings',
+        f'You have received {len(emails)} new inquiries.\n\n{sections}',
+        settings.DEFAULT_FROM_EMAIL,
+        [emails[0].to_email],
+    )
+
+
+def _message(email):
+    return EmailMessage(
+        email.subject,
+        email.body,
+        settings.DEFAULT_FROM_EMAIL,
+        [email.to_email],
+        reply_to=[email.reply_to] if email.reply_to else None,
+    )
+
+
+def _batches(emails):
+    """Yield (message, emails) pairs; agent notifications to one recipient share a message."""
+    for (kind, to_email), group in groupby(emails, key=lambda email: (email.kind, email.to_email)):
+        group = list(group)
+        if kind == 'agent_notification' and len(group) > 1:
+            yield _digest(group), group
+        else:
+            for email in group:
+                yield _message(email), [email]
+
+
+def _mark_failed(emails, error):
+    for email in emails:
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= MAX_ATTEMPTS:
+            email.status = 'failed'
+        else:
+            email.status = 'pending'
+            email.next_attempt_at = timezone.now() + timedelta(
+                seconds=RETRY_BASE_SECONDS * 2 ** (email.attempts - 1)
+            )
+    OutboundEmail.objects.bulk_update(emails, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_outbound_emails(ids=None):
+    """
+    Send every due pending email (or only those in `ids`). Returns the number
+    of emails sent; failures are rescheduled with exponential backoff.
+    """
+    emails = sorted(_claim_due(ids), key=lambda email: (email.kind, email.to_email, email.created_at))
+    if not emails:
+        return 0
+
+    sent = 0
+    unsent = {email.pk: email for email in emails}
+    try:
+        with get_pool().connection() as connection:
+            for message, batch in _batches(emails):
+                message.connection = connection
+                try:
+                    message.send()
+                except Exception as exc:
+                    logger.warning('Sending %s to %s failed: %s', message.subject, message.to, exc)
+                    _mark_failed(batch, exc)
+                else:
+                    OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                        status='sent', sent_at=timezone.now(), attempts=batch[0].attempts + 1,
+                    )
+                    sent += len(batch)
+                for email in batch:
+                    del unsent[email.pk]
+    except Exception as exc:
+        # Connecting failed: reschedule the claimed emails rather than leave
+        # them in 'sending' until release_stuck().
+        logger.warning('Sending %d emails failed: %s', len(unsent), exc)
+        _mark_failed(list(unsent.values()), exc)
+    return sent
+
+
+def release_stuck(older_than=timedelta(minutes=15)):
+    """Return emails left in 'sending' by a crashed worker to the queue."""
+    return OutboundEmail.objects.filter(
+        status='sending', next_attempt_at__lte=timezone.now() - older_than,
+    ).update(status='pending')
@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from .notifications import deliver_outbound_emails, release_stuck
+
+
+@shared_task(name='inquiries.deliver_outbound_emails')
+def deliver_outbound_emails_task(ids=None):
+    return deliver_outbound_emails(ids)
+
+
+@shared_task(name='inquiries.send_outbox')
+def send_outbox_task():
+    """Periodic sweep: retries, digests that have become due, and stuck rows."""
+    release_stuck()
+    return deliver_outbound_emails()
@@ -0,0 +1,181 @@
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.listings.tests import create_catalogue
+from ikr_project.celery import _run_local_beat, start_local_beat
+from .models import Inquiry, OutboundEmail
+from .notifications import MAX_ATTEMPTS, deliver_outbound_emails
+from .tasks import send_outbox_task
+
+User = get_user_model()
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class InquiryEmailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=2, images_per_listing=0)
+        cls.customer = User.objects.create_user(
+            email='customer@example.com', username='customer', password='password',
+        )
+
+    def send_inquiry(self, listing):
+        self.client.force_login(self.customer)
+        return self.client.post(
+            reverse('inquiry_create', args=[listing.slug]),
+            {'subject': 'Viewing', 'message': 'Can I view it on Saturday?'},
+        )
+
+    def test_inquiry_queues_emails_instead_of_sending(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.send_inquiry(self.listings[0])
+        self.assertRedirects(response, reverse('listing_detail', args=[self.listings[0].slug]),
+                             fetch_redirect_response=False)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('kind', 'to_email')),
+            [('agent_notification', 'agent@example.com'), ('customer_confirmation', 'customer@example.com')],
+        )
+
+        self.assertEqual(deliver_outbound_emails(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(OutboundEmail.objects.exclude(status='sent').exists())
+        agent_email = next(email for email in mail.outbox if email.to == ['agent@example.com'])
+        self.assertEqual(agent_email.reply_to, ['customer@example.com'])
+
+    def test_agent_notifications_are_sent_as_a_digest(self):
+        for listing in self.listings:
+            self.send_inquiry(listing)
+        self.assertEqual(deliver_outbound_emails(), 4)
+        agent_emails = [email for email in mail.outbox if email.to == ['agent@example.com']]
+        self.assertEqual(len(agent_emails), 1)
+        self.assertEqual(agent_emails[0].subject, '2 new inquiries for your listings')
+
+    @override_settings(INQUIRY_AGENT_DIGEST_SECONDS=300)
+    def test_digest_window_holds_agent_notifications(self):
+        self.send_inquiry(self.listings[0])
+        self.assertEqual(deliver_outbound_emails(), 1)
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+        self.assertTrue(OutboundEmail.objects.filter(kind='agent_notification', status='pending').exists())
+
+    def test_failed_send_is_retried_with_backoff(self):
+        self.send_inquiry(self.listings[0])
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('connection refused')), \
+                self.assertLogs('apps.inquiries.notifications', 'WARNING'):
+            self.assertEqual(deliver_outbound_emails(), 0)
+        email = OutboundEmail.objects.first()
+        self.assertEqual(email.status, 'pending')
+        self.assertEqual(email.attempts, 1)
+        self.assertEqual(email.last_error, 'connection refused')
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # Not due yet, so nothing is sent until the backoff has passed.
+        self.assertEqual(deliver_outbound_emails(), 0)
+        OutboundEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(deliver_outbound_emails(), 2)
+
+    def test_connection_failure_reschedules_claimed_emails(self):
+        self.send_inquiry(self.listings[0])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('no route to host')), \
+                self.assertLogs('apps.inquiries.notifications', 'WARNING'):
+            self.assertEqual(deliver_outbound_emails(), 0)
+        self.assertEqual(
+            list(OutboundEmail.objects.order_by().values_list('status', 'attempts', 'last_error').distinct()),
+            [('pending', 1, 'no route to host')],
+        )
+
+    def test_outbox_is_swept_without_a_broker(self):
+        stop = threading.Event()
+        self.addCleanup(stop.set)
+        with mock.patch('ikr_project.celery._local_executor') as executor:
+            thread = threading.Thread(target=_run_local_beat, args=([(send_outbox_task, 0.01)], stop))
+            thread.start()
+            time.sleep(0.05)
+            stop.set()
+            thread.join()
+        self.assertEqual(executor().submit.call_args.args[1:], (send_outbox_task, (), {}))
+        self.assertGreater(executor().submit.call_count, 1)
+
+    @override_settings(CELERY_BROKER_URL='redis://localhost:6379/0')
+    def test_local_beat_is_not_started_with_a_broker(self):
+        self.assertIsNone(start_local_beat())
+
+    def test_gives_up_after_max_attempts(self):
+        self.send_inquiry(self.listings[0])
+        OutboundEmail.objects.update(attempts=MAX_ATTEMPTS - 1)
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('connection refused')), \
+                self.assertLogs('apps.inquiries.notifications', 'WARNING'):
+            deliver_outbound_emails()
+        self.assertEqual(OutboundEmail.objects.filter(status='failed').count(), 2)
+
+    def test_agent_response_is_queued(self):
+        inquiry = Inquiry.objects.create(user=self.customer, listing=self.listings[0], message='Hello')
+        self.client.force_login(self.agent.user)
+        response = self.client.post(reverse('inquiry_respond', args=[inquiry.pk]), {'response': 'Sure'})
+        self.assertEqual(response.status_code, 302)
+        inquiry.refresh_from_db()
+        self.assertEqual(inquiry.status, 'responded')
+        self.assertEqual(len(mail.outbox), 0)
+
+        deliver_outbound_emails()
+        self.assertEqual(mail.outbox[0].to, ['customer@example.com'])
+        self.assertIn('Sure', mail.outbox[0].body)
+
+    def test_only_the_listing_agent_can_respond(self):
+        inquiry = Inquiry.objects.create(user=self.customer, listing=self.listings[0], message='Hello')
+        self.client.force_login(self.customer)
+        response = self.client.post(reverse('inquiry_respond', args=[inquiry.pk]), {'response': 'Sure'})
+        self.assertEqual(response.status_code, 404)
+
+
+class DashboardInquiryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=2, images_per_listing=0)
+        cls.customer = User.objects.create_user(
+            email='customer@example.com', username='customer', password='password',
+        )
+        for listing in cls.listings:
+            for _ in range(3):  # the same form submitted three times
+                Inquiry.objects.create(user=cls.customer, listing=listing, subject='Viewing', message='Saturday?')
+        Inquiry.objects.create(user=cls.customer, listing=cls.listings[0], subject='Viewing', message='Sunday?')
+
+    def test_message_digest_is_stored(self):
+        inquiry = Inquiry.objects.filter(message='Saturday?').first()
+        self.assertEqual(len(inquiry.message_digest), 32)
+        inquiry.message = 'Sunday?'
+        inquiry.save(update_fields=['message'])
+        inquiry.refresh_from_db()
+        self.assertEqual(
+            inquiry.message_digest,
+            Inquiry.objects.filter(message='Sunday?').exclude(pk=inquiry.pk).get().message_digest,
+        )
+
+    def test_distinct_messages_keeps_newest_of_each_group(self):
+        distinct = Inquiry.objects.distinct_messages()
+        self.assertEqual(distinct.count(), 3)
+        newest = Inquiry.objects.filter(listing=self.listings[1]).order_by('-created_at', '-id').first()
+        self.assertIn(newest, list(distinct))
+
+    def test_dashboard_inquiries_panel_is_paginated(self):
+        self.client.force_login(self.agent.user)
+        response = self.client.get(reverse('agents:agent_dashboard_inquiries'))
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertEqual(response.context['page_obj'].paginator.count, 3)
+        dashboard = self.client.get(reverse('agents:agent_dashboard'))
+        self.assertEqual(dashboard.context['inquiries_count'], 3)
+        self.assertEqual(dashboard.context['new_inquiries_count'], 7)
+
+    def test_panels_require_an_agent(self):
+        self.client.force_login(self.customer)
+        response = self.client.get(reverse('agents:agent_dashboard_inquiries'))
+        self.assertEqual(response.status_code, 403)
@@ -68,10 +68,10 @@ class PropertyTypeAdmin(SuperuserOnlyAdminMixin, admin.ModelAdmin):
 
 @admin.register(ListingImage)
 class ListingImageAdmin(SuperuserOnlyAdminMixin, admin.ModelAdmin):
-    list_display = ('listing', 'is_main', 'created_at')
-    list_filter = ('is_main', 'created_at')
+    list_display = ('listing', 'is_main', 'status', 'created_at')
+    list_filter = ('is_main', 'status', 'created_at')
     search_fields = ('listing__title', 'alt_text')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('error', 'created_at')
 
 
 class AgentModelChoiceField(forms.ModelChoiceField):
@@ -0,0 +1,97 @@
+"""
+BlurHash encoding (https://blurha.sh), for image placeholders.
+
+A small pure-Python port of the reference encoder. It is meant to run on a
+thumbnail (images.py shrinks images to 32px first), where it takes a few
+milliseconds.
+"""
+import math
+
+CHARACTERS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _encode83(value, length):
+    return ''.join(
+        CHARACTERS[(value // 83 ** (length - i - 1)) % 83] for i in range(length)
+    )
+
+
+def _decode83(text):
+    value = 0
+    for char in text:
+        value = value * 83 + CHARACTERS.index(char)
+    return value
+
+
+def _srgb_to_linear(value):
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode(image, x_components=4, y_components=3):
+    """Return the BlurHash of a Pillow image."""
+    image = image.convert('RGB')
+    width, height = image.size
+    pixels = [tuple(_srgb_to_linear(c) for c in pixel) for pixel in image.getdata()]
+
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                basis_y = cos_y[j][y]
+                for x in range(width):
+                    basis = cos_x[i][x] * basis_y
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(value) for factor in ac for value in factor)
+        quantised_max = max(0, min(82, int(math.floor(actual_max * 166 - 0.5))))
+        maximum = (quantised_max + 1) / 166
+        result += _encode83(quantised_max, 1)
+    else:
+        maximum = 1
+        result += _encode83(0, 1)
+
+    result += _encode83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+    for factor in ac:
+        r, g, b = (
+            max(0, min(18, int(math.floor(_sign_pow(value / maximum, 0.5) * 9 + 9.5))))
+            for value in factor
+        )
+        result += _encode83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+
+def average_color(blurhash):
+    """The hash's average colour as '#rrggbb' (its DC component), or '' if invalid."""
+    if len(blurhash) < 6:
+        return ''
+    try:
+        return f'#{_decode83(blurhash[2:6]):06x}'
+    except ValueError:
+        return ''
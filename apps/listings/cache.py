@@ -0,0 +1,170 @@
+"""
+Versioned caching for catalogue pages.
+
+Cached entries never get deleted directly. Each entry is stored under a key
+that embeds the current version token of every namespace it depends on, and
+signal handlers (see signals.py) replace those tokens when the underlying
+rows change. Stale entries are simply never read again and age out of the
+cache on their own.
+
+Namespaces in use:
+
+- ``listings``: anything shown on listing cards (list page, home page,
+  related listings).
+- ``listing:<slug>``: a single listing detail page.
+- ``categories``: the category lists on the home and list pages.
+- ``agents``: the featured agents on the home page.
+"""
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.paginator import Page, Paginator
+
+from ikr_project.routers import reading_from_replica
+
+KEY_PREFIX = 'catalogue'
+VERSION_TIMEOUT = None  # Version tokens never expire on their own.
+
+
+def _timeout():
+    timeout = getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 60 * 15)
+    if reading_from_replica():
+        # The replica may lag the primary; don't keep what it returned for long.
+        return min(timeout, getattr(settings, 'REPLICA_CACHE_TIMEOUT', 60))
+    return timeout
+
+
+def _version(namespaces):
+    version = '.'.join(get_versions(*namespaces))
+    # Pages built from a (possibly lagging) replica are kept apart, so requests
+    # reading from the primary never get them.
+    return f'{version}.replica' if reading_from_replica() else version
+
+
+def _version_key(namespace):
+    return f'{KEY_PREFIX}:version:{namespace}'
+
+
+def _new_token():
+    # When it was made (milliseconds since the epoch, in hex), for version_time().
+    return f'{time.time_ns() // 1_000_000:x}-{uuid.uuid4().hex[:6]}'
+
+
+def version_time(token):
+    """When a version token was made (an aware datetime), or None for tokens that don't say."""
+    made, separator, _ = token.partition('-')
+    if not separator:
+        return None
+    try:
+        return datetime.fromtimestamp(int(made, 16) / 1000, tz=timezone.utc)
+    except ValueError:
+        return None
+
+
+def get_versions(*namespaces):
+    """Return the current version token for each namespace, in order."""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            # Never set, or evicted: start a fresh token so nothing cached under
+            # an older one can be served again.
+            cache.add(key, _new_token(), VERSION_TIMEOUT)
+            version = cache.get(key)
+        versions.append(version)
+    return versions
+
+
+def versions_shared():
+    """
+    Whether every process sees the same version tokens. With a local-memory
+    (or dummy) default cache each process has its own, and a bump made by
+    another web worker, a background task or a management command never
+    reaches this one; its cached entries still expire with the timeout, but
+    anything that trusts the tokens alone must not.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def bump_versions(*namespaces):
+    """Invalidate everything cached under the given namespaces."""
+    if namespaces:
+        cache.set_many(
+            {_version_key(namespace): _new_token() for namespace in namespaces},
+            VERSION_TIMEOUT,
+        )
+
+
+def listing_namespace(slug):
+    return f'listing:{slug}'
+
+
+def cache_key(name, namespaces, params=None):
+    """
+    Build a cache key for `name` that changes whenever any of `namespaces` is
+    bumped. `params` (e.g. request.GET) is folded in so each filter/page
+    combination gets its own entry.
+    """
+    return f'{KEY_PREFIX}:{name}:{_version(namespaces)}:{_params_digest(params)}'
+
+
+def _params_digest(params):
+    if not params:
+        return ''
+    if hasattr(params, 'lists'):  # QueryDict: keep repeated keys
+        items = [(key, value) for key, values in params.lists() for value in values]
+    else:
+        items = list(params.items())
+    items = sorted((str(key), str(value)) for key, value in items)
+    return hashlib.md5(repr(items).encode(), usedforsecurity=False).hexdigest()
+
+
+def get_or_set(name, namespaces, builder, params=None, timeout=None):
+    """Return the cached value for `name`, calling `builder()` on a miss."""
+    key = cache_key(name, namespaces, params)
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        cache.set(key, value, _timeout() if timeout is None else timeout)
+    return value
+
+
+def template_cache_context(*namespaces):
+    """Context for `{% cache cache_timeout <name> cache_version ... %}` fragments."""
+    return {
+        'cache_timeout': _timeout(),
+        'cache_version': _version(namespaces),
+    }
+
+
+def cached_page(name, namespaces, queryset, per_page, page_number, params=None):
+    """
+    Paginate `queryset` and cache the resulting page.
+
+    `queryset` may be a callable returning the queryset, so that filtering
+    only happens on a cache miss. Only the evaluated objects and the total
+    count are cached (pickling the Paginator would pickle, and therefore
+    evaluate, the whole queryset). The returned Page behaves like the one
+    Paginator.get_page() would return.
+    """
+    def build():
+        paginator = Paginator(queryset() if callable(queryset) else queryset, per_page)
+        page = paginator.get_page(page_number)
+        return {
+            'object_list': list(page.object_list),
+            'number': page.number,
+            'count': paginator.count,
+        }
+
+    data = get_or_set(name, namespaces, build, params=params)
+    paginator = Paginator([], per_page)
+    paginator.count = data['count']
+    return Page(data['object_list'], data['number'], paginator)
@@ -0,0 +1,160 @@
+"""
+Listing card summaries.
+
+A listing card shows fields of the listing, its main image, location,
+category and agent (and the agent's user). ListingCard stores all of it in
+one row per listing, so the home page, listing list, search results and
+related listings read their cards with a single-table query instead of
+joining five tables and prefetching images.
+
+Cards are kept in sync by signals on every model they copy from (see
+signals.py) and by the image pipeline's queryset updates (images.py);
+`update_cards` rebuilds them in bulk (the rebuild_listing_cards command).
+
+`card_fields` only reads model fields, so the migration that creates the
+table uses it with historical models too.
+"""
+from django.db import models
+
+from .blurhash import average_color
+
+CARD_FIELDS = (
+    'title', 'slug', 'price', 'bedrooms', 'bathrooms', 'square_feet', 'image', 'image_color',
+    'location_label', 'category_name', 'agent_name', 'status', 'is_published', 'is_active',
+    'is_featured', 'created_at',
+)
+
+
+def location_label(location):
+    return f'{location.name}, {location.city}, {location.state}'
+
+
+def agent_name(agent):
+    # What Agent.get_full_name() shows.
+    return agent.user.username
+
+
+def card_image(image):
+    """(card rendition, placeholder colour) of a ListingImage; see ListingImage.rendition()."""
+    rendition = image.renditions.get('card')
+    if rendition is None:
+        try:
+            url = image.image.url if image.image else ''
+        except (AttributeError, ValueError, FileNotFoundError):
+            url = ''
+        rendition = {'src': url, 'srcset': ''} if url else {}
+    return rendition, average_color(image.blurhash) if image.blurhash else ''
+
+
+def card_fields(listing, main_image):
+    """ListingCard field values for `listing`, whose main image is `main_image` (or None)."""
+    image, image_color = card_image(main_image) if main_image is not None else ({}, '')
+    return {
+        'title': listing.title,
+        'slug': listing.slug,
+        'price': listing.price,
+        'bedrooms': listing.bedrooms,
+        'bathrooms': listing.bathrooms,
+        'square_feet': listing.square_feet,
+        'image': image,
+        'image_color': image_color,
+        'location_label': location_label(listing.location) if listing.location_id else '',
+        'category_name': listing.category.name if listing.category_id else '',
+        'agent_name': agent_name(listing.agent) if listing.agent_id else '',
+        'status': listing.status,
+        'is_published': listing.is_published,
+        'is_active': listing.is_active,
+        'is_featured': listing.is_featured,
+        'created_at': listing.created_at,
+    }
+
+
+def main_images_prefetch(image_model):
+    return models.Prefetch(
+        'images',
+        queryset=image_model.objects.filter(is_main=True, status='ready').order_by('pk'),
+        to_attr='main_images',
+    )
+
+
+def update_cards(queryset, batch_size=500):
+    """Create or refresh the cards of every listing in `queryset`. Returns the number of cards."""
+    from .models import ListingCard, ListingImage
+
+    queryset = queryset.select_related('location', 'category', 'agent__user').prefetch_related(
+        main_images_prefetch(ListingImage),
+    ).order_by('pk')
+    batch = []
+    count = 0
+    for listing in queryset.iterator(chunk_size=batch_size):
+        main_image = listing.main_images[0] if listing.main_images else None
+        batch.append(ListingCard(listing=listing, **card_fields(listing, main_image)))
+        if len(batch) >= batch_size:
+            count += _upsert_cards(batch)
+            batch = []
+    if batch:
+        count += _upsert_cards(batch)
+    return count
+
+
+def _upsert_cards(cards):
+    from .models import ListingCard
+
+    ListingCard.objects.bulk_create(
+        cards,
+        update_conflicts=True,
+        unique_fields=['listing'],
+        update_fields=[*CARD_FIELDS, 'updated_at'],
+    )
+    return len(cards)
+
+
+def refresh_cards(listing_ids):
+    """Bring the cards of the listings in `listing_ids` up to date."""
+    from .models import Listing
+
+    listing_ids = list(listing_ids)
+    if listing_ids:
+        update_cards(Listing.objects.filter(pk__in=listing_ids))
+
+
+def as_cards(listings):
+    """
+    The cards of `listings` (listings or listing ids) in the same order,
+    with their `distance_km` annotations if they have one.
+    """
+    from .models import ListingCard
+
+    listings = list(listings)
+    ids = [getattr(listing, 'pk', listing) for listing in listings]
+    cards = ListingCard.objects.in_bulk(ids)
+    result = []
+    for listing, pk in zip(listings, ids):
+        card = cards.get(pk)
+        if card is None:
+            continue
+        if getattr(listing, 'distance_km', None) is not None:
+            card.distance_km = listing.distance_km
+        result.append(card)
+    return result
+
+
+class CardList:
+    """
+    The cards of the listings in `queryset`: a Paginator over it counts the
+    listings and loads one page of listing ids and then that page's cards.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        return as_cards(self.queryset.only('pk')[index])
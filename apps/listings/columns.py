@@ -0,0 +1,216 @@
+"""
+In-memory column store of the published catalogue.
+
+With LISTING_COLUMN_STORE enabled, listing_list evaluates its filters against
+NumPy arrays holding one column per filterable field of every published,
+available listing, and only goes to the database for the page it renders
+(one `in_bulk` query). Each process keeps its own snapshot and rebuilds it
+when the ``listings`` catalogue cache version changes, which the listing
+signal handlers and the importer bump on every change (see cache.py). With a
+cache that isn't shared between processes, bumps made elsewhere never
+arrive, so snapshots are also rebuilt once they are
+LISTING_COLUMN_STORE_MAX_AGE seconds old.
+
+Filters the snapshot cannot answer (full-text search) return None so the
+caller falls back to the ORM.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache import get_versions, versions_shared
+from .facets import PRICE_BANDS
+from .geo import haversine_km_array, parse_bbox
+
+# Filters evaluated here; anything else set in the filter form means the ORM.
+SUPPORTED_FILTERS = {
+    'min_price', 'max_price', 'lat', 'lng', 'radius', 'bbox',
+    'category', 'property_type', 'city', 'price_band', 'bedrooms',
+}
+NONE_ID = -1
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class ListingColumns:
+    """One array per column, all in the same row order."""
+
+    def __init__(self, rows, version=None):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        (ids, price, bedrooms, bathrooms, square_feet, category, property_type,
+         location, city, latitude, longitude, created_at, featured) = zip(*rows) if rows else ((),) * 13
+        self.ids = np.array(ids, dtype=np.int64)
+        self.price = _floats(price)
+        self.bedrooms = _floats(bedrooms)
+        self.bathrooms = _floats(bathrooms)
+        self.square_feet = _floats(square_feet)
+        self.category = _ids(category)
+        self.property_type = _ids(property_type)
+        self.location = _ids(location)
+        self.city_codes = {}
+        for name in city:
+            if name:
+                self.city_codes.setdefault(name.casefold(), len(self.city_codes))
+        self.city = np.array(
+            [self.city_codes[name.casefold()] if name else NONE_ID for name in city], dtype=np.int64,
+        )
+        self.latitude = _floats(latitude)
+        self.longitude = _floats(longitude)
+        # Microseconds since the epoch, so ties sort exactly like the database.
+        self.created_at = np.array(
+            [(value - EPOCH) // timedelta(microseconds=1) for value in created_at], dtype=np.int64,
+        )
+        self.featured = np.array(featured, dtype=bool)
+
+    @classmethod
+    def load(cls, version=None):
+        from .models import Listing
+
+        # Always from the primary: a snapshot lives until the next catalogue
+        # change, so one loaded from a lagging replica would stay stale.
+        rows = Listing.objects.using(DEFAULT_DB_ALIAS).published().values_list(
+            'pk', 'price', 'bedrooms', 'bathrooms', 'square_feet', 'category_id',
+            'property_type_obj_id', 'location_id', 'location__city', 'location__latitude',
+            'location__longitude', 'created_at', 'is_featured',
+        ).order_by()
+        return cls(list(rows), version)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def filter(self, data):
+        """
+        (ids, distances) matching the cleaned ListingFilter `data`, ordered
+        like the ORM path: nearest first for radius searches, else newest
+        first. `distances` is {id: km} for radius searches, else None. Returns
+        None when `data` uses a filter the snapshot cannot evaluate.
+        """
+        data = {name: value for name, value in data.items() if value not in (None, '')}
+        if set(data) - SUPPORTED_FILTERS:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        if 'min_price' in data:
+            mask &= self.price >= float(data['min_price'])
+        if 'max_price' in data:
+            mask &= self.price <= float(data['max_price'])
+        if 'category' in data:
+            mask &= self.category == data['category'].pk
+        if 'property_type' in data:
+            mask &= self.property_type == data['property_type'].pk
+        if 'city' in data:
+            mask &= self.city == self.city_codes.get(data['city'].casefold(), NONE_ID - 1)
+        if 'price_band' in data:
+            for band, _, minimum, maximum in PRICE_BANDS:
+                if band == data['price_band']:
+                    if minimum is not None:
+                        mask &= self.price >= minimum
+                    if maximum is not None:
+                        mask &= self.price < maximum
+        if 'bedrooms' in data:
+            mask &= self.bedrooms >= int(data['bedrooms'])
+        if 'bbox' in data:
+            box = parse_bbox(data['bbox'])
+            if box is None:
+                return [], None
+            south, west, north, east = box
+            mask &= (self.latitude >= south) & (self.latitude <= north)
+            if west <= east:
+                mask &= (self.longitude >= west) & (self.longitude <= east)
+            else:
+                mask &= (self.longitude >= west) | (self.longitude <= east)
+
+        if all(name in data for name in ('lat', 'lng', 'radius')):
+            distance = self._distances(float(data['lat']), float(data['lng']))
+            mask &= distance <= float(data['radius'])
+            rows = np.flatnonzero(mask)
+            # lexsort sorts by its last key first.
+            order = rows[np.lexsort((-self.ids[rows], -self.created_at[rows], distance[rows]))]
+            return self.ids[order].tolist(), dict(zip(self.ids[order].tolist(), distance[order].tolist()))
+
+        rows = np.flatnonzero(mask)
+        order = rows[np.lexsort((-self.ids[rows], -self.created_at[rows]))]
+        return self.ids[order].tolist(), None
+
+    def _distances(self, latitude, longitude):
+        """Haversine distance in km from a point to every row (NaN without coordinates)."""
+        return haversine_km_array(latitude, longitude, self.latitude, self.longitude)
+
+
+def _floats(values):
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+
+def _ids(values):
+    return np.array([NONE_ID if value is None else value for value in values], dtype=np.int64)
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _is_stale(snapshot, version):
+    if snapshot is None or snapshot.version != version:
+        return True
+    max_age = getattr(settings, 'LISTING_COLUMN_STORE_MAX_AGE', 60)
+    return not versions_shared() and time.monotonic() - snapshot.loaded_at >= max_age
+
+
+def get_snapshot():
+    """This process's snapshot, rebuilt first if the catalogue changed since it was loaded."""
+    global _snapshot
+    version = get_versions('listings')[0]
+    snapshot = _snapshot
+    if _is_stale(snapshot, version):
+        with _lock:
+            if _is_stale(_snapshot, version):
+                _snapshot = ListingColumns.load(version)
+            snapshot = _snapshot
+    return snapshot
+
+
+class ListingIdList:
+    """
+    A sequence of listing ids that loads listings from `queryset` only for
+    the slices taken from it, so a Paginator over it fetches one page with a
+    single query.
+    """
+
+    def __init__(self, ids, queryset, distances=None):
+        self.ids = ids
+        self.queryset = queryset
+        self.distances = distances
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids[index]
+        listings = self.queryset.in_bulk(ids)
+        page = [listings[pk] for pk in ids if pk in listings]
+        if self.distances is not None:
+            for listing in page:
+                listing.distance_km = self.distances[listing.pk]
+        return page
+
+
+def filtered_listings(filterset, queryset):
+    """
+    The filterset's results as a ListingIdList over `queryset`, or None if
+    the snapshot cannot evaluate its filters (use `filterset.qs` instead).
+    """
+    if not filterset.is_valid():
+        return None
+    result = get_snapshot().filter(filterset.form.cleaned_data)
+    if result is None:
+        return None
+    ids, distances = result
+    return ListingIdList(ids, queryset, distances)
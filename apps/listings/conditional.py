@@ -0,0 +1,86 @@
+"""
+Conditional GET for catalogue pages.
+
+`catalogue_condition` wraps a view in Django's `condition` decorator with
+validators made from the version tokens of the catalogue cache namespaces the
+page shows (see cache.py): the ETag is a digest of the tokens, and
+Last-Modified is when the newest of them was made. Any change that would
+invalidate the page's cache entries changes them too, and checking them costs
+a cache lookup, so a 304 is answered without querying catalogue tables or
+rendering templates.
+
+Besides the catalogue, pages depend on:
+
+- the templates and static files, through fragments.templates_digest();
+- who is signed in: the navbar, the inquiry and rating forms and the admin
+  actions. Signed-in users' ETags include their id, their staff and
+  superuser flags, the ``agents`` namespace (agent status) and the CSRF
+  cookie the forms' tokens are made from. Last-Modified can't tell users
+  apart, so only anonymous pages get one;
+- pending messages, which are shown once: pages with any get no validators
+  (edge-cached shells load them separately, see ikr_project/edge.py).
+
+Pages read from a replica (see ikr_project/routers.py) may be behind the
+primary; their ETags change every REPLICA_CACHE_TIMEOUT seconds, the longest
+a page built from a replica is cached, and they get no Last-Modified.
+
+The tokens only say a page is unchanged if every process bumps the same
+ones, so pages get no validators unless the default cache is shared (Redis,
+see REDIS_URL): with the local-memory cache, changes made by other workers,
+background tasks and management commands would never show.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.views.decorators.http import condition
+
+from apps.pages.fragments import templates_digest
+from ikr_project.routers import reading_from_replica
+
+from .cache import get_versions, version_time, versions_shared
+
+
+def validators(request, namespaces):
+    """(ETag, Last-Modified or None) of a page showing `namespaces` to `request`, or (None, None)."""
+    if request.method not in ('GET', 'HEAD') or not versions_shared():
+        return None, None
+    if not getattr(request, 'edge_shell', False) and len(messages.get_messages(request)):
+        return None, None
+    user = request.user
+    if user.is_authenticated and 'agents' not in namespaces:
+        namespaces = [*namespaces, 'agents']
+    versions = get_versions(*namespaces)
+    parts = [*versions, templates_digest()]
+    if user.is_authenticated:
+        parts += [
+            f'user:{user.pk}:{user.is_staff:d}{user.is_superuser:d}',
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        ]
+    if reading_from_replica():
+        parts.append(f'replica:{int(time.time() // getattr(settings, "REPLICA_CACHE_TIMEOUT", 60))}')
+    etag = hashlib.md5('|'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    if user.is_authenticated or reading_from_replica():
+        return etag, None
+    times = [version_time(version) for version in versions]
+    return etag, max(times) if None not in times else None
+
+
+def catalogue_condition(*namespaces):
+    """
+    Conditional GET for a view showing `namespaces`. A namespace may be a
+    callable, called with the view's arguments, e.g. for `listing:<slug>`.
+    """
+    def page_validators(request, *args, **kwargs):
+        if not hasattr(request, '_catalogue_validators'):
+            request._catalogue_validators = validators(request, [
+                namespace(request, *args, **kwargs) if callable(namespace) else namespace
+                for namespace in namespaces
+            ])
+        return request._catalogue_validators
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: page_validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: page_validators(request, *args, **kwargs)[1],
+    )
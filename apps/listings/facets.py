@@ -0,0 +1,143 @@
+"""
+Facet counts for the listing filters.
+
+For every option of every facet (category, property type, city, price band,
+minimum bedrooms) we count the listings that match the current filters with
+that option selected. As usual for faceted navigation, a facet's own
+selection is ignored when counting its options, so picking "Apartments"
+still shows how many houses there are.
+
+All counts come from a single aggregate query: the non-facet filters
+(search, price range, distance...) restrict the rows, and each option is a
+COUNT(*) FILTER (WHERE ...) column over them.
+"""
+from django.db.models import Count, Q
+from django.http import QueryDict
+
+from .pagination import filter_params
+
+FACETS = (
+    ('category', 'Category'),
+    ('property_type', 'Property type'),
+    ('city', 'City'),
+    ('price_band', 'Price'),
+    ('bedrooms', 'Bedrooms'),
+)
+
+# (value, label, minimum, maximum); the maximum is exclusive.
+PRICE_BANDS = (
+    ('under-1m', 'Under 1M', None, 1_000_000),
+    ('1m-5m', '1M - 5M', 1_000_000, 5_000_000),
+    ('5m-10m', '5M - 10M', 5_000_000, 10_000_000),
+    ('10m-plus', '10M+', 10_000_000, None),
+)
+BEDROOM_MINIMUMS = (1, 2, 3, 4, 5)
+
+PRICE_BAND_CHOICES = [(value, label) for value, label, _, _ in PRICE_BANDS]
+BEDROOM_CHOICES = [(str(beds), f'{beds}+ beds') for beds in BEDROOM_MINIMUMS]
+
+
+def facet_value(value):
+    """The query-string value of a cleaned filter value (a model instance, number or string)."""
+    return str(getattr(value, 'pk', value))
+
+
+def option_q(name, value):
+    """Q for the listings matching facet option `value`."""
+    value = facet_value(value)
+    if name == 'category':
+        return Q(category_id=value)
+    if name == 'property_type':
+        return Q(property_type_obj_id=value)
+    if name == 'city':
+        return Q(location__city__iexact=value)
+    if name == 'price_band':
+        for band, _, minimum, maximum in PRICE_BANDS:
+            if band == value:
+                q = Q()
+                if minimum is not None:
+                    q &= Q(price__gte=minimum)
+                if maximum is not None:
+                    q &= Q(price__lt=maximum)
+                return q
+    if name == 'bedrooms':
+        return Q(bedrooms__gte=int(value))
+    raise ValueError(f'Unknown facet option {name}={value}')
+
+
+def facet_options():
+    """{facet: [(value, label)]} for every facet."""
+    from .models import Category, Location, PropertyType
+
+    cities = Location.objects.order_by('city').values_list('city', flat=True).distinct()
+    return {
+        'category': [(str(pk), name) for pk, name in Category.objects.order_by('name').values_list('pk', 'name')],
+        'property_type': [(str(pk), name) for pk, name in PropertyType.objects.order_by('name').values_list('pk', 'name')],
+        'city': [(city, city) for city in cities],
+        'price_band': PRICE_BAND_CHOICES,
+        'bedrooms': BEDROOM_CHOICES,
+    }
+
+
+def _count(q):
+    return Count('pk', filter=q) if q else Count('pk')
+
+
+def facet_counts(filterset, params=None):
+    """
+    {'count': matching listings, 'facets': [{'name', 'label', 'options': [{'value',
+    'label', 'count', 'selected', 'querystring'}]}]} for a ListingFilter.
+    `querystring` toggles the option in `params` (the filterset's data by default).
+    """
+    params = filterset.data if params is None else params
+    if not isinstance(params, QueryDict):
+        params, data = QueryDict(mutable=True), params
+        params.update(data)
+    params = filter_params(params)
+    if not filterset.is_valid():
+        return {'count': 0, 'facets': []}
+    facet_names = {name for name, _ in FACETS}
+    rows = filterset.queryset
+    selected = {}
+    for name, value in filterset.form.cleaned_data.items():
+        if value in (None, ''):
+            continue
+        if name in facet_names:
+            selected[name] = facet_value(value)
+        else:
+            rows = filterset.filters[name].filter(rows, value)
+
+    def selections(excluding=None):
+        q = Q()
+        for name, value in selected.items():
+            if name != excluding:
+                q &= option_q(name, value)
+        return q
+
+    options = facet_options()
+    aggregates = {'total': _count(selections())}
+    for name, _ in FACETS:
+        others = selections(excluding=name)
+        for position, (value, _) in enumerate(options[name]):
+            aggregates[f'{name}_{position}'] = _count(others & option_q(name, value))
+    counts = rows.order_by().aggregate(**aggregates)
+
+    facets = []
+    for name, label in FACETS:
+        choices = []
+        for position, (value, option_label) in enumerate(options[name]):
+            is_selected = selected.get(name, '').casefold() == value.casefold()
+            querystring = params.copy()
+            if is_selected:
+                querystring.pop(name, None)
+            else:
+                querystring[name] = value
+            choices.append({
+                'value': value,
+                'label': option_label,
+                'count': counts[f'{name}_{position}'],
+                'selected': is_selected,
+                'querystring': querystring.urlencode(),
+            })
+        facets.append({'name': name, 'label': label, 'options': choices})
+    return {'count': counts['total'], 'facets': facets}
@@ -1,29 +1,53 @@
 import django_filters
-from .models import Listing, Category
+from .facets import BEDROOM_CHOICES, PRICE_BAND_CHOICES, option_q
+from .geo import MAX_RADIUS_KM, parse_bbox
+from .models import Listing, Category, PropertyType
+from .search import search_listings
 # from .forms import ListingSearchForm
 
 
 class ListingFilter(django_filters.FilterSet):
     query = django_filters.CharFilter(method='filter_query')
-    # category = django_filters.ModelChoiceFilter(queryset=Category.objects.all())
     # location = django_filters.ModelChoiceFilter(queryset=Location.objects.all())
     # property_type = django_filters.ChoiceFilter(choices=Listing.PROPERTY_TYPE)
-    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte', method='filter_price')
-    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte', method='filter_price')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    # "Within `radius` km of (lat, lng)", nearest first.
+    lat = django_filters.NumberFilter(method='filter_near', min_value=-90, max_value=90)
+    lng = django_filters.NumberFilter(method='filter_near', min_value=-180, max_value=180)
+    radius = django_filters.NumberFilter(method='filter_near', min_value=0, max_value=MAX_RADIUS_KM)
+    # Map viewport: "south,west,north,east".
+    bbox = django_filters.CharFilter(method='filter_bbox')
+    # Facets, counted by facets.facet_counts().
+    category = django_filters.ModelChoiceFilter(queryset=Category.objects.all(), method='filter_facet')
+    property_type = django_filters.ModelChoiceFilter(queryset=PropertyType.objects.all(), method='filter_facet')
+    city = django_filters.CharFilter(method='filter_facet')
+    price_band = django_filters.ChoiceFilter(choices=PRICE_BAND_CHOICES, method='filter_facet')
+    bedrooms = django_filters.ChoiceFilter(choices=BEDROOM_CHOICES, method='filter_facet')
 
     class Meta:
         model = Listing
-        fields = ['query', 'min_price', 'max_price']
+        fields = [
+            'query', 'min_price', 'max_price', 'lat', 'lng', 'radius', 'bbox',
+            'category', 'property_type', 'city', 'price_band', 'bedrooms',
+        ]
 
     def filter_query(self, queryset, name, value):
-        return queryset.filter(
-            title__icontains=value
-        ) | queryset.filter(
-            description__icontains=value
-        )
+        # Results come back ordered by relevance rather than by date.
+        return search_listings(value, queryset)
 
-    def filter_price(self, queryset, name, value):
-        # This method is used for both min_price and max_price.
-        # 'name' will be 'price__gte' or 'price__lte' based on lookup_expr.
-        # We only filter if a value is provided.
-        return queryset.filter(**{name: value}) if value is not None else queryset
+    def filter_facet(self, queryset, name, value):
+        return queryset.filter(option_q(name, value))
+
+    def filter_near(self, queryset, name, value):
+        # Applied once, when the radius is reached, and only with all three values.
+        data = self.form.cleaned_data
+        if name != 'radius' or data.get('lat') is None or data.get('lng') is None:
+            return queryset
+        return queryset.within(data['lat'], data['lng'], float(value))
+
+    def filter_bbox(self, queryset, name, value):
+        box = parse_bbox(value)
+        if box is None:
+            return queryset.none()
+        return queryset.in_box(*box)
@@ -0,0 +1,173 @@
+"""
+Radius and bounding-box search over Location coordinates, without PostGIS.
+
+Every Location stores the geohash of its coordinates in an indexed column.
+A search box is covered by a handful of geohash cells, chosen so there are
+at most MAX_COVER_CELLS of them, and the candidate locations are those whose
+geohash starts with one of the cells (index range scans on both SQLite and
+PostgreSQL) and whose coordinates fall inside the box. Radius searches then
+compute the exact great-circle distance of every candidate in one NumPy
+pass, and listings are matched by location id and ordered by the same
+distance computed in SQL (`distance_expression`).
+"""
+import math
+
+import numpy as np
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5m cells
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = 500
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """The geohash of a point."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell at `precision`."""
+    bits = precision * 5
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+
+def _steps(start, stop, step):
+    value = start
+    while value < stop:
+        yield value
+        value += step
+    yield stop
+
+
+def _split(south, west, north, east):
+    """The box as one or two boxes that don't cross the antimeridian."""
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def covering_cells(south, west, north, east):
+    """The fewest-character set of geohash prefixes (at most MAX_COVER_CELLS) covering the box."""
+    boxes = _split(south, west, north, east)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        estimate = sum(
+            (math.floor((n - s) / height) + 2) * (math.floor((e - w) / width) + 2)
+            for s, w, n, e in boxes
+        )
+        if estimate <= MAX_COVER_CELLS or precision == 1:
+            return sorted({
+                encode(lat, lng, precision)
+                for s, w, n, e in boxes
+                for lat in _steps(s, n, height)
+                for lng in _steps(w, e, width)
+            })
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(south, west, north, east) of the box enclosing a circle."""
+    latitude, longitude = float(latitude), float(longitude)
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(latitude - delta_lat, -90.0), min(latitude + delta_lat, 90.0)
+    if south == -90.0 or north == 90.0:
+        # The circle contains a pole: every longitude is in range.
+        return south, -180.0, north, 180.0
+    delta_lng = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(latitude))))
+    if delta_lng >= 180:
+        return south, -180.0, north, 180.0
+    west, east = longitude - delta_lng, longitude + delta_lng
+    # Wrap across the antimeridian; _split() handles west > east.
+    return south, (west + 540) % 360 - 180, north, (east + 540) % 360 - 180
+
+
+def parse_bbox(value):
+    """(south, west, north, east) from "south,west,north,east", or None if invalid."""
+    try:
+        south, west, north, east = (float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return None
+    return south, west, north, east
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def haversine_km_array(latitude, longitude, latitudes, longitudes):
+    """Distance in km from a point to each of the points in two arrays (NaN where they are NaN)."""
+    lat1, lng1 = np.radians(latitude), np.radians(longitude)
+    lat2, lng2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def distance_expression(latitude, longitude, prefix=''):
+    """
+    The haversine distance in km from a point to `<prefix>latitude`,
+    `<prefix>longitude` as a query expression (Django provides the math
+    functions on SQLite too).
+    """
+    lat1, lng1 = math.radians(float(latitude)), math.radians(float(longitude))
+    lat2 = Radians(Cast(F(f'{prefix}latitude'), FloatField()))
+    lng2 = Radians(Cast(F(f'{prefix}longitude'), FloatField()))
+    a = (
+        Power(Sin((lat2 - Value(lat1)) / Value(2.0)), 2)
+        + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin((lng2 - Value(lng1)) / Value(2.0)), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Value(1.0), Sqrt(a), output_field=FloatField()))
+
+
+def locations_in_box(south, west, north, east):
+    """Locations inside the box."""
+    from .models import Location
+
+    cells = Q()
+    for cell in covering_cells(south, west, north, east):
+        cells |= Q(geohash__startswith=cell)
+    inside = Q()
+    for s, w, n, e in _split(south, west, north, east):
+        inside |= Q(latitude__range=(s, n), longitude__range=(w, e))
+    return Location.objects.filter(cells).filter(inside)
+
+
+def locations_within(latitude, longitude, radius_km):
+    """{location id: distance in km} for the locations within `radius_km` of a point."""
+    latitude, longitude = float(latitude), float(longitude)
+    candidates = list(locations_in_box(*bounding_box(latitude, longitude, radius_km)).values_list(
+        'pk', 'latitude', 'longitude',
+    ))
+    if not candidates:
+        return {}
+    ids, latitudes, longitudes = zip(*candidates)
+    distances = haversine_km_array(
+        latitude, longitude, np.array(latitudes, dtype=np.float64), np.array(longitudes, dtype=np.float64),
+    )
+    inside = distances <= radius_km
+    return dict(zip(np.array(ids)[inside].tolist(), distances[inside].tolist()))
@@ -0,0 +1,270 @@
+"""
+Responsive image renditions for listing photos.
+
+Listing images live on Cloudinary, so resized copies come from delivery-URL
+transformations (``c_limit,w_<n>``, never upscaled, with ``f_auto,q_auto`` so
+browsers that accept AVIF or WebP get those). Each ListingImage memoizes the
+URLs and srcset of every named rendition in its ``renditions`` JSON column
+when it is saved, so templates only read stored strings.
+
+``process_listing_image`` fills in what needs the pixels: the original
+width/height (unless the upload response already gave them) and a BlurHash
+whose average colour is used as the placeholder while the image loads. It
+runs in the background after an upload and from the
+``process_listing_images`` command for existing rows.
+
+Photos uploaded through the listing form are not sent to Cloudinary inside
+the request: `stage_listing_images` writes them to local staging storage and
+creates ListingImage rows with status 'pending', and `upload_staged_images`
+pushes them to Cloudinary in the background on a bounded thread pool,
+moving each row to 'ready' or 'failed'.
+"""
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from PIL import Image
+
+from .blurhash import encode as encode_blurhash
+
+logger = logging.getLogger(__name__)
+
+# Named renditions: the width used for `src`, and the widths offered in `srcset`.
+RENDITIONS = {
+    'thumb': (320, (160, 320, 480)),
+    'card': (640, (320, 480, 640, 960, 1280)),
+    'hero': (1280, (640, 960, 1280, 1600, 2048)),
+}
+BLURHASH_SOURCE_WIDTH = 64
+DOWNLOAD_TIMEOUT = 15
+UPLOAD_ERROR_LENGTH = 255
+
+
+def image_resource(image):
+    """The CloudinaryResource for a ListingImage (its field holds a plain string until reloaded)."""
+    value = image.image
+    if isinstance(value, str):
+        value = type(image)._meta.get_field('image').to_python(value)
+    return value
+
+
+def rendition_url(resource, width):
+    return resource.build_url(
+        width=width, crop='limit', fetch_format='auto', quality='auto', secure=True,
+    )
+
+
+def build_renditions(image):
+    """
+    {name: {'src', 'srcset'[, 'width', 'height']}} for every rendition of a
+    ListingImage, or {} if its URL cannot be built (e.g. Cloudinary is not
+    configured).
+    """
+    resource = image_resource(image)
+    if not getattr(resource, 'public_id', None):
+        return {}
+    renditions = {}
+    try:
+        for name, (width, srcset_widths) in RENDITIONS.items():
+            if image.width:
+                # The largest width actually available, so the srcset does not
+                # advertise sizes c_limit would never deliver.
+                srcset_widths = sorted({min(w, image.width) for w in srcset_widths})
+            rendition = {
+                'src': rendition_url(resource, width),
+                'srcset': ', '.join(f'{rendition_url(resource, w)} {w}w' for w in srcset_widths),
+            }
+            if image.width and image.height:
+                rendered_width = min(width, image.width)
+                rendition['width'] = rendered_width
+                rendition['height'] = round(image.height * rendered_width / image.width)
+            renditions[name] = rendition
+    except ValueError as exc:  # Cloudinary raises this without a cloud name
+        logger.debug('Cannot build renditions for image %s: %s', image.pk, exc)
+        return {}
+    return renditions
+
+
+def _download(url):
+    response = requests.get(url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    return Image.open(io.BytesIO(response.content))
+
+
+def blurhash_for(picture):
+    picture = picture.copy()
+    picture.thumbnail((32, 32))
+    return encode_blurhash(picture)
+
+
+def process_listing_image(image):
+    """Fetch the image's pixels to record its size and BlurHash, then refresh its renditions."""
+    from .cache import bump_versions, listing_namespace
+    from .cards import refresh_cards
+    from .models import ListingImage
+
+    resource = image_resource(image)
+    if image.width and image.height:
+        picture = _download(rendition_url(resource, BLURHASH_SOURCE_WIDTH))
+    else:
+        picture = _download(resource.build_url(secure=True))
+        image.width, image.height = picture.size
+    image.blurhash = blurhash_for(picture)
+    image.renditions = build_renditions(image)
+    ListingImage.objects.filter(pk=image.pk).update(
+        width=image.width, height=image.height, blurhash=image.blurhash, renditions=image.renditions,
+    )
+    refresh_cards([image.listing_id])
+    slug = ListingImage.objects.filter(pk=image.pk).values_list('listing__slug', flat=True).first()
+    if slug:
+        bump_versions('listings', listing_namespace(slug))
+
+
+def process_listing_images(ids):
+    from .models import ListingImage
+
+    processed = 0
+    for image in ListingImage.objects.filter(pk__in=ids):
+        try:
+            process_listing_image(image)
+        except (requests.RequestException, OSError, ValueError) as exc:
+            logger.warning('Processing listing image %s failed: %s', image.pk, exc)
+        else:
+            processed += 1
+    return processed
+
+
+def schedule_image_processing(ids):
+    """Run process_listing_images in the background once the current transaction commits."""
+    from ikr_project.celery import enqueue
+    from .tasks import process_listing_images_task
+
+    transaction.on_commit(lambda: enqueue(process_listing_images_task, list(ids)))
+
+
+# Staged uploads
+
+def upload_image(source):
+    """
+    Upload a URL or local path to Cloudinary. Returns the ListingImage field
+    values: the stored image reference and its size.
+    """
+    import cloudinary.uploader
+
+    result = cloudinary.uploader.upload(source, folder='listings', resource_type='image')
+    return {
+        'image': f"{result['resource_type']}/{result['type']}/v{result['version']}/{result['public_id']}.{result['format']}",
+        'width': result.get('width'),
+        'height': result.get('height'),
+    }
+
+
+def staging_storage():
+    return FileSystemStorage(location=settings.LISTING_IMAGE_STAGING_ROOT)
+
+
+def stage_listing_images(listing, files):
+    """
+    Save uploaded `files` to staging storage, create a pending ListingImage
+    for each and schedule their upload. Returns the new images.
+    """
+    from .models import ListingImage
+
+    if not files:
+        return []
+    storage = staging_storage()
+    needs_main = not listing.images.filter(is_main=True).exists()
+    images = []
+    for position, upload in enumerate(files):
+        images.append(ListingImage(
+            listing=listing,
+            status=ListingImage.PENDING,
+            staged_file=storage.save(f'{listing.pk}/{upload.name}', upload),
+            is_main=needs_main and position == 0,
+        ))
+    ListingImage.objects.bulk_create(images)
+    schedule_staged_uploads([image.pk for image in images])
+    return images
+
+
+def schedule_staged_uploads(ids):
+    """Run upload_staged_images in the background once the current transaction commits."""
+    from ikr_project.celery import enqueue
+    from .tasks import upload_staged_images_task
+
+    transaction.on_commit(lambda: enqueue(upload_staged_images_task, list(ids)))
+
+
+def _claim_staged(ids):
+    """Mark pending images as 'processing' and return them, so no other worker uploads them too."""
+    from .models import ListingImage
+
+    with transaction.atomic():
+        claimed = list(
+            ListingImage.objects.select_for_update(skip_locked=True)
+            .filter(pk__in=ids, status=ListingImage.PENDING)
+            .order_by('pk')
+        )
+        ListingImage.objects.filter(pk__in=[image.pk for image in claimed]).update(
+            status=ListingImage.PROCESSING,
+        )
+    return claimed
+
+
+def _mark_failed(image, exc):
+    from .cards import refresh_cards
+    from .models import ListingImage
+
+    logger.warning('Upload of staged listing image %s failed: %s', image.pk, exc)
+    ListingImage.objects.filter(pk=image.pk).update(
+        status=ListingImage.FAILED, error=str(exc)[:UPLOAD_ERROR_LENGTH], is_main=False,
+    )
+    if image.is_main:
+        # Promote the listing's next image that can still be shown.
+        successor = ListingImage.objects.filter(
+            listing_id=image.listing_id,
+            status__in=(ListingImage.PENDING, ListingImage.PROCESSING, ListingImage.READY),
+        ).order_by('pk').values_list('pk', flat=True).first()
+        if successor:
+            ListingImage.objects.filter(pk=successor).update(is_main=True)
+            refresh_cards([image.listing_id])
+
+
+def upload_staged_images(ids, upload=None, workers=None):
+    """
+    Upload pending staged images to Cloudinary, `workers` at a time
+    (LISTING_IMAGE_UPLOAD_WORKERS by default). Only the uploads run on the
+    pool; rows are updated from the calling thread. Returns the number of
+    images that became ready.
+    """
+    from .models import ListingImage
+
+    upload = upload or upload_image
+    images = _claim_staged(ids)
+    if not images:
+        return 0
+    storage = staging_storage()
+    workers = workers or settings.LISTING_IMAGE_UPLOAD_WORKERS
+    ready = 0
+    with ThreadPoolExecutor(max_workers=min(workers, len(images)), thread_name_prefix='listing-upload') as pool:
+        jobs = [(image, pool.submit(upload, storage.path(image.staged_file))) for image in images]
+        for image, future in jobs:
+            try:
+                uploaded = future.result()
+            except Exception as exc:
+                _mark_failed(image, exc)
+                continue
+            for name, value in uploaded.items():
+                setattr(image, name, value)
+            image.status = ListingImage.READY
+            image.error = ''
+            staged_file, image.staged_file = image.staged_file, ''
+            # Like any new image: memoizes renditions and schedules the BlurHash.
+            image.save()
+            storage.delete(staged_file)
+            ready += 1
+    return ready
@@ -0,0 +1,322 @@
+"""
+Bulk listing import from CSV or JSON Lines.
+
+Rows are streamed from the input one at a time and inserted in batches: each
+batch is one transaction with a bulk INSERT for the listings and one for
+their amenity links. Locations, categories, property types, amenities and
+agents are resolved through in-memory caches, so a lookup only hits the
+database the first time a name is seen. Slugs for the whole batch are
+allocated with a single query (slugs.allocate_slugs).
+
+Images (a ``|``-separated list of URLs or local paths in the ``images``
+column) are uploaded concurrently on a bounded thread pool once their
+listings are committed.
+
+Bulk inserts skip model signals, so the importer does the work the signal
+handlers would: search documents, listing cards, agent listing totals,
+catalogue cache invalidation and (once, at the end) related-listing
+neighbours.
+
+Expected columns (all but ``title`` optional): title, description, price,
+status, bedrooms, bathrooms, square_feet, lot_size, year_built,
+garage_spaces, is_featured, is_published, category, property_type,
+location, city, state, country, latitude, longitude, amenities (``|``-
+separated), images, agent_email.
+"""
+import csv
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from apps.agents.models import Agent
+from apps.agents.stats import apply_listing_change
+from .cache import bump_versions
+from .cards import refresh_cards, update_cards
+from .images import build_renditions, schedule_image_processing, upload_image
+from .models import Amenity, Category, Listing, ListingImage, Location, PropertyType
+from .recommendations import schedule_neighbour_refresh
+from .search import index_listings
+from .slugs import allocate_slugs
+
+logger = logging.getLogger(__name__)
+
+# Listing fields copied from the row, converted with the field's to_python().
+VALUE_FIELDS = (
+    'description', 'price', 'status', 'bedrooms', 'bathrooms', 'square_feet',
+    'lot_size', 'year_built', 'garage_spaces', 'is_featured', 'is_published',
+)
+LIST_SEPARATOR = '|'
+SLUG_ATTEMPTS = 3
+
+
+class RowError(Exception):
+    """A row that cannot be imported; the row is skipped."""
+
+
+def read_rows(stream, format):
+    """Yield (row number, dict) for each record in a CSV or JSON Lines stream."""
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(stream), start=1):
+            yield number, row
+    elif format == 'jsonl':
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield number, exc
+    else:
+        raise ValueError(f'Unknown import format: {format}')
+
+
+def _text(row, name):
+    value = row.get(name)
+    return '' if value is None else str(value).strip()
+
+
+def _list(row, name):
+    value = row.get(name)
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in _text(row, name).split(LIST_SEPARATOR) if item.strip()]
+
+
+class LookupCache:
+    """
+    Name -> instance for a small lookup table, loaded in one query. Unknown
+    names are created on first use (get_or_create, so concurrent imports
+    don't collide).
+    """
+
+    def __init__(self, model, key_fields=('name',)):
+        self.model = model
+        self.key_fields = key_fields
+        self._cache = {self._key(obj): obj for obj in model.objects.all()}
+
+    def _key(self, obj):
+        return tuple(str(getattr(obj, name)).casefold() for name in self.key_fields)
+
+    def get(self, defaults=None, **values):
+        key = tuple(str(values[name]).casefold() for name in self.key_fields)
+        obj = self._cache.get(key)
+        if obj is None:
+            lookup = {f'{name}__iexact': values[name] for name in self.key_fields}
+            obj, _ = self.model.objects.get_or_create(**lookup, defaults={**values, **(defaults or {})})
+            self._cache[key] = obj
+        return obj
+
+
+class AgentCache:
+    """Agents by user email; unknown emails are an error rather than created."""
+
+    def __init__(self):
+        self._cache = {}
+
+    def get(self, email):
+        key = email.casefold()
+        if key not in self._cache:
+            self._cache[key] = Agent.objects.select_related('user').filter(user__email__iexact=email).first()
+        agent = self._cache[key]
+        if agent is None:
+            raise RowError(f'No agent with email {email}')
+        return agent
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    created: int = 0
+    images: int = 0
+    errors: list = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+class ListingImporter:
+    """
+    Import rows from read_rows() in batches of `batch_size`.
+
+    Listings belong to the row's agent (``agent_email``) or `agent`, and to
+    that agent's user or `owner`. `on_batch(stats, last_row)` is called after
+    every committed batch, e.g. to report progress or write a checkpoint.
+    """
+
+    def __init__(self, owner=None, agent=None, batch_size=500, image_workers=4,
+                 publish=False, upload=None, on_batch=None):
+        self.owner = owner
+        self.agent = agent
+        self.batch_size = batch_size
+        self.image_workers = image_workers
+        self.publish = publish
+        self.upload = upload or upload_image
+        self.on_batch = on_batch
+        self.locations = LookupCache(Location, ('name', 'city', 'state'))
+        self.categories = LookupCache(Category)
+        self.property_types = LookupCache(PropertyType)
+        self.amenities = LookupCache(Amenity)
+        self.agents = AgentCache()
+        self.stats = ImportStats()
+        self.created_ids = []
+
+    def run(self, rows, skip_until=0):
+        """Import `rows`, skipping row numbers up to `skip_until` (a resumed import)."""
+        batch = []
+        last_row = skip_until
+        with ThreadPoolExecutor(max_workers=self.image_workers, thread_name_prefix='listing-import') as pool:
+            for number, row in rows:
+                if number <= skip_until:
+                    continue
+                self.stats.rows += 1
+                last_row = number
+                try:
+                    if isinstance(row, Exception):
+                        raise RowError(str(row))
+                    batch.append(self.build(row))
+                except (RowError, ValidationError, KeyError) as exc:
+                    self.stats.errors.append((number, _error_message(exc)))
+                if len(batch) >= self.batch_size:
+                    self.save_batch(batch, pool)
+                    batch = []
+                    self._batch_done(last_row)
+            if batch:
+                self.save_batch(batch, pool)
+            self._batch_done(last_row)
+        schedule_neighbour_refresh(self.created_ids)
+        return self.stats
+
+    def _batch_done(self, last_row):
+        if self.on_batch:
+            self.on_batch(self.stats, last_row)
+
+    def build(self, row):
+        """Return (unsaved Listing, amenities, image sources) for one row."""
+        title = _text(row, 'title')
+        if not title:
+            raise RowError('Missing title')
+
+        agent = self.agents.get(_text(row, 'agent_email')) if _text(row, 'agent_email') else self.agent
+        user = agent.user if agent else self.owner
+        if user is None:
+            raise RowError('No agent_email and no default agent or owner')
+        listing = Listing(title=title[:255], agent=agent, user=user)
+        for name in VALUE_FIELDS:
+            value = row.get(name)
+            if value in (None, ''):
+                continue
+            try:
+                setattr(listing, name, Listing._meta.get_field(name).to_python(value))
+            except ValidationError as exc:
+                raise ValidationError({name: exc.messages})
+        if self.publish:
+            listing.is_published = True
+
+        if _text(row, 'category'):
+            listing.category = self.categories.get(name=_text(row, 'category'))
+        if _text(row, 'property_type'):
+            listing.property_type_obj = self.property_types.get(name=_text(row, 'property_type'))
+        if _text(row, 'location'):
+            location = {name: _text(row, name) for name in ('city', 'state', 'country')}
+            if not all(location.values()):
+                raise RowError('A location needs a city, state and country')
+            listing.location = self.locations.get(
+                name=_text(row, 'location'),
+                defaults={
+                    name: Location._meta.get_field(name).to_python(row.get(name) or None)
+                    for name in ('latitude', 'longitude')
+                },
+                **location,
+            )
+        listing.full_clean(exclude=['slug', 'user', 'agent', 'category', 'location', 'property_type_obj', 'amenities'])
+        amenities = [self.amenities.get(name=name) for name in _list(row, 'amenities')]
+        return listing, amenities, _list(row, 'images')
+
+    def save_batch(self, batch, pool):
+        listings = [listing for listing, _, _ in batch]
+        for attempt in range(SLUG_ATTEMPTS):
+            for listing, slug in zip(listings, allocate_slugs(Listing, [listing.title for listing in listings])):
+                listing.slug = slug
+            try:
+                self._insert(batch, listings)
+                break
+            except IntegrityError:
+                # Another writer took one of the slugs; allocate again.
+                for listing in listings:
+                    listing.pk = None
+                if attempt == SLUG_ATTEMPTS - 1:
+                    raise
+        self.stats.created += len(listings)
+        self.created_ids.extend(listing.pk for listing in listings)
+
+        self.save_images(batch, pool)
+        bump_versions('listings', 'agents')
+
+    def _insert(self, batch, listings):
+        with transaction.atomic():
+            Listing.objects.bulk_create(listings)
+            Listing.amenities.through.objects.bulk_create([
+                Listing.amenities.through(listing_id=listing.pk, amenity_id=amenity.pk)
+                for listing, amenities, _ in batch
+                for amenity in amenities
+            ])
+            inserted = Listing.objects.filter(pk__in=[listing.pk for listing in listings])
+            index_listings(inserted)
+            update_cards(inserted)
+            agent_counts = {}
+            for listing in listings:
+                agent_counts[listing.agent_id] = agent_counts.get(listing.agent_id, 0) + 1
+            for agent_id, count in agent_counts.items():
+                apply_listing_change(agent_id, count)
+
+    def save_images(self, batch, pool):
+        """Upload the batch's images concurrently, then insert their rows together."""
+        jobs = [
+            (listing, position, pool.submit(self.upload, source))
+            for listing, _, sources in batch
+            for position, source in enumerate(sources)
+        ]
+        images = []
+        for listing, position, future in jobs:
+            try:
+                uploaded = future.result()
+            except Exception as exc:
+                logger.warning('Image upload for %s failed: %s', listing.slug, exc)
+                self.stats.errors.append((listing.slug, f'Image upload failed: {exc}'))
+                continue
+            image = ListingImage(listing=listing, is_main=position == 0, **uploaded)
+            image.renditions = build_renditions(image)
+            images.append(image)
+        # If a listing's first image failed, promote its next one.
+        with_main = {image.listing_id for image in images if image.is_main}
+        for image in images:
+            if image.listing_id not in with_main:
+                image.is_main = True
+                with_main.add(image.listing_id)
+        ListingImage.objects.bulk_create(images)
+        # The cards were made before their listings had images.
+        refresh_cards({image.listing_id for image in images})
+        self.stats.images += len(images)
+        # BlurHash placeholders need the pixels; compute them in the background.
+        schedule_image_processing([image.pk for image in images if image.renditions])
+
+
+def _error_message(exc):
+    if isinstance(exc, ValidationError):
+        if hasattr(exc, 'message_dict'):
+            return '; '.join(f'{name}: {" ".join(errors)}' for name, errors in exc.message_dict.items())
+        return ' '.join(exc.messages)
+    return str(exc)
@@ -0,0 +1,82 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.http import QueryDict
+
+from apps.listings.columns import ListingColumns, ListingIdList
+from apps.listings.filters import ListingFilter
+from apps.listings.models import Listing
+
+# Filter states to compare, as query strings.
+SCENARIOS = (
+    '',
+    'min_price=100000&max_price=5000000',
+    'bedrooms=3&price_band=1m-5m',
+    'lat=-1.2921&lng=36.8219&radius=25',
+    'bbox=-1.5,36.6,-1.1,37.1&bedrooms=2',
+)
+
+
+def _timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares the first page of listing_list filtered by the ORM with the '
+        'in-memory column store (LISTING_COLUMN_STORE), for a few filter states.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--per-page', type=int, default=12)
+        parser.add_argument(
+            'scenarios', nargs='*', metavar='QUERYSTRING',
+            help='Filter query strings to time instead of the built-in ones.',
+        )
+
+    def handle(self, *args, **options):
+        repeat, per_page = options['repeat'], options['per_page']
+        listings = Listing.objects.published().for_cards().order_by('-created_at')
+
+        columns, load_timings = _timed(ListingColumns.load, 1)
+        self.stdout.write(f'Snapshot of {len(columns)} listings built in {load_timings[0]:.1f} ms')
+        self.stdout.write(f'{"filters":<45} {"orm ms":>9} {"columns ms":>11} {"filter only":>12} {"rows":>7}')
+
+        for querystring in options['scenarios'] or SCENARIOS:
+            params = QueryDict(querystring)
+
+            def orm_page():
+                filterset = ListingFilter(params, queryset=listings)
+                paginator = Paginator(filterset.qs, per_page)
+                return paginator.count, [listing.pk for listing in paginator.page(1)]
+
+            def filter_ids():
+                filterset = ListingFilter(params, queryset=listings)
+                filterset.is_valid()
+                return columns.filter(filterset.form.cleaned_data)
+
+            def column_page():
+                ids, distances = filter_ids()
+                paginator = Paginator(ListingIdList(ids, listings, distances), per_page)
+                return paginator.count, [listing.pk for listing in paginator.page(1)]
+
+            if filter_ids() is None:
+                self.stdout.write(f'{querystring or "(none)":<45} not supported by the column store')
+                continue
+            (orm_count, orm_ids), orm_timings = _timed(orm_page, repeat)
+            (count, ids), column_timings = _timed(column_page, repeat)
+            _, filter_timings = _timed(filter_ids, repeat)
+            if (orm_count, orm_ids) != (count, ids):
+                self.stderr.write(f'{querystring}: results differ ({orm_count} vs {count} rows)')
+            self.stdout.write(
+                f'{querystring or "(none)":<45} {statistics.median(orm_timings):>9.2f} '
+                f'{statistics.median(column_timings):>11.2f} {statistics.median(filter_timings):>12.3f} {count:>7}'
+            )
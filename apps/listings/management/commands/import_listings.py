@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.agents.models import Agent
+from apps.listings.importer import ListingImporter, read_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports listings from a CSV or JSON Lines file (see apps/listings/importer.py '
+        'for the columns). Use --checkpoint to make a long import resumable.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for standard input.")
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--image-workers', type=int, default=4, help='Concurrent image uploads.')
+        parser.add_argument('--agent', help='Email of the agent for rows without an agent_email column.')
+        parser.add_argument('--owner', help='Email of the user owning listings that have no agent.')
+        parser.add_argument('--publish', action='store_true', help='Publish every imported listing.')
+        parser.add_argument(
+            '--checkpoint',
+            help='File recording the last imported row; an existing checkpoint resumes after that row.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Cannot tell the input format; pass --format csv or --format jsonl.')
+
+        agent = owner = None
+        if options['agent']:
+            agent = Agent.objects.select_related('user').filter(user__email__iexact=options['agent']).first()
+            if agent is None:
+                raise CommandError(f"No agent with email {options['agent']}")
+        if options['owner']:
+            owner = User.objects.filter(email__iexact=options['owner']).first()
+            if owner is None:
+                raise CommandError(f"No user with email {options['owner']}")
+
+        checkpoint = options['checkpoint']
+        skip_until = 0
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                skip_until = json.load(f)['row']
+            self.stdout.write(f'Resuming after row {skip_until}.')
+
+        def on_batch(stats, last_row):
+            if checkpoint:
+                with open(checkpoint, 'w') as f:
+                    json.dump({'source': path, 'row': last_row}, f)
+            self.stdout.write(
+                f'Row {last_row}: {stats.created} listings, {stats.images} images, '
+                f'{len(stats.errors)} errors ({stats.rows_per_second:.0f} rows/s)'
+            )
+
+        importer = ListingImporter(
+            owner=owner, agent=agent, batch_size=options['batch_size'],
+            image_workers=options['image_workers'], publish=options['publish'], on_batch=on_batch,
+        )
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            stats = importer.run(read_rows(stream, fmt), skip_until=skip_until)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for row, message in stats.errors:
+            self.stderr.write(f'Row {row}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.created} listings and {stats.images} images from {stats.rows} rows '
+            f'in {stats.elapsed:.1f}s ({stats.rows_per_second:.0f} rows/s).'
+        ))
@@ -0,0 +1,137 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils import timezone
+
+from apps.agents.models import AGENT_SORTS, Agent, Rating
+from apps.agents.search import search_agents
+from apps.inquiries.models import Inquiry
+from apps.listings.models import Listing, ListingCard, ListingNeighbour
+from apps.listings.search import ranked_query, search_listings
+
+
+def sequential_scans(plan, vendor):
+    """Return the tables `plan` reads in full rather than through an index."""
+    if vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)', plan)
+    # SQLite: "SCAN <table>" without "USING [COVERING] INDEX ...". Scans of
+    # subquery results ("CO-ROUTINE <name>") are not table scans.
+    subqueries = set(re.findall(r'CO-ROUTINE (\w+)', plan))
+    tables = []
+    for line in plan.splitlines():
+        match = re.search(r'\bSCAN (\w+)(.*)', line)
+        if match and 'INDEX' not in match.group(2) and match.group(1) not in subqueries:
+            tables.append(match.group(1))
+    return tables
+
+
+def explain(query):
+    """
+    The query plan as text. `query` is a queryset or (SQL, params) for raw
+    queries. Runs EXPLAIN directly because QuerySet.explain() fails on
+    querysets filtered on a window function (distinct_messages()).
+    """
+    if isinstance(query, tuple):
+        db = connection
+        sql, params = query
+    else:
+        db = connections[query.db]
+        sql, params = query.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN' if db.vendor == 'sqlite' else 'EXPLAIN'
+    with db.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+
+def canonical_queries():
+    """
+    The main queries behind each public view, with representative parameters.
+    Keep this in step with the views when their filtering or ordering changes.
+    """
+    listing = Listing.objects.published().order_by('-created_at').first()
+    agent = Agent.objects.filter(verification_status='verified').order_by('-rating').first()
+    category_id = listing.category_id if listing else 0
+    listing_id = listing.pk if listing else 0
+    agent_id = agent.pk if agent else 0
+    user_id = agent.user_id if agent else 0
+    now = timezone.now()
+    # A word every catalogue has, so the search plans read real index entries.
+    term = listing.title.split()[0] if listing and listing.title.split() else 'house'
+    page_ids = list(Listing.objects.published().order_by('-created_at').values_list('pk', flat=True)[:12])
+    search_scope = ListingCard.objects.filter(is_active=True, status='available')
+
+    queries = [
+        # listing_list pages load listing ids, then their cards (cards.CardList).
+        ('listing_list', Listing.objects.published().order_by('-created_at').only('pk')[:12]),
+        ('listing_list: cards', ListingCard.objects.filter(pk__in=page_ids)),
+        ('listing_list (cursor)', Listing.objects.published().filter(
+            created_at__lt=now).order_by('-created_at', '-id').only('pk', 'created_at')[:13]),
+        ('home: featured listings', ListingCard.objects.published().filter(
+            is_featured=True).order_by('-created_at')[:6]),
+        ('listing_detail: related listings', ListingNeighbour.objects.filter(
+            listing_id=listing_id).order_by('rank').values_list('neighbour_id', flat=True)),
+        ('listing_detail: related listings (not computed yet)', Listing.objects.published().filter(
+            category_id=category_id).exclude(id=listing_id).values_list('pk', flat=True)[:4]),
+        ('search: ranked listings', ranked_query(term, queryset=search_scope)),
+        ('search: listing cards', search_listings(term, search_scope)[:10]),
+    ]
+    queries += [
+        (f'agent_list (sort={sort})', Agent.objects.directory().order_by(*ordering)[:12])
+        for sort, (_, ordering) in AGENT_SORTS.items()
+    ]
+    queries += [
+        ('agent_list: search', search_agents(Agent.objects.directory(), term)[:12]),
+        ('home: featured agents', Agent.objects.filter(verification_status='verified', is_featured=True)[:4]),
+        ('agent_detail: listings', Listing.objects.filter(user_id=user_id, status='available')),
+        ('agent_detail: ratings', Rating.objects.filter(agent_id=agent_id).order_by('-created_at')),
+        ('agent_dashboard: new inquiries', Inquiry.objects.filter(
+            listing__agent_id=agent_id, status='new').order_by('-created_at')),
+        ('agent_dashboard: inquiries panel', Inquiry.objects.filter(
+            listing__agent_id=agent_id).distinct_messages().order_by('-created_at', '-id')[:20]),
+    ]
+    # Searches that can't match anything (no catalogue yet) run no query.
+    return [
+        (name, query) for name, query in queries
+        if query is not None and (isinstance(query, tuple) or not query.query.is_empty())
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs EXPLAIN on the canonical query of each public view and reports '
+        'sequential scans. Run against a database with production-like data: '
+        'on tiny tables the planner prefers sequential scans anyway.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail-on-seq-scan', action='store_true',
+            help='Exit with an error if any query uses a sequential scan (for CI).',
+        )
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan in full.')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            raise CommandError(f'Unsupported database backend: {connection.vendor}')
+
+        offenders = []
+        for name, query in canonical_queries():
+            plan = explain(query)
+            scanned = sorted(set(sequential_scans(plan, connection.vendor)))
+            if scanned:
+                offenders.append(name)
+                self.stdout.write(self.style.WARNING(f'{name}: sequential scan on {", ".join(scanned)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+            if options['verbose_plans'] or scanned:
+                for line in plan.splitlines():
+                    self.stdout.write(f'    {line}')
+
+        if offenders:
+            message = f'{len(offenders)} quer{"y uses" if len(offenders) == 1 else "ies use"} a sequential scan.'
+            if options['fail_on_seq_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('No sequential scans found.'))
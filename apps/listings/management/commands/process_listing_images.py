@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.listings.images import build_renditions, process_listing_images, upload_staged_images
+from apps.listings.models import ListingImage
+
+
+def _process(ids):
+    try:
+        return process_listing_images(ids)
+    finally:
+        connection.close()  # Each worker thread has its own connection.
+
+
+class Command(BaseCommand):
+    help = (
+        'Records size, BlurHash and rendition URLs for listing images that do not '
+        'have them yet (or all of them with --all), or retries staged uploads '
+        'with --retry-uploads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every image.')
+        parser.add_argument('--workers', type=int, default=8, help='Images downloaded in parallel.')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--renditions-only', action='store_true',
+            help='Only rebuild the stored rendition URLs (no downloads), e.g. after a Cloudinary account change.',
+        )
+        parser.add_argument(
+            '--retry-uploads', action='store_true',
+            help='Upload staged images that are pending or failed (e.g. after an outage).',
+        )
+
+    def handle(self, *args, **options):
+        if options['retry_uploads']:
+            staged = ListingImage.objects.filter(status__in=(ListingImage.PENDING, ListingImage.FAILED))
+            ids = list(staged.order_by('pk').values_list('pk', flat=True))
+            staged.update(status=ListingImage.PENDING, error='')
+            ready = upload_staged_images(ids, workers=options['workers'])
+            self.stdout.write(self.style.SUCCESS(f'Uploaded {ready} of {len(ids)} staged images.'))
+            return
+
+        images = ListingImage.objects.filter(status=ListingImage.READY).order_by('pk')
+        if options['renditions_only']:
+            count = 0
+            for image in images.iterator(chunk_size=500):
+                image.renditions = build_renditions(image)
+                ListingImage.objects.filter(pk=image.pk).update(renditions=image.renditions)
+                count += 1
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt renditions for {count} images.'))
+            return
+
+        if not options['all']:
+            images = images.filter(blurhash='')
+        ids = list(images.values_list('pk', flat=True))
+        batches = [ids[i:i + options['batch_size']] for i in range(0, len(ids), options['batch_size'])]
+        self.stdout.write(f'Processing {len(ids)} images...')
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            processed = sum(pool.map(_process, batches))
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} of {len(ids)} images.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.listings.cards import update_cards
+from apps.listings.models import Listing
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the card summary (ListingCard) of every listing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding listing cards...')
+        count = update_cards(Listing.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} listing cards.'))
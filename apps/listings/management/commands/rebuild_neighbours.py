@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.listings.recommendations import rebuild_neighbours
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the related-listing neighbours of every published listing.'
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        count = rebuild_neighbours()
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed neighbours for {count} listings in {time.monotonic() - start:.1f}s.'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.listings.models import Listing, ListingSearchDocument
+from apps.listings.search import index_listings
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search documents for all listings.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete every search document before rebuilding.',
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = ListingSearchDocument.objects.all().delete()
+            self.stdout.write(f'Deleted {deleted} search documents.')
+
+        self.stdout.write('Indexing listings...')
+        count = index_listings(Listing.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} listings.'))
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from apps.listings.search import build_document, create_search_index, drop_search_index
+
+
+def add_search_index(apps, schema_editor):
+    create_search_index(schema_editor)
+
+
+def remove_search_index(apps, schema_editor):
+    drop_search_index(schema_editor)
+
+
+def populate_search_documents(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    ListingSearchDocument = apps.get_model('listings', 'ListingSearchDocument')
+    listings = Listing.objects.select_related(
+        'location', 'category', 'property_type_obj'
+    ).prefetch_related('amenities')
+    documents = []
+    for listing in listings:
+        title, document = build_document(listing)
+        documents.append(ListingSearchDocument(listing=listing, title=title, document=document))
+    ListingSearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_alter_listingimage_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSearchDocument',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='listings.listing')),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('document', models.TextField(blank=True, help_text='Description, location, category, property type and amenities')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Listing Search Document',
+                'verbose_name_plural': 'Listing Search Documents',
+            },
+        ),
+        migrations.RunPython(add_search_index, remove_search_index),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+    ]
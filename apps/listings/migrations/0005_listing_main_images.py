@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:05
+
+from django.db import migrations
+from django.db.models import Exists, Min, OuterRef
+
+
+def mark_main_images(apps, schema_editor):
+    """Give every listing that has images but no main image one, so cards keep showing a picture."""
+    ListingImage = apps.get_model('listings', 'ListingImage')
+    has_main = ListingImage.objects.filter(listing_id=OuterRef('listing_id'), is_main=True)
+    first_images = (
+        ListingImage.objects.filter(~Exists(has_main))
+        .values('listing_id')
+        .annotate(first_id=Min('id'))
+        .values_list('first_id', flat=True)
+    )
+    ListingImage.objects.filter(pk__in=list(first_images)).update(is_main=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_listingsearchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(mark_main_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0003_agent_agent_status_rating_idx_and_more'),
+        ('listings', '0005_listing_main_images'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True), ('status', 'available')), fields=['-created_at', '-id'], name='listing_public_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_featured', True), ('is_published', True), ('status', 'available')), fields=['-created_at'], name='listing_public_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True), ('status', 'available')), fields=['category', '-created_at'], name='listing_public_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_published', 'status', '-created_at'], name='listing_publish_state_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_listing_public_recent_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='blurhash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
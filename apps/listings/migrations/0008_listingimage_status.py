@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:07
+
+import cloudinary.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_listingimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='error',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='staged_file',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='listingimage',
+            name='image',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, verbose_name='image'),
+        ),
+    ]
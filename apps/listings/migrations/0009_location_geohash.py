@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+from apps.listings.geo import encode
+
+
+def populate_geohashes(apps, schema_editor):
+    Location = apps.get_model('listings', 'Location')
+    locations = Location.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for location in locations.iterator():
+        location.geohash = encode(location.latitude, location.longitude)
+        location.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listingimage_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(populate_geohashes, migrations.RunPython.noop),
+    ]
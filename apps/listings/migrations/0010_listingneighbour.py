@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_location_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingNeighbour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='listings.listing')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbour_of', to='listings.listing')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'rank'), name='listing_neighbour_rank_unique')],
+            },
+        ),
+    ]
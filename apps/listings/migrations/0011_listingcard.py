@@ -0,0 +1,59 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from apps.listings.cards import card_fields, main_images_prefetch
+
+
+def populate_cards(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    ListingCard = apps.get_model('listings', 'ListingCard')
+    ListingImage = apps.get_model('listings', 'ListingImage')
+    listings = Listing.objects.select_related(
+        'location', 'category', 'agent__user'
+    ).prefetch_related(main_images_prefetch(ListingImage))
+    cards = []
+    for listing in listings:
+        main_image = listing.main_images[0] if listing.main_images else None
+        cards.append(ListingCard(listing=listing, **card_fields(listing, main_image)))
+    ListingCard.objects.bulk_create(cards, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_listingneighbour'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingCard',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='listings.listing')),
+                ('title', models.CharField(max_length=255)),
+                ('slug', models.SlugField(db_index=False, max_length=255)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('bedrooms', models.IntegerField(blank=True, null=True)),
+                ('bathrooms', models.DecimalField(blank=True, decimal_places=1, max_digits=3, null=True)),
+                ('square_feet', models.IntegerField(blank=True, null=True)),
+                ('image', models.JSONField(blank=True, default=dict)),
+                ('image_color', models.CharField(blank=True, max_length=7)),
+                ('location_label', models.CharField(blank=True, max_length=500)),
+                ('category_name', models.CharField(blank=True, max_length=100)),
+                ('agent_name', models.CharField(blank=True, max_length=150)),
+                ('status', models.CharField(default='available', max_length=20)),
+                ('is_published', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_featured', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Listing Card',
+                'verbose_name_plural': 'Listing Cards',
+                'indexes': [models.Index(condition=models.Q(('is_featured', True), ('is_published', True), ('status', 'available')), fields=['-created_at'], name='listing_card_featured_idx')],
+            },
+        ),
+        migrations.RunPython(populate_cards, migrations.RunPython.noop),
+    ]
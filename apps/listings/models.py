@@ -1,11 +1,15 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.utils.text import slugify
 from decimal import Decimal
+from types import SimpleNamespace
 from apps.agents.models import Agent # Assuming Agent model is in apps.agents
 from cloudinary.models import CloudinaryField
 
+from .cards import agent_name, location_label, main_images_prefetch, refresh_cards
+from .geo import distance_expression, encode as encode_geohash, locations_in_box, locations_within
+from .slugs import save_with_unique_slug
+
 User = get_user_model()
 
 class PropertyType(models.Model):
@@ -28,6 +32,8 @@ class Location(models.Model):
     country = models.CharField(max_length=100)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    # Derived from latitude/longitude on save; indexed for geo.py's searches.
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -37,6 +43,15 @@ class Location(models.Model):
     def __str__(self):
         return f'{self.name}, {self.city}, {self.state}'
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        if kwargs.get('update_fields') is not None and {'latitude', 'longitude'} & set(kwargs['update_fields']):
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'geohash'}
+        super().save(*args, **kwargs)
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
@@ -60,15 +75,65 @@ class Amenity(models.Model):
         verbose_name_plural = 'Amenities'
 
 class ListingImage(models.Model):
+    # Images uploaded through the listing form are staged locally and sent to
+    # Cloudinary in the background (images.stage_listing_images).
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    )
+
     listing = models.ForeignKey('Listing', on_delete=models.CASCADE, related_name='images')
-    image = CloudinaryField('image', folder='listings', resource_type='image')
+    image = CloudinaryField('image', folder='listings', resource_type='image', blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=READY)
+    # Path in images.staging_storage() until the upload succeeds.
+    staged_file = models.CharField(max_length=255, blank=True, editable=False)
+    error = models.CharField(max_length=255, blank=True, editable=False)
     alt_text = models.CharField(max_length=255, blank=True)
     is_main = models.BooleanField(default=False)
+    # Filled in from the upload response or by images.process_listing_image.
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    blurhash = models.CharField(max_length=64, blank=True)
+    # Memoized rendition URLs and srcsets, see images.build_renditions.
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Image for {self.listing.title}"
 
+    def save(self, *args, **kwargs):
+        from .images import build_renditions, schedule_image_processing
+
+        # Cards only load the main image, so a listing's first image becomes
+        # its main image unless one has already been chosen.
+        if not self.is_main and not ListingImage.objects.filter(
+            listing_id=self.listing_id, is_main=True
+        ).exclude(pk=self.pk).exists():
+            self.is_main = True
+        super().save(*args, **kwargs)
+
+        # A new upload has only now been given its public id (and, in the
+        # upload response, its size), so renditions are recorded afterwards.
+        metadata = getattr(self.image, 'metadata', None) or {}
+        size = (metadata.get('width', self.width), metadata.get('height', self.height))
+        changed = size != (self.width, self.height)
+        self.width, self.height = size
+        renditions = build_renditions(self)
+        if changed or renditions != self.renditions:
+            self.renditions = renditions
+            ListingImage.objects.filter(pk=self.pk).update(
+                width=self.width, height=self.height, renditions=self.renditions,
+            )
+            refresh_cards([self.listing_id])
+        if renditions and not self.blurhash:
+            schedule_image_processing([self.pk])
+
     def get_image_url(self):
         """
         Return the image URL.
@@ -76,13 +141,81 @@ class ListingImage(models.Model):
         - If the image file is missing, it returns an empty string.
         This prevents broken image links and allows templates to handle fallbacks.
         """
-        if self.image and hasattr(self.image, 'url'):
+        if self.image:
             try:
                 return self.image.url
-            except (ValueError, FileNotFoundError):
-                pass  # The file is missing on storage
+            except (AttributeError, ValueError, FileNotFoundError):
+                pass  # The file is missing on storage, or storage is not configured
         return ""
 
+    def rendition(self, name):
+        """
+        {'src', 'srcset'[, 'width', 'height']} for a rendition in
+        images.RENDITIONS, or None. Falls back to the original URL for
+        images saved before renditions were recorded.
+        """
+        rendition = self.renditions.get(name)
+        if rendition is None:
+            url = self.get_image_url()
+            rendition = {'src': url, 'srcset': ''} if url else None
+        return rendition
+
+    @property
+    def thumb(self):
+        return self.rendition('thumb')
+
+    @property
+    def card(self):
+        return self.rendition('card')
+
+    @property
+    def hero(self):
+        return self.rendition('hero')
+
+    @property
+    def placeholder_color(self):
+        from .blurhash import average_color
+
+        return average_color(self.blurhash) if self.blurhash else ''
+
+class ListingQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(is_published=True, status='available')
+
+    def for_cards(self):
+        """
+        Load everything a listing card (and the agent box next to it) renders:
+        location, category, agent -> user -> profile and only the main image,
+        available as `listing.main_image`.
+        """
+        return self.select_related(
+            'location', 'category', 'agent__user__profile'
+        ).prefetch_related(main_images_prefetch(ListingImage))
+
+    def within(self, latitude, longitude, radius_km):
+        """
+        Listings whose location is within `radius_km` of a point, nearest
+        first, annotated with `distance_km`. See geo.py.
+        """
+        distances = locations_within(latitude, longitude, radius_km)
+        if not distances:
+            return self.none()
+        return self.filter(location_id__in=list(distances)).annotate(
+            distance_km=distance_expression(latitude, longitude, prefix='location__'),
+        ).order_by('distance_km', '-created_at', '-id')
+
+    def in_box(self, south, west, north, east):
+        """Listings whose location is inside a map viewport (west > east crosses the antimeridian)."""
+        return self.filter(location__in=locations_in_box(south, west, north, east).values('pk'))
+
+    def for_detail(self):
+        """Everything for_cards() loads plus the full gallery and amenities."""
+        return self.for_cards().select_related('property_type_obj').prefetch_related(
+            models.Prefetch('images', queryset=ListingImage.objects.filter(status=ListingImage.READY)),
+            'amenities',
+        )
+
+
 class Listing(models.Model):
     STATUS_CHOICES = (
         ('available', 'Available'),
@@ -125,23 +258,171 @@ class Listing(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        # Every public query filters on is_published=True, status='available'
+        # (see ListingQuerySet.published) and sorts newest first, so the hot
+        # indexes are partial on that predicate. Backends without partial
+        # index support (MySQL) skip them and use listing_publish_state_idx.
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_published=True, status='available'),
+                name='listing_public_recent_idx',
+            ),
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(is_published=True, status='available', is_featured=True),
+                name='listing_public_featured_idx',
+            ),
+            models.Index(
+                fields=['category', '-created_at'],
+                condition=models.Q(is_published=True, status='available'),
+                name='listing_public_category_idx',
+            ),
+            models.Index(fields=['is_published', 'status', '-created_at'], name='listing_publish_state_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.title)
-            # Ensure uniqueness
-            original_slug = self.slug
-            counter = 1
-            while Listing.objects.filter(slug=self.slug).exists():
-                self.slug = f"{original_slug}-{counter}"
-                counter += 1
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        # Unique slug from the title; see slugs.py.
+        save_with_unique_slug(self, lambda: super(Listing, self).save(*args, **kwargs), self.title)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # So the agents app can move total_listings when the agent changes.
+        if 'agent_id' in instance.__dict__:
+            instance._loaded_agent_id = instance.agent_id
+        return instance
 
     def __str__(self):
         return self.title
 
+    # The card template reads these from a Listing or a ListingCard alike.
+
+    @property
+    def location_label(self):
+        return location_label(self.location) if self.location_id else ''
+
+    @property
+    def category_name(self):
+        return self.category.name if self.category_id else ''
+
+    @property
+    def agent_name(self):
+        return agent_name(self.agent) if self.agent_id else ''
+
+    @property
+    def main_image(self):
+        """The listing's main image, or None. Free when loaded via for_cards()."""
+        if hasattr(self, 'main_images'):
+            return self.main_images[0] if self.main_images else None
+        return self.images.filter(is_main=True, status=ListingImage.READY).order_by('pk').first()
+
     def clean(self):
         from django.core.exceptions import ValidationError
         if self.price is None:
             self.price = Decimal('0.00')
         if not isinstance(self.price, (Decimal, int, float)) or self.price < 0:
             raise ValidationError({'price': 'Price must be a valid positive number.'})
+
+
+class ListingSearchDocument(models.Model):
+    """
+    Denormalized full-text document for a listing.
+
+    The backend-specific index (a weighted tsvector column with a GIN index
+    on PostgreSQL, an FTS5 virtual table on SQLite) is derived from `title`
+    and `document` by the database itself; see apps/listings/search.py.
+    """
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.CharField(max_length=255, blank=True)
+    document = models.TextField(blank=True, help_text='Description, location, category, property type and amenities')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Listing Search Document'
+        verbose_name_plural = 'Listing Search Documents'
+
+    def __str__(self):
+        return f"Search document for listing #{self.listing_id}"
+
+
+class ListingCardQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(is_published=True, status='available')
+
+
+class ListingCard(models.Model):
+    """
+    Everything a listing card renders, denormalized from the listing, its
+    main image, location, category and agent so that catalogue pages read
+    cards from this one table. Kept in sync by signals; see
+    apps/listings/cards.py.
+    """
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    title = models.CharField(max_length=255)
+    slug = models.SlugField(max_length=255, db_index=False)
+    price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    bedrooms = models.IntegerField(null=True, blank=True)
+    bathrooms = models.DecimalField(max_digits=3, decimal_places=1, null=True, blank=True)
+    square_feet = models.IntegerField(null=True, blank=True)
+    # The main image's 'card' rendition ({'src', 'srcset'[, 'width', 'height']}), or {}.
+    image = models.JSONField(default=dict, blank=True)
+    image_color = models.CharField(max_length=7, blank=True)
+    location_label = models.CharField(max_length=500, blank=True)
+    category_name = models.CharField(max_length=100, blank=True)
+    agent_name = models.CharField(max_length=150, blank=True)
+    # Copied from the listing for filtering and ordering.
+    status = models.CharField(max_length=20, default='available')
+    is_published = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    is_featured = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ListingCardQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Listing Card'
+        verbose_name_plural = 'Listing Cards'
+        indexes = [
+            # HomeView: featured public cards, newest first
+            models.Index(
+                fields=['-created_at'],
+                condition=models.Q(is_published=True, status='available', is_featured=True),
+                name='listing_card_featured_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Card for listing #{self.listing_id}"
+
+    @property
+    def main_image(self):
+        """Stands in for Listing.main_image in the card template."""
+        if not self.image:
+            return None
+        return SimpleNamespace(card=self.image, placeholder_color=self.image_color)
+
+
+class ListingNeighbour(models.Model):
+    """
+    A precomputed "related listing": `neighbour` is the `rank`-th most similar
+    published listing to `listing`. Maintained by apps/listings/recommendations.py.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='neighbour_of')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'rank'], name='listing_neighbour_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"#{self.rank} neighbour of listing #{self.listing_id}"
@@ -0,0 +1,193 @@
+"""
+Keyset ("cursor") pagination.
+
+Paginator issues a COUNT(*) over the whole filtered queryset and then an
+OFFSET that gets slower the deeper you page. CursorPaginator instead seeks
+past the last row it returned using the ordering columns, e.g.
+
+    WHERE (created_at, id) < (<last created_at>, <last id>)
+    ORDER BY created_at DESC, id DESC LIMIT 13
+
+so every page costs the same regardless of depth, and no count is needed.
+
+Cursors are opaque signed tokens that carry the position, the direction and
+the filter query string that produced them, so `?cursor=<token>` is enough
+to render the next page with the same filters.
+"""
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.http import QueryDict
+
+CURSOR_SALT = 'apps.listings.pagination.cursor'
+
+# Query-string parameters that control pagination rather than filtering.
+PAGINATION_PARAMS = ('page', 'cursor', 'paginate')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def approximate_count(queryset):
+    """
+    Return the planner's row estimate for `queryset` on PostgreSQL, or None on
+    other backends. Costs one EXPLAIN instead of a COUNT(*) over every row.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def filter_params(params):
+    """Return a copy of `params` without the pagination parameters."""
+    params = params.copy()
+    for name in PAGINATION_PARAMS:
+        params.pop(name, None)
+    return params
+
+
+def read_cursor(request):
+    """
+    Return (cursor, params) for a request in cursor mode.
+
+    `cursor` is the decoded token (None on the first page or if the token is
+    invalid) and `params` the filter QueryDict to apply: the one carried by
+    the token if there is one, otherwise the request's own.
+    """
+    token = request.GET.get('cursor')
+    if token:
+        try:
+            cursor = signing.loads(token, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            cursor = None
+        else:
+            return cursor, QueryDict(cursor['filters'])
+    return None, filter_params(request.GET)
+
+
+def is_cursor_mode(request):
+    return request.GET.get('paginate') == 'cursor' or 'cursor' in request.GET
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Approximate total (PostgreSQL planner estimate) or None.
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate `queryset` by seeking on `ordering`, a sequence of field names
+    optionally prefixed with '-'. The last field must be unique (normally
+    '-id') so that every row has a distinct position.
+    """
+
+    def __init__(self, queryset, per_page, ordering, filters=None, with_count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+        self.filters = filters.urlencode() if filters is not None else ''
+        if with_count is None:
+            with_count = getattr(settings, 'PAGINATION_APPROXIMATE_COUNTS', False)
+        self.with_count = with_count
+
+    def _order_by(self, reverse):
+        return [
+            f'-{name}' if descending != reverse else name
+            for name, descending in self.ordering
+        ]
+
+    def _seek(self, values, reverse):
+        """Rows strictly after `values` in the (possibly reversed) ordering."""
+        condition = Q()
+        for i, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for j, (previous_name, _) in enumerate(self.ordering[:i]):
+                step &= Q(**{previous_name: values[j]})
+            condition |= step
+        return condition
+
+    def _position(self, obj):
+        return [
+            self.queryset.model._meta.get_field(name).value_to_string(obj)
+            for name, _ in self.ordering
+        ]
+
+    def _parse_position(self, position):
+        return [
+            self.queryset.model._meta.get_field(name).to_python(value)
+            for (name, _), value in zip(self.ordering, position)
+        ]
+
+    def _token(self, obj, direction):
+        return signing.dumps(
+            {'position': self._position(obj), 'direction': direction, 'filters': self.filters},
+            salt=CURSOR_SALT,
+            compress=True,
+        )
+
+    def page(self, cursor=None):
+        """Return the page after (or before) `cursor`, as returned by read_cursor()."""
+        reverse = cursor is not None and cursor.get('direction') == 'previous'
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if cursor is not None:
+            try:
+                values = self._parse_position(cursor['position'])
+            except (KeyError, TypeError, ValidationError) as exc:
+                raise InvalidCursor(str(exc)) from exc
+            queryset = queryset.filter(self._seek(values, reverse))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            # Coming back from a later page, so there is always a next page.
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_next:
+                next_cursor = self._token(rows[-1], 'next')
+            if has_previous:
+                previous_cursor = self._token(rows[0], 'previous')
+
+        count = approximate_count(self.queryset) if self.with_count else None
+        return CursorPage(rows, next_cursor, previous_cursor, count)
@@ -0,0 +1,310 @@
+"""
+Related listings.
+
+Each published listing's NEIGHBOURS most similar published listings are
+precomputed into ListingNeighbour, so the detail page reads them with one
+indexed query. Similarity is a weighted sum of:
+
+- same category, same property type;
+- same location (or, failing that, same city);
+- price closeness, on a log scale;
+- bedroom closeness;
+- amenity overlap (Jaccard index).
+
+Scores are computed with NumPy over feature arrays of the whole published
+catalogue, a block of rows at a time. `rebuild_neighbours` recomputes
+everything; `refresh_neighbours` recomputes only the listings affected by a
+change (the changed listings themselves, listings that had them as
+neighbours, and listings they would now displace a neighbour of).
+
+Listing changes schedule a refresh in the background (see signals.py).
+Scheduled ids are coalesced per process: at most one refresh is queued at a
+time, and it takes every id scheduled until it starts, so a burst of saves
+costs one refresh rather than one each. Refreshes reuse the process's
+feature arrays, reloading only the changed listings' rows, unless the
+published catalogue no longer matches them (see `current_features`).
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min
+
+from .cache import bump_versions, listing_namespace
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOURS = 8
+WEIGHTS = {
+    'category': 3.0,
+    'property_type': 1.0,
+    'location': 2.0,
+    'city': 1.0,
+    'price': 2.0,
+    'bedrooms': 1.0,
+    'amenities': 2.0,
+}
+# Elements of a score block (rows x catalogue), to bound memory.
+BLOCK_ELEMENTS = 2_000_000
+# Listing ids per query when reading stored neighbours of many listings.
+ID_BATCH = 500
+NONE_ID = -1
+FEATURE_FIELDS = (
+    'pk', 'category_id', 'property_type_obj_id', 'location_id', 'location__city', 'price', 'bedrooms', 'updated_at',
+)
+
+
+def _floats(values):
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+
+def _ids(values):
+    return np.array([NONE_ID if value is None else value for value in values], dtype=np.int64)
+
+
+class ListingFeatures:
+    """Feature arrays for every published listing, in `ids` order."""
+
+    def __init__(self, rows, amenity_pairs):
+        rows = sorted(rows)
+        self.rows = rows
+        self.amenity_pairs = amenity_pairs
+        ids, category, property_type, location, city, price, bedrooms, updated_at = zip(*rows) if rows else ((),) * 8
+        self.fingerprint = (len(rows), max(updated_at, default=None))
+        self.ids = np.array(ids, dtype=np.int64)
+        self.position = {pk: i for i, pk in enumerate(ids)}
+        self.category = _ids(category)
+        self.property_type = _ids(property_type)
+        self.location = _ids(location)
+        cities = {}
+        self.city = np.array(
+            [cities.setdefault(name.casefold(), len(cities)) if name else NONE_ID for name in city], dtype=np.int64,
+        )
+        prices = _floats(price)
+        self.log_price = np.where(prices > 0, np.log(np.where(prices > 0, prices, 1)), np.nan)
+        self.bedrooms = _floats(bedrooms)
+
+        amenity_columns = {}
+        self.amenities = np.zeros((len(ids), len({amenity for _, amenity in amenity_pairs})), dtype=np.float32)
+        for listing_id, amenity_id in amenity_pairs:
+            if listing_id in self.position:
+                column = amenity_columns.setdefault(amenity_id, len(amenity_columns))
+                self.amenities[self.position[listing_id], column] = 1
+        self.amenity_counts = self.amenities.sum(axis=1)
+
+    @classmethod
+    def load(cls, listing_ids=None):
+        """Features of every published listing, or of those in `listing_ids`."""
+        from .models import Listing
+
+        published = Listing.objects.published().order_by()
+        if listing_ids is not None:
+            published = published.filter(pk__in=list(listing_ids))
+        pairs = Listing.amenities.through.objects.filter(listing__in=published.values('pk')).values_list(
+            'listing_id', 'amenity_id',
+        )
+        return cls(list(published.values_list(*FEATURE_FIELDS)), list(pairs))
+
+    def reloaded(self, listing_ids):
+        """These features with the rows of the listings in `listing_ids` read again."""
+        listing_ids = set(listing_ids)
+        fresh = ListingFeatures.load(listing_ids)
+        return ListingFeatures(
+            [row for row in self.rows if row[0] not in listing_ids] + fresh.rows,
+            [pair for pair in self.amenity_pairs if pair[0] not in listing_ids] + fresh.amenity_pairs,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, rows):
+        """Similarity of the listings at positions `rows` to every listing (len(rows) x len(self))."""
+        rows = np.asarray(rows)
+
+        def same(column):
+            values = column[rows][:, None]
+            return ((values == column[None, :]) & (values != NONE_ID)).astype(np.float32)
+
+        score = WEIGHTS['category'] * same(self.category)
+        score += WEIGHTS['property_type'] * same(self.property_type)
+        same_location = same(self.location)
+        score += WEIGHTS['location'] * same_location
+        score += WEIGHTS['city'] * same(self.city) * (1 - same_location)
+        # exp(-|log a - log b|) = min(a, b) / max(a, b); 0 when a price is missing.
+        price = np.exp(-np.abs(self.log_price[rows][:, None] - self.log_price[None, :]))
+        score += WEIGHTS['price'] * np.nan_to_num(price, nan=0.0)
+        bedrooms = 1 / (1 + np.abs(self.bedrooms[rows][:, None] - self.bedrooms[None, :]))
+        score += WEIGHTS['bedrooms'] * np.nan_to_num(bedrooms, nan=0.0)
+        if self.amenities.shape[1]:
+            shared = self.amenities[rows] @ self.amenities.T
+            union = self.amenity_counts[rows][:, None] + self.amenity_counts[None, :] - shared
+            score += WEIGHTS['amenities'] * np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+        # A listing is not its own neighbour.
+        score[np.arange(len(rows)), rows] = -np.inf
+        return score
+
+    def blocks(self, rows):
+        size = max(1, BLOCK_ELEMENTS // max(1, len(self)))
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
+
+    def top_neighbours(self, rows):
+        """{listing id: [(neighbour id, score), ...]} best first, for the listings at positions `rows`."""
+        result = {}
+        k = min(NEIGHBOURS, len(self) - 1)
+        for block in self.blocks(list(rows)):
+            if k <= 0:
+                result.update({int(self.ids[row]): [] for row in block})
+                continue
+            score = self.scores(block)
+            top = np.argpartition(-score, k - 1, axis=1)[:, :k]
+            for row, candidates, row_scores in zip(block, top, score):
+                ranked = sorted(candidates, key=lambda column: (-row_scores[column], self.ids[column]))
+                result[int(self.ids[row])] = [
+                    (int(self.ids[column]), float(row_scores[column])) for column in ranked if row_scores[column] > 0
+                ]
+        return result
+
+
+def _save(neighbours, replace_all=False):
+    """Replace the stored neighbours of the listings in `neighbours` (or every stored row)."""
+    from .models import ListingNeighbour
+
+    with transaction.atomic():
+        stale = ListingNeighbour.objects.all()
+        if not replace_all:
+            stale = stale.filter(listing_id__in=list(neighbours))
+        stale.delete()
+        ListingNeighbour.objects.bulk_create([
+            ListingNeighbour(listing_id=listing_id, neighbour_id=neighbour_id, rank=rank, score=score)
+            for listing_id, ranked in neighbours.items()
+            for rank, (neighbour_id, score) in enumerate(ranked, start=1)
+        ], batch_size=1000)
+
+
+_features = None
+_features_lock = threading.Lock()
+
+
+def current_features(listing_ids=()):
+    """
+    Features of the published catalogue, with the listings in `listing_ids`
+    read again. The process keeps the last ones it built and reloads
+    everything only when their listing count or latest updated_at no longer
+    matches the database's (a change this process wasn't told about).
+    """
+    global _features
+    from .models import Listing
+
+    with _features_lock:
+        latest = Listing.objects.published().aggregate(count=Count('pk'), latest=Max('updated_at'))
+        features = _features.reloaded(listing_ids) if _features is not None else None
+        if features is None or features.fingerprint != (latest['count'], latest['latest']):
+            features = ListingFeatures.load()
+        _features = features
+        return features
+
+
+def rebuild_neighbours():
+    """Recompute every published listing's neighbours. Returns the number of listings."""
+    global _features
+    features = _features = ListingFeatures.load()
+    neighbours = features.top_neighbours(range(len(features)))
+    _save(neighbours, replace_all=True)
+    bump_versions('listings')
+    return len(neighbours)
+
+
+def refresh_neighbours(listing_ids):
+    """
+    Bring the neighbour table up to date after the listings in `listing_ids`
+    changed (or were unpublished or deleted). Returns the ids of the listings
+    whose neighbours were recomputed.
+    """
+    from .models import Listing, ListingNeighbour
+
+    listing_ids = set(listing_ids)
+    features = current_features(listing_ids)
+    changed = [features.position[pk] for pk in listing_ids if pk in features.position]
+    ListingNeighbour.objects.filter(listing_id__in=listing_ids - set(features.position)).delete()
+
+    affected = set(changed)
+    # Listings that had a changed listing as a neighbour.
+    for pk in ListingNeighbour.objects.filter(neighbour_id__in=listing_ids).values_list('listing_id', flat=True):
+        if pk in features.position:
+            affected.add(features.position[pk])
+    # Listings a changed listing would now displace a neighbour of (scores are
+    # symmetric, so one block of rows gives every listing's score with them).
+    if changed:
+        best = np.full(len(features), -np.inf)
+        for block in features.blocks(changed):
+            best = np.maximum(best, features.scores(block).max(axis=0))
+        # Only listings a changed one scores above zero with can take it as a
+        # neighbour; read the weakest stored neighbour of just those.
+        candidates = np.flatnonzero(best > 0)
+        weakest = np.full(len(features), -np.inf)
+        for start in range(0, len(candidates), ID_BATCH):
+            stored = ListingNeighbour.objects.filter(
+                listing_id__in=features.ids[candidates[start:start + ID_BATCH]].tolist(),
+            ).values('listing_id').annotate(weakest=Min('score'), total=Count('pk')).order_by()
+            for row in stored:
+                if row['total'] >= NEIGHBOURS:
+                    weakest[features.position[row['listing_id']]] = row['weakest']
+        affected.update(candidates[best[candidates] > weakest[candidates]].tolist())
+
+    neighbours = features.top_neighbours(sorted(affected))
+    _save(neighbours)
+    slugs = Listing.objects.filter(pk__in=list(neighbours)).values_list('slug', flat=True)
+    bump_versions(*[listing_namespace(slug) for slug in slugs])
+    return list(neighbours)
+
+
+_pending = set()
+_pending_lock = threading.Lock()
+_draining = False
+
+
+def _drain_pending():
+    """Refresh the pending ids, and any scheduled meanwhile, until none are left."""
+    global _draining
+    from .tasks import refresh_neighbours_task
+
+    # Let the rest of a burst of saves join the first refresh.
+    time.sleep(getattr(settings, 'NEIGHBOUR_REFRESH_DELAY', 1.0))
+    while True:
+        with _pending_lock:
+            listing_ids = sorted(_pending)
+            _pending.clear()
+            if not listing_ids:
+                _draining = False
+                return
+        try:
+            if getattr(settings, 'CELERY_BROKER_URL', ''):
+                refresh_neighbours_task.delay(listing_ids)
+            else:
+                refresh_neighbours(listing_ids)
+        except Exception:
+            # Keep draining: the next change to these listings refreshes them.
+            logger.exception('Refreshing the neighbours of %d listings failed', len(listing_ids))
+
+
+def _queue_refresh(listing_ids):
+    global _draining
+    from ikr_project.celery import run_locally
+
+    with _pending_lock:
+        _pending.update(listing_ids)
+        if _draining:
+            return
+        _draining = True
+    run_locally(_drain_pending)
+
+
+def schedule_neighbour_refresh(listing_ids):
+    """Refresh the neighbours of `listing_ids` in the background once the current transaction commits."""
+    listing_ids = list(listing_ids)
+    if listing_ids:
+        transaction.on_commit(lambda: _queue_refresh(listing_ids))
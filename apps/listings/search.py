@@ -0,0 +1,275 @@
+"""
+Full-text search over listings.
+
+Every listing has a denormalized ListingSearchDocument row holding the text we
+search on (title, description, location, category, property type and
+amenities). The database keeps its own index of that row:
+
+- PostgreSQL: a generated, weighted ``tsvector`` column with a GIN index,
+  ranked with ``ts_rank_cd``.
+- SQLite: an FTS5 virtual table kept in sync by triggers, ranked with
+  ``bm25``.
+
+Any other backend (or SQLite built without FTS5) falls back to ``icontains``
+over the document, which is still a single-table scan instead of the old
+multi-join one.
+
+Views should only ever call ``search_listings``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, When
+
+from .models import Listing, ListingSearchDocument
+
+FTS_TABLE = 'listings_listingsearch_fts'
+SEARCH_VECTOR_COLUMN = 'search_vector'
+
+# Title matches count for more than matches in the rest of the document.
+SQLITE_BM25_WEIGHTS = (10.0, 1.0)
+MAX_TERMS = 10
+
+# SQL run by the migration that creates ListingSearchDocument.
+POSTGRESQL_INDEX_SQL = [
+    f"""
+    ALTER TABLE listings_listingsearchdocument
+    ADD COLUMN {SEARCH_VECTOR_COLUMN} tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(document, '')), 'B')
+    ) STORED
+    """,
+    f"""
+    CREATE INDEX listings_search_vector_gin
+    ON listings_listingsearchdocument USING GIN ({SEARCH_VECTOR_COLUMN})
+    """,
+]
+POSTGRESQL_DROP_INDEX_SQL = [
+    'DROP INDEX IF EXISTS listings_search_vector_gin',
+    f'ALTER TABLE listings_listingsearchdocument DROP COLUMN IF EXISTS {SEARCH_VECTOR_COLUMN}',
+]
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, document, tokenize='porter unicode61')",
+    f"""
+    CREATE TRIGGER listings_search_ai AFTER INSERT ON listings_listingsearchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, document) VALUES (new.listing_id, new.title, new.document);
+    END
+    """,
+    f"""
+    CREATE TRIGGER listings_search_ad AFTER DELETE ON listings_listingsearchdocument BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.listing_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER listings_search_au AFTER UPDATE ON listings_listingsearchdocument BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.listing_id;
+        INSERT INTO {FTS_TABLE}(rowid, title, document) VALUES (new.listing_id, new.title, new.document);
+    END
+    """,
+]
+SQLITE_DROP_INDEX_SQL = [
+    'DROP TRIGGER IF EXISTS listings_search_ai',
+    'DROP TRIGGER IF EXISTS listings_search_ad',
+    'DROP TRIGGER IF EXISTS listings_search_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_search_index(schema_editor):
+    """Create the backend-specific index. Called from the migration."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_INDEX_SQL
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return
+        statements = SQLITE_INDEX_SQL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_DROP_INDEX_SQL
+    elif vendor == 'sqlite':
+        statements = SQLITE_DROP_INDEX_SQL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def build_document(listing):
+    """Return the (title, document) pair indexed for a listing."""
+    parts = [listing.description]
+    if listing.location_id:
+        location = listing.location
+        parts.extend([location.name, location.city, location.state])
+    if listing.category_id:
+        parts.append(listing.category.name)
+    if listing.property_type_obj_id:
+        parts.append(listing.property_type_obj.name)
+    elif listing.property_type:
+        parts.append(listing.get_property_type_display())
+    parts.extend(amenity.name for amenity in listing.amenities.all())
+    return listing.title, ' '.join(part for part in parts if part)
+
+
+def index_listing(listing):
+    """Create or refresh the search document for a single listing."""
+    title, document = build_document(listing)
+    ListingSearchDocument.objects.update_or_create(
+        listing=listing,
+        defaults={'title': title, 'document': document},
+    )
+
+
+def index_listings(queryset, batch_size=500):
+    """Create or refresh search documents for every listing in `queryset`."""
+    queryset = queryset.select_related(
+        'location', 'category', 'property_type_obj'
+    ).prefetch_related('amenities').order_by('pk')
+    batch = []
+    count = 0
+    for listing in queryset.iterator(chunk_size=batch_size):
+        title, document = build_document(listing)
+        batch.append(ListingSearchDocument(listing=listing, title=title, document=document))
+        if len(batch) >= batch_size:
+            count += _upsert_documents(batch)
+            batch = []
+    if batch:
+        count += _upsert_documents(batch)
+    return count
+
+
+def _upsert_documents(documents):
+    ListingSearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['listing'],
+        update_fields=['title', 'document', 'updated_at'],
+    )
+    return len(documents)
+
+
+def search_terms(query):
+    """Split a free-text query into lower-cased word tokens."""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+_fts_table_cache = {}
+
+
+def _has_fts_table():
+    # Checked once per database rather than on every search.
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _fts_table_cache:
+        _fts_table_cache[key] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_table_cache[key]
+
+
+def _within(column, queryset):
+    """(SQL, params) restricting `column` to the pks of `queryset`, or ('', []) for every listing."""
+    if queryset is None:
+        return '', []
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    return f'AND {column} IN ({sql})', list(params)
+
+
+def _ranked_sql_postgresql(terms, limit, queryset):
+    # Every term must match, as a prefix so "apart" also finds "apartment".
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    within, within_params = _within('listing_id', queryset)
+    sql = f"""
+        SELECT listing_id
+        FROM listings_listingsearchdocument, to_tsquery('english', %s) query
+        WHERE {SEARCH_VECTOR_COLUMN} @@ query {within}
+        ORDER BY ts_rank_cd({SEARCH_VECTOR_COLUMN}, query) DESC, listing_id DESC
+        LIMIT %s
+    """
+    return sql, [tsquery, *within_params, limit]
+
+
+def _ranked_sql_sqlite(terms, limit, queryset):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    title_weight, document_weight = SQLITE_BM25_WEIGHTS
+    # Unary plus keeps FTS5 from using the rowid list as its index constraint,
+    # which would run MATCH once per listing in the caller's queryset instead
+    # of walking the full-text index.
+    within, within_params = _within('+rowid', queryset)
+    sql = f"""
+        SELECT rowid
+        FROM {FTS_TABLE}
+        WHERE {FTS_TABLE} MATCH %s {within}
+        ORDER BY bm25({FTS_TABLE}, {title_weight}, {document_weight}), rowid DESC
+        LIMIT %s
+    """
+    return sql, [match, *within_params, limit]
+
+
+def _ranked_ids_fallback(terms, limit, queryset):
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(document__icontains=term)
+    documents = ListingSearchDocument.objects.filter(condition)
+    if queryset is not None:
+        documents = documents.filter(listing_id__in=queryset.order_by().values('pk'))
+    return documents.order_by('-listing_id').values_list('listing_id', flat=True)[:limit]
+
+
+def ranked_query(query, limit=None, queryset=None):
+    """
+    The query ranked_listing_ids() runs: (SQL, params) on backends with a
+    full-text index, else a queryset of listing ids. None if nothing can match.
+    """
+    terms = search_terms(query)
+    if not terms or (queryset is not None and queryset.query.is_empty()):
+        return None
+    if limit is None:
+        limit = getattr(settings, 'LISTING_SEARCH_MAX_RESULTS', 1000)
+    if connection.vendor == 'postgresql':
+        return _ranked_sql_postgresql(terms, limit, queryset)
+    if connection.vendor == 'sqlite' and _has_fts_table():
+        return _ranked_sql_sqlite(terms, limit, queryset)
+    return _ranked_ids_fallback(terms, limit, queryset)
+
+
+def ranked_listing_ids(query, limit=None, queryset=None):
+    """
+    Return the ids of listings matching `query`, most relevant first. With a
+    `queryset` (of listings, or of models keyed by listing such as
+    ListingCard), only its listings are ranked, so the limit applies to
+    results the caller can show. At most `limit` ids are returned, by default
+    LISTING_SEARCH_MAX_RESULTS.
+    """
+    ranked = ranked_query(query, limit, queryset)
+    if ranked is None:
+        return []
+    if not isinstance(ranked, tuple):
+        return list(ranked)
+    with connection.cursor() as cursor:
+        cursor.execute(*ranked)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_listings(query, queryset=None, limit=None):
+    """
+    Filter `queryset` (all listings by default) down to those matching
+    `query` and order them by relevance.
+    """
+    ids = ranked_listing_ids(query, limit=limit, queryset=queryset)
+    if queryset is None:
+        queryset = Listing.objects.all()
+    if not ids:
+        return queryset.none()
+    relevance = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).order_by(relevance)
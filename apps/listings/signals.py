@@ -0,0 +1,198 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.agents.models import Agent
+from .cache import bump_versions, listing_namespace
+from .cards import refresh_cards
+from .models import Amenity, Category, Listing, ListingImage, ListingNeighbour, Location, PropertyType
+from .recommendations import schedule_neighbour_refresh
+from .search import index_listing, index_listings
+
+
+# Search index
+
+@receiver(post_save, sender=Listing)
+def update_listing_search_document(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_listing(instance)
+
+
+@receiver(m2m_changed, sender=Listing.amenities.through)
+def update_search_document_on_amenities_change(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Listing):
+        index_listing(instance)
+    else:
+        # Changed from the Amenity side: reindex every affected listing.
+        pk_set = kwargs.get('pk_set')
+        listings = Listing.objects.filter(pk__in=pk_set) if pk_set else instance.listings.all()
+        index_listings(listings)
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=PropertyType)
+@receiver(post_save, sender=Amenity)
+def update_search_documents_on_lookup_change(sender, instance, created, raw=False, **kwargs):
+    # A new lookup row cannot be referenced by any listing yet.
+    if raw or created:
+        return
+    index_listings(instance.listings.all())
+
+
+# Listing cards (see cards.py)
+
+@receiver(post_save, sender=Listing)
+def refresh_listing_card(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_cards([instance.pk])
+
+
+@receiver(post_save, sender=ListingImage)
+def refresh_card_on_image_change(sender, instance, raw=False, **kwargs):
+    # ListingImage.save() refreshes it again once the image's renditions are recorded.
+    if not raw:
+        refresh_cards([instance.listing_id])
+
+
+@receiver(post_delete, sender=ListingImage)
+def refresh_card_on_image_delete(sender, instance, **kwargs):
+    # Deletes cascade from e.g. a user to their listings, and a card refreshed
+    # before its listing is gone would be recreated: refresh after the commit.
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: refresh_cards([listing_id]))
+
+
+def _refresh_lookup_cards(listings):
+    # Cached pages show the cards too: the list, home and search pages
+    # ('listings') and each listing's related listings. Cards rendered from
+    # the listings themselves are cached per updated_at (see the end of
+    # this module).
+    listings = list(listings)
+    if listings:
+        listing_ids = [pk for pk, _ in listings]
+        Listing.objects.filter(pk__in=listing_ids).update(updated_at=timezone.now())
+        refresh_cards(listing_ids)
+        bump_versions('listings', *[listing_namespace(slug) for _, slug in listings])
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Agent)
+def refresh_cards_on_lookup_change(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    listings = instance.agent_listings if sender is Agent else instance.listings
+    _refresh_lookup_cards(listings.values_list('pk', 'slug'))
+
+
+@receiver(post_save, sender=get_user_model())
+def refresh_cards_on_agent_user_change(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Cards show the agent's username; logins only save last_login.
+    if raw or created or (update_fields is not None and 'username' not in update_fields):
+        return
+    _refresh_lookup_cards(Listing.objects.filter(agent__user=instance).values_list('pk', 'slug'))
+
+
+@receiver(pre_delete, sender=Location)
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Agent)
+def remember_carded_listings(sender, instance, **kwargs):
+    # Their listings are set to NULL by a queryset update, without signals.
+    listings = instance.agent_listings if sender is Agent else instance.listings
+    instance._carded_listings = list(listings.values_list('pk', 'slug'))
+
+
+@receiver(post_delete, sender=Location)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Agent)
+def refresh_cards_on_lookup_delete(sender, instance, **kwargs):
+    listings = getattr(instance, '_carded_listings', ())
+    transaction.on_commit(lambda: _refresh_lookup_cards(listings))
+
+
+# Related listings (see recommendations.py)
+
+@receiver(post_save, sender=Listing)
+def refresh_listing_neighbours(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_neighbour_refresh([instance.pk])
+
+
+@receiver(pre_delete, sender=Listing)
+def refresh_neighbours_on_delete(sender, instance, **kwargs):
+    # The deleted listing's rows cascade away; the listings that showed it
+    # need new neighbours.
+    schedule_neighbour_refresh(
+        ListingNeighbour.objects.filter(neighbour=instance).values_list('listing_id', flat=True)
+    )
+
+
+@receiver(m2m_changed, sender=Listing.amenities.through)
+def refresh_neighbours_on_amenities_change(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Listing):
+        schedule_neighbour_refresh([instance.pk])
+    else:
+        pk_set = kwargs.get('pk_set')
+        listings = Listing.objects.filter(pk__in=pk_set) if pk_set else instance.listings.all()
+        schedule_neighbour_refresh(listings.values_list('pk', flat=True))
+
+
+# Page cache invalidation (see cache.py)
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_cache(sender, instance, **kwargs):
+    bump_versions('listings', listing_namespace(instance.slug))
+
+
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+def invalidate_listing_image_cache(sender, instance, **kwargs):
+    slugs = Listing.objects.filter(pk=instance.listing_id).values_list('slug', flat=True)
+    bump_versions('listings', *[listing_namespace(slug) for slug in slugs])
+
+
+@receiver(m2m_changed, sender=Listing.amenities.through)
+def invalidate_cache_on_amenities_change(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Listing):
+        bump_versions(listing_namespace(instance.slug))
+    else:
+        pk_set = kwargs.get('pk_set')
+        listings = Listing.objects.filter(pk__in=pk_set) if pk_set else instance.listings.all()
+        bump_versions(*[listing_namespace(slug) for slug in listings.values_list('slug', flat=True)])
+
+
+@receiver(post_save, sender=Agent)
+@receiver(pre_delete, sender=Agent)
+def invalidate_agent_cache(sender, instance, **kwargs):
+    # The agent card is part of each of their listings' detail pages. Runs
+    # before a delete, while their listings still point at them.
+    slugs = Listing.objects.filter(agent_id=instance.pk).values_list('slug', flat=True)
+    bump_versions('agents', *[listing_namespace(slug) for slug in slugs])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    bump_versions('categories')
+
+
+# Rendered listing cards are cached per listing and updated_at (see
+# apps/pages/fragments.py); move it when something else on the card changes.
+# Locations, categories and agents do it in _refresh_lookup_cards.
+
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+def touch_listing_on_image_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Listing.objects.filter(pk=instance.listing_id).update(updated_at=timezone.now())
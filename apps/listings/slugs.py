@@ -0,0 +1,96 @@
+"""
+Unique slug allocation.
+
+Duplicates get a numeric suffix: ``garden-villa``, ``garden-villa-1``,
+``garden-villa-2``... Instead of probing candidates one query at a time, the
+allocator reads the highest suffix in use for a base slug in one query and
+takes the next one. Two concurrent saves can still pick the same slug, so
+`save_with_unique_slug` retries with a fresh allocation when the insert hits
+the unique constraint.
+
+Works for any model with a unique slug field; `allocate_slugs` is the bulk
+variant for importers.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, IntegerField, Max, Q
+from django.db.models.functions import Cast, Substr
+from django.utils.text import slugify
+
+# Longest suffix we leave room for when truncating the base slug ("-999999").
+SUFFIX_ROOM = 7
+MAX_ATTEMPTS = 5
+
+
+def base_slug(model, source, field='slug', fallback=None):
+    max_length = model._meta.get_field(field).max_length or 50
+    base = slugify(source)[:max_length - SUFFIX_ROOM].strip('-')
+    return base or fallback or model._meta.model_name
+
+
+def _suffixed(base, field):
+    # The prefix match can use the slug index; the regex then drops e.g.
+    # "villa-garden" when looking for suffixes of "villa".
+    return Q(**{f'{field}__startswith': f'{base}-', f'{field}__regex': rf'^{re.escape(base)}-[0-9]+$'})
+
+
+def next_slug(model, base, field='slug'):
+    """`base`, or `base`-<highest suffix in use + 1> if it is taken. One query."""
+    suffixed = _suffixed(base, field)
+    stats = model._default_manager.filter(Q(**{field: base}) | suffixed).aggregate(
+        taken=Count('pk', filter=Q(**{field: base})),
+        highest=Max(Cast(Substr(field, len(base) + 2), IntegerField()), filter=suffixed),
+    )
+    if not stats['taken']:
+        return base
+    return f"{base}-{(stats['highest'] or 0) + 1}"
+
+
+def allocate_slugs(model, sources, field='slug'):
+    """
+    A unique slug for each of `sources` (e.g. titles), unique among
+    themselves and against the table, using one query for the whole list.
+    """
+    bases = [base_slug(model, source, field) for source in sources]
+    condition = Q()
+    for base in set(bases):
+        condition |= Q(**{field: base}) | _suffixed(base, field)
+    wanted = set(bases)
+    taken, highest = set(), {}
+    for slug in model._default_manager.filter(condition).values_list(field, flat=True).iterator():
+        if slug in wanted:
+            taken.add(slug)
+        base, _, suffix = slug.rpartition('-')
+        if suffix.isdigit() and base in wanted:
+            highest[base] = max(highest.get(base, 0), int(suffix))
+
+    slugs = []
+    for base in bases:
+        if base not in taken:
+            taken.add(base)
+            slugs.append(base)
+        else:
+            highest[base] = highest.get(base, 0) + 1
+            slugs.append(f'{base}-{highest[base]}')
+    return slugs
+
+
+def save_with_unique_slug(instance, save, source, field='slug'):
+    """
+    Give `instance` a unique slug derived from `source` and call `save()`,
+    retrying with a newly allocated slug if a concurrent save took it first.
+    """
+    model = type(instance)
+    base = base_slug(model, source, field)
+    for attempt in range(MAX_ATTEMPTS):
+        setattr(instance, field, next_slug(model, base, field))
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            slug_taken = model._default_manager.filter(**{field: getattr(instance, field)}).exclude(
+                pk=instance.pk
+            ).exists()
+            if not slug_taken or attempt == MAX_ATTEMPTS - 1:
+                raise
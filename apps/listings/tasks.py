@@ -0,0 +1,19 @@
+from celery import shared_task
+
+from .images import process_listing_images, upload_staged_images
+from .recommendations import refresh_neighbours
+
+
+@shared_task(name='listings.process_listing_images')
+def process_listing_images_task(ids):
+    return process_listing_images(ids)
+
+
+@shared_task(name='listings.upload_staged_images')
+def upload_staged_images_task(ids):
+    return upload_staged_images(ids)
+
+
+@shared_task(name='listings.refresh_neighbours')
+def refresh_neighbours_task(ids):
+    return refresh_neighbours(ids)
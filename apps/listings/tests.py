@@ -0,0 +1,961 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+import cloudinary
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image as PILImage
+
+from apps.agents.models import Agent
+from apps.users.models import Profile
+from ikr_project import routers
+from .columns import ListingColumns, get_snapshot
+from .facets import facet_counts
+from .filters import ListingFilter
+from .geo import covering_cells, encode as encode_geohash
+from .images import process_listing_images, staging_storage, upload_staged_images
+from .models import (
+    Amenity, Category, Listing, ListingCard, ListingImage, ListingNeighbour, Location,
+)
+from . import recommendations
+from .recommendations import ListingFeatures, rebuild_neighbours, refresh_neighbours
+from .search import index_listings, ranked_listing_ids, search_listings
+from .tasks import upload_staged_images_task
+from . import cache as catalogue_cache
+from .slugs import allocate_slugs, next_slug
+
+User = get_user_model()
+
+
+def create_catalogue(listing_count=12, images_per_listing=3):
+    """A verified agent with `listing_count` published listings, each with images and amenities."""
+    user = User.objects.create_user(email='agent@example.com', username='agent', password='password')
+    Profile.objects.create(user=user, phone_number='0700000000')
+    agent = Agent.objects.create(
+        user=user, agency_name='IKR Realty', license_number='LIC-1',
+        verification_status='verified', is_featured=True,
+    )
+    location = Location.objects.create(name='Westlands', city='Nairobi', state='Nairobi', country='Kenya')
+    category = Category.objects.create(name='Apartments')
+    amenities = [Amenity.objects.create(name=name) for name in ('Pool', 'Gym')]
+    listings = []
+    for i in range(listing_count):
+        listing = Listing.objects.create(
+            user=user, agent=agent, location=location, category=category,
+            title=f'Apartment {i}', description='Spacious apartment', price=1000 + i,
+            is_published=True, is_featured=True,
+        )
+        listing.amenities.set(amenities)
+        for j in range(images_per_listing):
+            ListingImage.objects.create(listing=listing, image=f'listings/{i}-{j}.jpg')
+        listings.append(listing)
+    return agent, listings
+
+
+class ListingQuerySetTests(TestCase):
+    def test_first_image_becomes_main_image(self):
+        _, listings = create_catalogue(listing_count=1)
+        images = list(listings[0].images.order_by('pk'))
+        self.assertTrue(images[0].is_main)
+        self.assertFalse(any(image.is_main for image in images[1:]))
+
+    def test_for_cards_loads_main_image(self):
+        create_catalogue(listing_count=2)
+        listings = list(Listing.objects.for_cards())
+        with self.assertNumQueries(0):
+            for listing in listings:
+                self.assertTrue(listing.main_image.is_main)
+                listing.location.city
+                listing.agent.user.profile.phone_number
+
+
+class ListingViewQueryCountTests(TestCase):
+    """Query counts must not grow with the number of listings rendered."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_listing_list(self):
+        # Page, count, main images, categories; facet options (3) and counts.
+        with self.assertNumQueries(8):
+            response = self.client.get(reverse('listing_list'))
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+    def test_listing_list_search(self):
+        ranked_listing_ids('warm up')  # the first search on a connection looks for the FTS table
+        with self.assertNumQueries(10):
+            response = self.client.get(reverse('listing_list'), {'query': 'apartment'})
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+    def test_listing_detail(self):
+        rebuild_neighbours()
+        cache.clear()
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('listing_detail', args=[self.listings[0].slug]))
+        self.assertEqual(len(response.context['related_listings']), 4)
+
+
+class ListingSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=6, images_per_listing=0)
+        # The most relevant (newest) matches are unpublished.
+        for listing in cls.listings[3:]:
+            listing.is_published = False
+            listing.save()
+
+    def test_limit_applies_to_the_callers_listings(self):
+        published = Listing.objects.filter(is_published=True)
+        self.assertEqual(
+            list(search_listings('apartment', published, limit=3)), self.listings[2::-1],
+        )
+        self.assertEqual(
+            ranked_listing_ids('apartment', limit=2, queryset=ListingCard.objects.filter(is_published=True)),
+            [self.listings[2].pk, self.listings[1].pk],
+        )
+        self.assertEqual(ranked_listing_ids('apartment', queryset=published.none()), [])
+
+    def test_scoped_search_is_not_slower(self):
+        listings = Listing.objects.bulk_create([
+            Listing(user=self.agent.user, title=f'Modern apartment {i}', slug=f'modern-apartment-{i}', price=i)
+            for i in range(2000)
+        ])
+        index_listings(Listing.objects.filter(pk__in=[listing.pk for listing in listings]))
+        scope = Listing.objects.filter(price__gte=0)
+
+        def best_time(queryset):
+            timings = []
+            for _ in range(5):
+                started = time.perf_counter()
+                ids = ranked_listing_ids('apartment', queryset=queryset)
+                timings.append(time.perf_counter() - started)
+            return min(timings), ids
+
+        unscoped, all_ids = best_time(None)
+        scoped, scoped_ids = best_time(scope)
+        self.assertEqual(len(scoped_ids), 1000)
+        self.assertEqual(set(scoped_ids), set(all_ids) & set(scope.values_list('pk', flat=True)))
+        # Scoping must filter the full-text matches, not run the match per scoped row.
+        self.assertLess(scoped, unscoped * 3 + 0.005)
+
+
+class SharedCacheMixin:
+    """Use a file-based default cache, which other processes (and other cache instances) share."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(cls.cache_directory.cleanup)
+        cls.enterClassContext(override_settings(CACHES={
+            **settings.CACHES,
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cls.cache_directory.name},
+        }))
+        super().setUpClass()
+
+
+class ConditionalGetTests(SharedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=2, images_per_listing=0)
+        rebuild_neighbours()
+        cls.url = reverse('listing_detail', args=[cls.listings[0].slug])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_pages_are_not_modified(self):
+        urls = [self.url, reverse('listing_list'), reverse('home'), reverse('agents:agent_detail', args=[self.agent.pk])]
+        for url in urls:
+            response = self.client.get(url)
+            self.assertTrue(response.has_header('Last-Modified'))
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_changes_modify_pages(self):
+        etag = self.client.get(self.url)['ETag']
+        self.listings[0].save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        agent_url = reverse('agents:agent_detail', args=[self.agent.pk])
+        etag = self.client.get(agent_url)['ETag']
+        profile = self.agent.user.profile
+        profile.phone_number = '0711111111'
+        profile.save()
+        self.assertEqual(self.client.get(agent_url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_from_other_processes_modify_pages(self):
+        etag = self.client.get(self.url)['ETag']
+        other_process = FileBasedCache(self.cache_directory.name, {})
+        other_process.set(catalogue_cache._version_key('listings'), catalogue_cache._new_token(), None)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_no_validators_without_a_shared_cache(self):
+        with override_settings(CACHES={**settings.CACHES, 'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_signed_in_pages_vary_by_user(self):
+        anonymous = self.client.get(self.url)['ETag']
+        self.client.force_login(self.agent.user)
+        self.client.get(self.url)  # sets the CSRF cookie the inquiry form uses
+        response = self.client.get(self.url)
+        self.assertNotEqual(response['ETag'], anonymous)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.client.force_login(User.objects.create_user(email='buyer@example.com', username='buyer', password='x'))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_pending_messages_are_rendered(self):
+        self.client.force_login(self.agent.user)
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('agents:agent_detail', args=[self.agent.pk]), {'rating': '5'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=30, images_per_listing=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_walks_every_listing_once_and_back(self):
+        seen = []
+        response = self.client.get(reverse('listing_list'), {'paginate': 'cursor'})
+        pages = [response.context['page_obj']]
+        while pages[-1].has_next():
+            response = self.client.get(reverse('listing_list'), {'cursor': pages[-1].next_cursor})
+            pages.append(response.context['page_obj'])
+        for page in pages:
+            seen.extend(listing.pk for listing in page)
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(seen, sorted((listing.pk for listing in self.listings), reverse=True))
+        self.assertFalse(pages[0].has_previous())
+
+        response = self.client.get(reverse('listing_list'), {'cursor': pages[-1].previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), list(pages[1]))
+
+    def test_cursor_carries_filters(self):
+        response = self.client.get(reverse('listing_list'), {'paginate': 'cursor', 'max_price': 1019})
+        page = response.context['page_obj']
+        response = self.client.get(reverse('listing_list'), {'cursor': page.next_cursor})
+        prices = [listing.price for listing in response.context['page_obj']]
+        self.assertEqual(len(prices), 8)
+        self.assertTrue(all(price <= 1019 for price in prices))
+
+    def test_invalid_cursor_starts_over(self):
+        response = self.client.get(reverse('listing_list'), {'cursor': 'not-a-token'})
+        self.assertEqual(len(response.context['page_obj']), 12)
+
+
+IMPORT_CSV = """title,description,price,category,property_type,location,city,state,country,amenities,images,agent_email
+Garden Villa,Four bedrooms,250000,Villas,House,Karen,Nairobi,Nairobi,Kenya,Pool|Garden,a.jpg|b.jpg,
+Apartment 0,Duplicate title,90000,apartments,,Westlands,Nairobi,Nairobi,Kenya,gym,,agent@example.com
+Bad Price,Nope,lots,Villas,,,,,,,,
+,No title,1,,,,,,,,,
+"""
+
+
+class ImportListingsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=1, images_per_listing=0)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def import_listings(self, *args):
+        out, err = StringIO(), StringIO()
+        with mock.patch('apps.listings.importer.upload_image', side_effect=lambda source: {'image': f'listings/{source}', 'width': 800, 'height': 600}):
+            call_command('import_listings', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_csv(self):
+        path = self.write('listings.csv', IMPORT_CSV)
+        out, err = self.import_listings(path, '--agent', 'agent@example.com', '--publish')
+
+        self.assertIn('Imported 2 listings and 2 images from 4 rows', out)
+        self.assertIn('Row 3: price', err)
+        self.assertIn('Row 4: Missing title', err)
+
+        villa = Listing.objects.get(slug='garden-villa')
+        self.assertTrue(villa.is_published)
+        self.assertEqual(villa.agent, self.agent)
+        self.assertEqual(villa.category.name, 'Villas')
+        self.assertEqual(villa.property_type_obj.name, 'House')
+        self.assertEqual(villa.location.name, 'Karen')
+        self.assertEqual(sorted(villa.amenities.values_list('name', flat=True)), ['Garden', 'Pool'])
+        self.assertEqual(villa.main_image.image.public_id, 'listings/a')
+        self.assertEqual(villa.images.count(), 2)
+        self.assertEqual(search_listings('villa').get(), villa)
+
+        # Existing lookups are reused case-insensitively and slugs stay unique.
+        duplicate = Listing.objects.get(slug='apartment-0-1')
+        self.assertEqual(duplicate.category, self.listings[0].category)
+        self.assertEqual(duplicate.location, self.listings[0].location)
+        self.assertEqual(list(duplicate.amenities.values_list('name', flat=True)), ['Gym'])
+
+        self.agent.refresh_from_db()
+        self.assertEqual(self.agent.total_listings, 3)
+
+    def test_imported_listings_are_listed(self):
+        path = self.write('listings.csv', IMPORT_CSV)
+        self.import_listings(path, '--agent', 'agent@example.com', '--publish')
+
+        villa = Listing.objects.get(slug='garden-villa')
+        card = ListingCard.objects.get(pk=villa.pk)
+        self.assertEqual(card.category_name, 'Villas')
+        self.assertEqual(card.image, villa.main_image.card or {})
+        response = self.client.get(reverse('listing_list'))
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.assertContains(response, 'Garden Villa')
+
+    def test_import_jsonl_resumes_from_checkpoint(self):
+        rows = [{'title': f'Plot {i}', 'description': 'Land', 'price': 100 + i} for i in range(5)]
+        path = self.write('listings.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        checkpoint = self.write('checkpoint.json', json.dumps({'row': 3}))
+
+        out, _ = self.import_listings(path, '--owner', 'agent@example.com', '--checkpoint', checkpoint, '--batch-size', '1')
+        self.assertIn('Resuming after row 3.', out)
+        self.assertEqual(
+            sorted(Listing.objects.filter(title__startswith='Plot').values_list('title', flat=True)),
+            ['Plot 3', 'Plot 4'],
+        )
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['row'], 5)
+        self.assertFalse(Listing.objects.get(title='Plot 4').agent)
+
+
+class SlugAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, _ = create_catalogue(listing_count=0)
+
+    def create(self, title):
+        return Listing.objects.create(user=self.agent.user, title=title, description='x', price=1)
+
+    def test_duplicates_get_the_next_suffix(self):
+        slugs = [self.create('Garden Villa').slug for _ in range(3)]
+        self.assertEqual(slugs, ['garden-villa', 'garden-villa-1', 'garden-villa-2'])
+        self.create('Garden Villa Extension')  # not a numbered duplicate
+        Listing.objects.filter(slug='garden-villa-1').delete()
+        self.assertEqual(next_slug(Listing, 'garden-villa'), 'garden-villa-3')
+
+    def test_allocation_is_one_query_regardless_of_duplicates(self):
+        for _ in range(5):
+            self.create('Garden Villa')
+        with self.assertNumQueries(1):
+            self.assertEqual(next_slug(Listing, 'garden-villa'), 'garden-villa-5')
+
+    def test_retries_when_a_concurrent_save_takes_the_slug(self):
+        self.create('Garden Villa')
+        with mock.patch('apps.listings.slugs.next_slug', side_effect=['garden-villa', 'garden-villa-1']):
+            listing = self.create('Garden Villa')
+        self.assertEqual(listing.slug, 'garden-villa-1')
+
+    def test_bulk_allocation(self):
+        self.create('Garden Villa')
+        self.create('Garden Villa')
+        with self.assertNumQueries(1):
+            slugs = allocate_slugs(Listing, ['Garden Villa', 'Plot', 'Garden villa', 'Plot'])
+        self.assertEqual(slugs, ['garden-villa-2', 'plot', 'garden-villa-3', 'plot-1'])
+
+
+class ListingImageRenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=1, images_per_listing=0)
+
+    def setUp(self):
+        previous = cloudinary.config().cloud_name
+        cloudinary.config(cloud_name='demo')
+        self.addCleanup(cloudinary.config, cloud_name=previous)
+
+    def create_image(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            image = ListingImage.objects.create(listing=self.listings[0], image='image/upload/v12/listings/abc.jpg')
+        self.assertEqual(len(callbacks), 1)  # BlurHash processing is scheduled
+        return image
+
+    def test_renditions_are_memoized_on_save(self):
+        image = ListingImage.objects.get(pk=self.create_image().pk)
+        card = image.card
+        self.assertIn('/c_limit,f_auto,q_auto,w_640/v12/listings/abc', card['src'])
+        self.assertIn('w_320/v12/listings/abc.jpg 320w', card['srcset'])
+        self.assertNotIn('width', card)  # size unknown until processed
+
+    def test_processing_records_size_and_blurhash(self):
+        image = self.create_image()
+        picture = PILImage.new('RGB', (1000, 500), (200, 100, 50))
+        with mock.patch('apps.listings.images._download', return_value=picture):
+            self.assertEqual(process_listing_images([image.pk]), 1)
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (1000, 500))
+        self.assertEqual(image.placeholder_color, '#c86432')
+        self.assertEqual((image.card['width'], image.card['height']), (640, 320))
+        self.assertEqual((image.hero['width'], image.hero['height']), (1000, 500))
+        self.assertIn('w_1000/v12/listings/abc.jpg 1000w', image.hero['srcset'])
+        self.assertNotIn('2048w', image.hero['srcset'])
+
+    def test_card_renders_rendition(self):
+        image = self.create_image()
+        response = self.client.get(reverse('listing_list'))
+        self.assertContains(response, f'src="{image.card["src"]}"')
+        self.assertContains(response, 'srcset=')
+
+
+class ListingCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=2, images_per_listing=2)
+
+    def card(self, listing=None):
+        return ListingCard.objects.get(pk=(listing or self.listings[0]).pk)
+
+    def test_card_copies_what_the_card_template_shows(self):
+        listing = self.listings[0]
+        card = self.card()
+        self.assertEqual((card.title, card.slug, card.price), (listing.title, listing.slug, listing.price))
+        self.assertEqual(card.location_label, 'Westlands, Nairobi, Nairobi')
+        self.assertEqual(card.category_name, 'Apartments')
+        self.assertEqual(card.agent_name, 'agent')
+        self.assertEqual(card.image, listing.main_image.card or {})
+        self.assertTrue(card.is_published)
+
+    def test_source_changes_refresh_cards(self):
+        listing = self.listings[0]
+        listing.title = 'Renamed'
+        listing.save()
+        self.assertEqual(self.card().title, 'Renamed')
+
+        location = listing.location
+        location.name = 'Kilimani'
+        location.save()
+        category = listing.category
+        category.name = 'Flats'
+        category.save()
+        user = self.agent.user
+        user.username = 'broker'
+        user.save()
+        card = self.card(self.listings[1])
+        self.assertEqual(
+            (card.location_label, card.category_name, card.agent_name), ('Kilimani, Nairobi, Nairobi', 'Flats', 'broker'),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category.delete()
+        self.assertEqual(self.card().category_name, '')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.images.all().delete()
+        self.assertEqual(self.card().image, {})
+
+    def test_source_changes_invalidate_cached_pages(self):
+        cache.clear()
+        self.assertContains(self.client.get(reverse('listing_list')), 'Westlands, Nairobi, Nairobi')
+
+        location = self.listings[0].location
+        location.name = 'Kilimani'
+        location.save()
+        category = self.listings[0].category
+        category.name = 'Flats'
+        category.save()
+        user = self.agent.user
+        user.username = 'broker'
+        user.save()
+        response = self.client.get(reverse('listing_list'))
+        self.assertContains(response, 'Kilimani, Nairobi, Nairobi')
+        self.assertContains(response, 'Flats')
+        self.assertEqual({card.agent_name for card in response.context['page_obj']}, {'broker'})
+
+    def test_rebuild_command(self):
+        ListingCard.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_listing_cards', stdout=out)
+        self.assertIn('Rebuilt 2 listing cards', out.getvalue())
+        self.assertEqual(self.card().title, self.listings[0].title)
+
+    def test_pages_render_cards(self):
+        response = self.client.get(reverse('listing_list'))
+        self.assertTrue(all(isinstance(card, ListingCard) for card in response.context['page_obj']))
+        self.assertContains(response, 'Westlands, Nairobi, Nairobi')
+        self.assertContains(response, 'Apartments')
+        response = self.client.get(reverse('home'))
+        self.assertEqual(len(response.context['featured_listings']), 2)
+
+
+class StagedImageUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=1, images_per_listing=0)
+
+    def setUp(self):
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        settings_override = override_settings(LISTING_IMAGE_STAGING_ROOT=staging.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.agent.user)
+
+    def post_images(self, *names):
+        listing = self.listings[0]
+        with mock.patch('ikr_project.celery.enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('listing_update', args=[listing.slug]), {
+                    'title': listing.title, 'category': listing.category_id, 'location': listing.location_id,
+                    'status': 'available', 'description': listing.description, 'price': '1000',
+                    'images': [SimpleUploadedFile(name, b'image data', content_type='image/jpeg') for name in names],
+                })
+        self.assertRedirects(response, reverse('listing_detail', args=[listing.slug]))
+        images = list(listing.images.order_by('pk'))
+        self.assertIn(
+            mock.call(upload_staged_images_task, [image.pk for image in images]), enqueue.call_args_list,
+        )
+        return images
+
+    def test_form_stages_images_without_uploading(self):
+        with mock.patch('apps.listings.images.upload_image') as upload:
+            images = self.post_images('front.jpg', 'back.jpg')
+        upload.assert_not_called()
+        self.assertEqual([image.status for image in images], ['pending', 'pending'])
+        self.assertEqual([image.is_main for image in images], [True, False])
+        self.assertTrue(staging_storage().exists(images[0].staged_file))
+        # Pending images are not shown yet.
+        self.assertIsNone(Listing.objects.for_cards().get(pk=self.listings[0].pk).main_image)
+
+    def test_upload_marks_images_ready_or_failed(self):
+        front, back = self.post_images('front.jpg', 'back.jpg')
+
+        def upload(path):
+            if path.endswith('front.jpg'):
+                raise OSError('Cloudinary is unavailable')
+            return {'image': 'image/upload/v1/listings/back.jpg', 'width': 800, 'height': 600}
+
+        with self.assertLogs('apps.listings.images', 'WARNING'):
+            with self.captureOnCommitCallbacks():
+                self.assertEqual(upload_staged_images([front.pk, back.pk], upload=upload, workers=2), 1)
+        front.refresh_from_db()
+        back.refresh_from_db()
+        self.assertEqual((front.status, front.error, front.is_main), ('failed', 'Cloudinary is unavailable', False))
+        self.assertTrue(staging_storage().exists(front.staged_file))  # kept for --retry-uploads
+        self.assertEqual((back.status, back.is_main, back.staged_file), ('ready', True, ''))
+        self.assertEqual((back.width, back.height), (800, 600))
+        self.assertEqual(Listing.objects.for_cards().get(pk=self.listings[0].pk).main_image, back)
+        # Already claimed images are not uploaded twice.
+        self.assertEqual(upload_staged_images([back.pk], upload=upload), 0)
+
+
+class GeoSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, _ = create_catalogue(listing_count=0)
+        places = {
+            'Parklands': ('Nairobi', -1.2676, 36.8108),
+            'Karen': ('Nairobi', -1.3197, 36.7073),
+            'Nyali': ('Mombasa', -4.0435, 39.6682),
+            'Taveuni East': ('Taveuni', -16.9, 179.95),
+            'Taveuni West': ('Taveuni', -16.9, -179.95),
+        }
+        cls.listings = {}
+        for name, (city, lat, lng) in places.items():
+            location = Location.objects.create(
+                name=name, city=city, state=city, country='Kenya', latitude=lat, longitude=lng,
+            )
+            cls.listings[name] = Listing.objects.create(
+                user=cls.agent.user, agent=cls.agent, location=location, title=f'House in {name}',
+                description='House', price=1000, is_published=True,
+            )
+
+    def test_geohash(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(Location.objects.get(name='Parklands').geohash, encode_geohash(-1.2676, 36.8108))
+        cells = covering_cells(-1.4, 36.6, -1.2, 36.9)
+        self.assertLessEqual(len(cells), 16)
+        self.assertTrue(any(encode_geohash(-1.2676, 36.8108).startswith(cell) for cell in cells))
+
+    def test_within_radius_nearest_first(self):
+        results = list(Listing.objects.within(-1.2676, 36.8108, 20))
+        self.assertEqual(results, [self.listings['Parklands'], self.listings['Karen']])
+        self.assertAlmostEqual(results[0].distance_km, 0, places=3)
+        self.assertAlmostEqual(results[1].distance_km, 12.8, delta=0.3)
+        self.assertEqual(list(Listing.objects.within(-1.2676, 36.8108, 5)), [self.listings['Parklands']])
+        self.assertFalse(Listing.objects.within(0, 0, 50).exists())
+
+    def test_radius_query_does_not_grow_with_the_results(self):
+        near = str(Listing.objects.within(-1.2676, 36.8108, 20).query)
+        far = str(Listing.objects.within(-1.2676, 36.8108, 5).query)
+        self.assertNotIn('CASE', near)
+        # Only the location id list differs.
+        self.assertEqual(len(near) - len(far), len(f', {self.listings["Karen"].location_id}'))
+
+    def test_bounding_box(self):
+        nairobi = Listing.objects.in_box(-1.5, 36.5, -1.0, 37.0)
+        self.assertEqual(set(nairobi), {self.listings['Parklands'], self.listings['Karen']})
+        # A viewport across the antimeridian.
+        taveuni = Listing.objects.in_box(-17.5, 179.5, -16.5, -179.5)
+        self.assertEqual(set(taveuni), {self.listings['Taveuni East'], self.listings['Taveuni West']})
+        self.assertEqual(
+            list(Listing.objects.within(-16.9, 179.99, 20).values_list('title', flat=True)),
+            ['House in Taveuni East', 'House in Taveuni West'],
+        )
+
+    def test_filter_and_listing_page(self):
+        listings = Listing.objects.published()
+        near = ListingFilter({'lat': '-1.32', 'lng': '36.71', 'radius': '20'}, queryset=listings).qs
+        self.assertEqual(list(near), [self.listings['Karen'], self.listings['Parklands']])
+        # Without a position the radius is ignored.
+        self.assertEqual(ListingFilter({'radius': '20'}, queryset=listings).qs.count(), 5)
+        viewport = ListingFilter({'bbox': '-5,39,-3,40'}, queryset=listings).qs
+        self.assertEqual(list(viewport), [self.listings['Nyali']])
+        self.assertFalse(ListingFilter({'bbox': 'nowhere'}, queryset=listings).qs.exists())
+
+        response = self.client.get(reverse('listing_list'), {'lat': '-1.32', 'lng': '36.71', 'radius': '20'})
+        self.assertEqual([listing.pk for listing in response.context['page_obj']], [
+            self.listings['Karen'].pk, self.listings['Parklands'].pk,
+        ])
+        self.assertContains(response, 'km away')
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=4, images_per_listing=0)
+        cls.houses = Category.objects.create(name='Houses')
+        mombasa = Location.objects.create(name='Nyali', city='Mombasa', state='Mombasa', country='Kenya')
+        for i, (price, bedrooms) in enumerate([(800_000, 2), (6_000_000, 4)]):
+            Listing.objects.create(
+                user=cls.agent.user, agent=cls.agent, location=mombasa, category=cls.houses,
+                title=f'House {i}', description='House', price=price, bedrooms=bedrooms, is_published=True,
+            )
+        Listing.objects.filter(category__name='Apartments').update(bedrooms=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def counts(self, params):
+        filterset = ListingFilter(params, queryset=Listing.objects.published())
+        result = facet_counts(filterset)
+        return result['count'], {
+            facet['name']: {option['label']: option['count'] for option in facet['options']}
+            for facet in result['facets']
+        }
+
+    def test_counts_in_one_aggregate_query(self):
+        filterset = ListingFilter({'bedrooms': '3'}, queryset=Listing.objects.published())
+        filterset.is_valid()
+        with self.assertNumQueries(4):  # cities, categories, property types, counts
+            facet_counts(filterset)
+
+    def test_facets_ignore_their_own_selection(self):
+        total, facets = self.counts({})
+        self.assertEqual(total, 6)
+        self.assertEqual(facets['category'], {'Apartments': 4, 'Houses': 2})
+        self.assertEqual(facets['city'], {'Mombasa': 2, 'Nairobi': 4})
+        self.assertEqual(facets['price_band'], {'Under 1M': 5, '1M - 5M': 0, '5M - 10M': 1, '10M+': 0})
+        self.assertEqual(facets['bedrooms']['3+ beds'], 5)
+
+        total, facets = self.counts({'category': str(self.houses.pk)})
+        self.assertEqual(total, 2)
+        self.assertEqual(facets['category'], {'Apartments': 4, 'Houses': 2})
+        self.assertEqual(facets['city'], {'Mombasa': 2, 'Nairobi': 0})
+        self.assertEqual(facets['bedrooms']['3+ beds'], 1)
+
+        total, facets = self.counts({'category': str(self.houses.pk), 'price_band': 'under-1m', 'max_price': '900000'})
+        self.assertEqual(total, 1)
+        self.assertEqual(facets['category'], {'Apartments': 4, 'Houses': 1})
+        self.assertEqual(facets['price_band']['5M - 10M'], 0)
+
+    def test_listing_page_and_json(self):
+        response = self.client.get(reverse('listing_list'), {'city': 'mombasa'})
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertContains(response, 'Houses')
+        self.assertContains(response, '<input type="hidden" name="city" value="Mombasa">')
+
+        data = self.client.get(reverse('listing_facets'), {'city': 'Mombasa', 'page': '2'}).json()
+        self.assertEqual(data['count'], 2)
+        city = next(facet for facet in data['facets'] if facet['name'] == 'city')
+        mombasa = next(option for option in city['options'] if option['value'] == 'Mombasa')
+        self.assertTrue(mombasa['selected'])
+        self.assertEqual(mombasa['querystring'], '')  # selecting it again clears it
+
+
+@override_settings(LISTING_COLUMN_STORE=True)
+class ColumnStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, cls.listings = create_catalogue(listing_count=15, images_per_listing=1)
+        location = Location.objects.create(
+            name='Nyali', city='Mombasa', state='Mombasa', country='Kenya', latitude=-4.0435, longitude=39.6682,
+        )
+        houses = Category.objects.create(name='Houses')
+        for i, (price, bedrooms) in enumerate([(800_000, 2), (6_000_000, 4), (None, None)]):
+            Listing.objects.create(
+                user=cls.agent.user, agent=cls.agent, location=location, category=houses,
+                title=f'House {i}', description='House', price=price, bedrooms=bedrooms, is_published=True,
+            )
+        Listing.objects.create(user=cls.agent.user, title='Draft', description='Draft', price=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertMatchesOrm(self, params):
+        listings = Listing.objects.published().order_by('-created_at')
+        filterset = ListingFilter(params, queryset=listings)
+        filterset.is_valid()
+        ids, _ = ListingColumns.load().filter(filterset.form.cleaned_data)
+        self.assertEqual(ids, [listing.pk for listing in filterset.qs], params)
+
+    def test_filters_match_the_orm(self):
+        houses = Category.objects.get(name='Houses')
+        for params in [
+            {}, {'min_price': '1005'}, {'max_price': '1003', 'city': 'nairobi'},
+            {'category': str(houses.pk)}, {'price_band': 'under-1m'}, {'bedrooms': '3'},
+            {'bbox': '-5,39,-3,40'}, {'lat': '-4.04', 'lng': '39.66', 'radius': '10'},
+            {'city': 'Nowhere'}, {'bbox': 'invalid'},
+        ]:
+            self.assertMatchesOrm(params)
+
+    def test_search_is_not_supported(self):
+        self.assertIsNone(ListingColumns.load().filter({'query': 'apartment'}))
+
+    def test_listing_list_fetches_only_the_page(self):
+        self.client.get(reverse('listing_list'))  # build the snapshot
+        Listing.objects.filter(title='House 0').update(price=900_000)  # no signal, snapshot unchanged
+        # The page's cards; facet options (3) and counts. No COUNT(*).
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('listing_list'), {'city': 'Mombasa', 'max_price': '850000'})
+        self.assertEqual([listing.title for listing in response.context['page_obj']], ['House 0'])
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+
+        # Saving a listing bumps the catalogue version, so the snapshot is rebuilt.
+        Listing.objects.get(title='House 1').save()
+        response = self.client.get(reverse('listing_list'), {'city': 'Mombasa', 'max_price': '850000'})
+        self.assertEqual([listing.title for listing in response.context['page_obj']], [])
+
+    @override_settings(LISTING_COLUMN_STORE_MAX_AGE=60)
+    def test_snapshot_expires_without_a_shared_cache(self):
+        # Bumps from other processes never reach a local-memory cache.
+        snapshot = get_snapshot()
+        self.assertIs(get_snapshot(), snapshot)
+        with mock.patch('apps.listings.columns.time.monotonic', return_value=snapshot.loaded_at + 60):
+            self.assertIsNot(get_snapshot(), snapshot)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_column_store', '--repeat', '2', stdout=out, stderr=StringIO())
+        self.assertIn('Snapshot of 18 listings', out.getvalue())
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, _ = create_catalogue(listing_count=0)
+        user = cls.agent.user
+        nairobi = Location.objects.get(name='Westlands')
+        karen = Location.objects.create(name='Karen', city='Nairobi', state='Nairobi', country='Kenya')
+        mombasa = Location.objects.create(name='Nyali', city='Mombasa', state='Mombasa', country='Kenya')
+        apartments = Category.objects.get(name='Apartments')
+        houses = Category.objects.create(name='Houses')
+        pool, gym = Amenity.objects.all()
+
+        def listing(title, category, location, price, bedrooms, amenities=()):
+            listing = Listing.objects.create(
+                user=user, agent=cls.agent, title=title, description=title, category=category,
+                location=location, price=price, bedrooms=bedrooms, is_published=True,
+            )
+            listing.amenities.set(amenities)
+            return listing
+
+        cls.flat = listing('Westlands flat', apartments, nairobi, 100_000, 2, [pool, gym])
+        cls.twin = listing('Westlands twin', apartments, nairobi, 110_000, 2, [pool, gym])
+        cls.cousin = listing('Karen flat', apartments, karen, 120_000, 3, [pool])
+        cls.house = listing('Karen house', houses, karen, 900_000, 5)
+        cls.beach = listing('Nyali villa', houses, mombasa, 5_000_000, 6, [pool])
+
+    def neighbours(self, listing):
+        return list(listing.neighbours.order_by('rank').values_list('neighbour__title', flat=True))
+
+    def test_rebuild_ranks_by_similarity(self):
+        self.assertEqual(rebuild_neighbours(), 5)
+        self.assertEqual(self.neighbours(self.flat), ['Westlands twin', 'Karen flat', 'Karen house', 'Nyali villa'])
+        self.assertEqual(self.neighbours(self.house)[0], 'Nyali villa')
+        self.assertFalse(ListingNeighbour.objects.filter(listing=self.flat, neighbour=self.flat).exists())
+
+    def test_refresh_after_changes(self):
+        rebuild_neighbours()
+        # The house becomes a twin of the flat: the flat's list changes too.
+        Listing.objects.filter(pk=self.house.pk).update(
+            category=self.flat.category, location=self.flat.location, price=100_000, bedrooms=2,
+        )
+        self.house.amenities.set(self.flat.amenities.all())
+        refreshed = refresh_neighbours([self.house.pk])
+        self.assertIn(self.flat.pk, refreshed)
+        self.assertEqual(self.neighbours(self.flat)[0], 'Karen house')
+
+        # Unpublished listings drop out of everyone's neighbours.
+        Listing.objects.filter(pk=self.twin.pk).update(is_published=False)
+        refresh_neighbours([self.twin.pk])
+        self.assertFalse(ListingNeighbour.objects.filter(neighbour=self.twin).exists())
+        self.assertFalse(self.twin.neighbours.exists())
+        self.assertEqual(len(self.neighbours(self.flat)), 3)
+
+    def test_changes_schedule_a_refresh(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.flat.save()
+        self.assertTrue(callbacks)
+
+    @override_settings(NEIGHBOUR_REFRESH_DELAY=0)
+    def test_scheduled_refreshes_are_coalesced(self):
+        self.addCleanup(recommendations._pending.clear)
+        self.addCleanup(setattr, recommendations, '_draining', False)
+        with mock.patch('ikr_project.celery.run_locally') as run_locally:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.flat.save()
+                self.twin.save()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.house.save()
+        run_locally.assert_called_once_with(recommendations._drain_pending)
+        with mock.patch('apps.listings.recommendations.refresh_neighbours') as refresh:
+            recommendations._drain_pending()
+        refresh.assert_called_once_with(sorted([self.flat.pk, self.twin.pk, self.house.pk]))
+        self.assertFalse(recommendations._draining)
+
+    def test_refresh_reuses_the_feature_arrays(self):
+        rebuild_neighbours()
+        Listing.objects.filter(pk=self.house.pk).update(price=110_000)
+        with mock.patch.object(ListingFeatures, 'load', wraps=ListingFeatures.load) as load:
+            refresh_neighbours([self.house.pk])
+        # Only the changed listing's row is read again.
+        load.assert_called_once_with({self.house.pk})
+
+        # A listing unpublished without this process hearing about it.
+        Listing.objects.filter(pk=self.twin.pk).update(is_published=False)
+        features = recommendations.current_features([self.flat.pk])
+        self.assertNotIn(self.twin.pk, features.position)
+
+    def test_detail_page_reads_neighbours(self):
+        rebuild_neighbours()
+        cache.clear()
+        response = self.client.get(reverse('listing_detail', args=[self.flat.slug]))
+        self.assertEqual(
+            [listing.title for listing in response.context['related_listings']],
+            ['Westlands twin', 'Karen flat', 'Karen house', 'Nyali villa'],
+        )
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing against the development harness: the test database under a second alias."""
+    # Not TestCase: the replica connection only sees committed rows, and reads
+    # inside a transaction always go to the primary anyway.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        # Without a wrapping transaction on_commit work would start in background threads.
+        patcher = mock.patch('ikr_project.celery.enqueue')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.agent, self.listings = create_catalogue(listing_count=2, images_per_listing=0)
+
+    def replica_queries(self, *args, method='get', **kwargs):
+        cache.clear()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(*args, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return len(replica), response
+
+    def test_anonymous_catalogue_reads_use_the_replica(self):
+        count, response = self.replica_queries(reverse('listing_list'))
+        self.assertGreater(count, 0)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        count, _ = self.replica_queries(reverse('agents:agent_detail', args=[self.agent.pk]))
+        self.assertGreater(count, 0)
+        self.assertFalse(routers.reading_from_replica())
+
+    def test_signed_in_users_and_other_views_use_the_primary(self):
+        self.client.force_login(self.agent.user)
+        self.assertEqual(self.replica_queries(reverse('listing_list'))[0], 0)
+        self.assertEqual(self.replica_queries(reverse('agents:agent_dashboard'))[0], 0)
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        listing = self.listings[0]
+        self.client.force_login(self.agent.user)
+        count, response = self.replica_queries(reverse('listing_update', args=[listing.slug]), method='post', data={
+            'title': 'Renamed', 'category': listing.category_id, 'location': listing.location_id,
+            'status': 'available', 'description': listing.description, 'price': '1000',
+        })
+        self.assertEqual(count, 0)
+        pin = response.cookies[routers.READ_YOUR_WRITES_COOKIE].value
+        self.client.logout()  # which also drops every cookie
+        self.client.cookies[routers.READ_YOUR_WRITES_COOKIE] = pin
+        self.assertEqual(self.replica_queries(reverse('listing_detail', args=[listing.slug]))[0], 0)
+
+        # Once the window has passed, back to the replica.
+        self.client.cookies[routers.READ_YOUR_WRITES_COOKIE] = '0'
+        self.assertGreater(self.replica_queries(reverse('listing_detail', args=[listing.slug]))[0], 0)
+
+    def test_session_writes_do_not_pin(self):
+        response = self.client.post(reverse('account_login'), {'login': 'nobody@example.com', 'password': 'x'})
+        self.assertNotIn(routers.READ_YOUR_WRITES_COOKIE, response.cookies)
+
+    def test_replica_pages_are_cached_apart(self):
+        self.replica_queries(reverse('listing_list'))
+        token = routers._replica.set('replica')
+        try:
+            replica_key = catalogue_cache.cache_key('listing_list', ['listings'])
+            with override_settings(CATALOGUE_CACHE_TIMEOUT=900, REPLICA_CACHE_TIMEOUT=60):
+                self.assertEqual(catalogue_cache._timeout(), 60)
+        finally:
+            routers._replica.reset(token)
+        self.assertNotEqual(replica_key, catalogue_cache.cache_key('listing_list', ['listings']))
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Listing))
+        tokens = routers._replica.set('replica'), routers._wrote.set(False)
+        try:
+            self.assertEqual(router.db_for_read(Listing), 'replica')
+            self.assertEqual(router.db_for_read(Agent), 'replica')
+            self.assertIsNone(router.db_for_read(User))
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Listing))
+            self.assertEqual(router.db_for_write(Listing), 'default')
+            # Read-your-writes within the request too.
+            self.assertIsNone(router.db_for_read(Listing))
+        finally:
+            routers._replica.reset(tokens[0])
+            routers._wrote.reset(tokens[1])
+        self.assertFalse(router.allow_migrate('replica', 'listings'))
+        self.assertTrue(router.allow_migrate('default', 'listings'))
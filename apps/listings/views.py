@@ -1,46 +1,138 @@
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.paginator import Paginator
-from .models import Listing, Category, ListingImage
+from apps.inquiries.forms import InquiryForm
+from .models import Listing, Category, ListingCard, ListingNeighbour
 from .forms import ListingForm #, ListingSearchForm
+from .facets import facet_counts
 from .filters import ListingFilter
+from .images import stage_listing_images
+from . import cache as catalogue_cache
+from .cards import CardList, as_cards
+from .conditional import catalogue_condition
+from .pagination import CursorPaginator, InvalidCursor, filter_params, is_cursor_mode, read_cursor
 
+# Keyset ordering for cursor pagination; id breaks ties between equal timestamps.
+LISTING_CURSOR_ORDERING = ('-created_at', '-id')
 
-def listing_list(request):
-    listings = Listing.objects.filter(is_published=True, status='available').order_by('-created_at')
-    filter_form = ListingFilter(request.GET, queryset=listings)
-    listings = filter_form.qs
 
-    paginator = Paginator(listings, 12)  # 12 listings per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def _cached_facets(filter_form, params):
+    return catalogue_cache.get_or_set(
+        'listing_facets', ['listings', 'categories'],
+        lambda: facet_counts(filter_form, params), params=filter_params(params),
+    )
+
+
+def _filtered_cards(filter_form):
+    """
+    The cards of the filtered listings: filtered by the in-memory column
+    store when it is enabled and can evaluate the filters (see columns.py),
+    else by the database.
+    """
+    if settings.LISTING_COLUMN_STORE:
+        from .columns import filtered_listings
+
+        rows = filtered_listings(filter_form, ListingCard.objects.all())
+        if rows is not None:
+            return rows
+    return CardList(filter_form.qs)
 
-    categories = Category.objects.all()
+
+@catalogue_condition('listings', 'categories')
+def listing_list(request):
+    listings = Listing.objects.published().order_by('-created_at')
+    cursor_mode = is_cursor_mode(request)
+    if cursor_mode:
+        # The cursor token carries the filters it was created with.
+        cursor, params = read_cursor(request)
+    else:
+        params = request.GET
+    filter_form = ListingFilter(params, queryset=listings)
+
+    # 12 listings per page. The filtered page is cached per filter/page combination
+    # and only computed (filter_form.qs) on a miss.
+    if cursor_mode:
+        def cursor_page():
+            paginator = CursorPaginator(
+                filter_form.qs.only('pk', 'created_at'), 12, LISTING_CURSOR_ORDERING, filters=params,
+            )
+            try:
+                page = paginator.page(cursor)
+            except InvalidCursor:
+                page = paginator.page()
+            page.object_list = as_cards(page.object_list)
+            return page
+
+        page_obj = catalogue_cache.get_or_set(
+            'listing_list_cursor', ['listings'], cursor_page, params=request.GET,
+        )
+    else:
+        page_number = request.GET.get('page')
+        page_obj = catalogue_cache.cached_page(
+            'listing_list', ['listings'], lambda: _filtered_cards(filter_form), 12, page_number,
+            params=request.GET,
+        )
+
+    categories = catalogue_cache.get_or_set(
+        'categories', ['categories'], lambda: list(Category.objects.all()),
+    )
     # locations = Location.objects.all()
 
     return render(request, 'listings/listing_list.html', {
         'page_obj': page_obj,
+        'cursor_mode': cursor_mode,
+        'filter_querystring': filter_params(params).urlencode(),
         'filter_form': filter_form,
+        'facets': _cached_facets(filter_form, params),
         'categories': categories,
         # 'locations': locations,
+        **catalogue_cache.template_cache_context('listings'),
     })
 
 
+def listing_facets(request):
+    """Facet counts for the listing filters in the query string, as JSON."""
+    filter_form = ListingFilter(request.GET, queryset=Listing.objects.published())
+    return JsonResponse(_cached_facets(filter_form, request.GET))
+
+
+def _related_listings(listing, count=4):
+    """The cards of the listing's precomputed neighbours (see recommendations.py), or others in its category."""
+    neighbours = ListingNeighbour.objects.filter(listing=listing).order_by('rank').values_list('neighbour_id', flat=True)
+    # Neighbours unpublished since they were computed have no public card.
+    related = [card for card in as_cards(neighbours) if card.is_published and card.status == 'available'][:count]
+    if not related:
+        # Neighbours not computed yet.
+        others = Listing.objects.published().filter(category=listing.category).exclude(id=listing.id)
+        related = as_cards(others.values_list('pk', flat=True)[:count])
+    return related
+
+
+@catalogue_condition(lambda request, slug: catalogue_cache.listing_namespace(slug), 'listings', 'categories')
 def listing_detail(request, slug):
-    listing = get_object_or_404(Listing, slug=slug, is_published=True)
+    listing = catalogue_cache.get_or_set(
+        'listing_detail',
+        [catalogue_cache.listing_namespace(slug), 'categories'],
+        lambda: get_object_or_404(Listing.objects.for_detail(), slug=slug, is_published=True),
+        params={'slug': slug},
+    )
     # listing.views_count += 1
     # listing.save(update_fields=['views_count'])
 
-    related_listings = Listing.objects.filter(
-        category=listing.category,
-        is_published=True,
-        status='available'
-    ).exclude(id=listing.id)[:4]
+    related_listings = catalogue_cache.get_or_set(
+        'related_listings',
+        ['listings', catalogue_cache.listing_namespace(slug)],
+        lambda: _related_listings(listing),
+        params={'listing': listing.pk},
+    )
 
     return render(request, 'listings/listing_detail.html', {
         'listing': listing,
         'related_listings': related_listings,
+        'form': InquiryForm(),
+        **catalogue_cache.template_cache_context('listings'),
     })
 
 
@@ -72,13 +164,12 @@ def listing_create(request):
                 listing.status = listing.status or 'available'
             listing.save()
 
-            # Handle image uploads (support multiple files)
-            images = request.FILES.getlist('images')
-            if images:
-                for idx, image in enumerate(images):
-                    ListingImage.objects.create(listing=listing, image=image, is_main=(idx == 0))
+            # Images are uploaded to Cloudinary in the background.
+            images = stage_listing_images(listing, request.FILES.getlist('images'))
 
             messages.success(request, 'Listing created successfully.')
+            if images:
+                messages.info(request, f'{len(images)} image(s) are being processed and will appear shortly.')
             return redirect('listing_detail', slug=listing.slug)
     else:
         form = ListingForm()
@@ -100,12 +191,12 @@ def listing_update(request, slug):
         if form.is_valid():
             listing = form.save()
 
-            # Handle new image uploads
-            images = request.FILES.getlist('images')
-            for image in images:
-                ListingImage.objects.create(listing=listing, image=image)
+            # New images are uploaded to Cloudinary in the background.
+            images = stage_listing_images(listing, request.FILES.getlist('images'))
 
             messages.success(request, 'Listing updated successfully.')
+            if images:
+                messages.info(request, f'{len(images)} image(s) are being processed and will appear shortly.')
             return redirect('listing_detail', slug=listing.slug)
     else:
         form = ListingForm(instance=listing)
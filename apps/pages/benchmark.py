@@ -0,0 +1,343 @@
+"""
+Benchmarks of the public hot paths.
+
+Two drivers measure the same scenarios (a name and a path each):
+
+- `run_client` requests each path in-process with Django's test client, one
+  request at a time, counting the SQL queries of every request. Latency here
+  is the cost of the view, middleware and templates alone.
+- `run_wsgi` is a small load generator: `concurrency` threads issue HTTP
+  requests for `duration` seconds against a server, either one at
+  `base_url` (gunicorn, a staging host, ...) or the project's WSGI
+  application served in-process on an ephemeral port. It reports throughput
+  too, and query counts when the server sends a Server-Timing header (see
+  ikr_project/profiling.py).
+
+`run_templates` renders the same pages in-process and reports where template
+rendering time goes instead, per template (base.html, each partial, ...).
+
+Results are {scenario: stats} dicts ({template: stats} for templates); a baseline is a JSON file holding them
+with some context (commit, database, dataset size), and `compare` reports
+how a new run differs from one.
+"""
+import http.client
+import json
+import platform
+import re
+import statistics
+import subprocess
+import threading
+import time
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.db import connection
+from django.template.base import Template
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from apps.listings.cache import bump_versions
+from apps.listings.models import Listing
+
+PERCENTILES = (50, 90, 95, 99)
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries')
+
+
+def default_scenarios():
+    """(name, path) pairs for the public hot paths."""
+    scenarios = [
+        ('home', reverse('home')),
+        ('listing_list', reverse('listing_list')),
+        ('listing_list_page_5', reverse('listing_list') + '?page=5'),
+        ('listing_list_filtered', reverse('listing_list') + '?bedrooms=3&price_band=1m-5m'),
+        ('listing_list_nearby', reverse('listing_list') + '?lat=-1.2921&lng=36.8219&radius=10'),
+        ('listing_list_cursor', reverse('listing_list') + '?paginate=cursor'),
+        ('search', reverse('search') + '?q=apartment'),
+        ('search_two_terms', reverse('search') + '?q=garden+nairobi'),
+        ('agent_list', reverse('agents:agent_list')),
+    ]
+    slug = Listing.objects.published().order_by('-created_at').values_list('slug', flat=True).first()
+    if slug:
+        scenarios.append(('listing_detail', reverse('listing_detail', args=[slug])))
+    return scenarios
+
+
+def summarize(latencies, queries=(), errors=0, elapsed=None):
+    """Stats for one scenario; latencies in seconds."""
+    stats = {'requests': len(latencies), 'errors': errors}
+    if latencies:
+        ordered = sorted(latencies)
+        for percentile in PERCENTILES:
+            index = min(len(ordered) - 1, max(0, round(percentile / 100 * len(ordered)) - 1))
+            stats[f'p{percentile}_ms'] = round(ordered[index] * 1000, 3)
+        stats['mean_ms'] = round(statistics.fmean(ordered) * 1000, 3)
+        stats['max_ms'] = round(ordered[-1] * 1000, 3)
+    if elapsed:
+        stats['throughput_rps'] = round(len(latencies) / elapsed, 2)
+    if queries:
+        stats['queries'] = statistics.median_low(queries)
+        stats['queries_max'] = max(queries)
+    return stats
+
+
+def run_client(scenarios, requests=100, warmup=5, cold=False, host='localhost'):
+    """
+    Time `requests` sequential test-client requests per scenario. With
+    `cold`, the catalogue cache is invalidated before every request, so the
+    views do all their work instead of serving cached pages.
+    """
+    client = Client(HTTP_HOST=host)
+    results = {}
+    for name, path in scenarios:
+        for _ in range(warmup):
+            client.get(path, secure=True)
+        latencies, queries, errors = [], [], 0
+        for _ in range(requests):
+            if cold:
+                bump_versions('listings', 'agents', 'categories')
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(path, secure=True)
+                latencies.append(time.perf_counter() - start)
+            queries.append(len(captured))
+            errors += response.status_code >= 400
+        results[name] = summarize(latencies, queries, errors, elapsed=sum(latencies))
+    return results
+
+
+class template_timer:
+    """
+    Time every template render while active (not thread-safe). `timings` is
+    {template name: [renders, seconds, self seconds]}; a template's self time
+    excludes the templates it includes or extends.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self._children = []
+
+    def __enter__(self):
+        # Included templates are rendered through render() and parents of
+        # {% extends %} through _render(); _render() sees both.
+        self._original = original = Template._render
+        timings, children = self.timings, self._children
+
+        def timed_render(template, context):
+            children.append(0.0)
+            start = time.perf_counter()
+            try:
+                return original(template, context)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = children.pop()
+                if children:
+                    children[-1] += elapsed
+                totals = timings.setdefault(template.name or '<string>', [0, 0.0, 0.0])
+                totals[0] += 1
+                totals[1] += elapsed
+                totals[2] += elapsed - nested
+
+        Template._render = timed_render
+        return self
+
+    def __exit__(self, *exc_info):
+        Template._render = self._original
+
+
+def run_templates(scenarios, requests=20, warmup=2, cold=False, host='localhost'):
+    """
+    Per-template render times over `requests` test-client requests per
+    scenario, slowest (by total self time) first. With `cold`, the catalogue
+    cache is invalidated before every request and fragments aren't cached.
+    """
+    client = Client(HTTP_HOST=host)
+    for name, path in scenarios:
+        for _ in range(warmup):
+            client.get(path, secure=True)
+    fragments = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'} if cold else settings.CACHES['fragments']
+    with override_settings(CACHES={**settings.CACHES, 'fragments': fragments}), template_timer() as timer:
+        for name, path in scenarios:
+            for _ in range(requests):
+                if cold:
+                    bump_versions('listings', 'agents', 'categories')
+                client.get(path, secure=True)
+    total_requests = requests * len(scenarios)
+    results = {}
+    for template, (renders, seconds, self_seconds) in sorted(
+        timer.timings.items(), key=lambda item: -item[1][2],
+    ):
+        results[template] = {
+            'renders': renders,
+            'renders_per_request': round(renders / total_requests, 2),
+            'mean_ms': round(seconds / renders * 1000, 3),
+            'self_mean_ms': round(self_seconds / renders * 1000, 3),
+            'total_ms': round(seconds * 1000, 3),
+            'self_total_ms': round(self_seconds * 1000, 3),
+        }
+    return results
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class serve:
+    """Serve a WSGI application on an ephemeral localhost port, in a background thread."""
+
+    def __init__(self, application):
+        self.server = make_server(
+            '127.0.0.1', 0, application, server_class=_ThreadingWSGIServer, handler_class=_QuietHandler,
+        )
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _drive(base_url, path, deadline, max_requests, host, results, lock):
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    latencies, queries, errors = [], [], 0
+    conn = None
+    while time.perf_counter() < deadline and (max_requests is None or len(latencies) < max_requests):
+        if conn is None:
+            conn = connection_class(url.netloc, timeout=30)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', url.path.rstrip('/') + path, headers={'Host': host or url.netloc})
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        errors += response.status >= 400
+        match = SERVER_TIMING_QUERIES.search(response.getheader('Server-Timing') or '')
+        if match:
+            queries.append(int(match.group(1)))
+        if response.will_close:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+    with lock:
+        results['latencies'] += latencies
+        results['queries'] += queries
+        results['errors'] += errors
+
+
+def run_wsgi(scenarios, base_url, duration=10.0, concurrency=8, max_requests=None, warmup=5, host=None):
+    """
+    Load each scenario for `duration` seconds (or until each of the
+    `concurrency` threads has made `max_requests` requests).
+    """
+    results = {}
+    for name, path in scenarios:
+        lock = threading.Lock()
+        _drive(base_url, path, time.perf_counter() + 60, warmup, host, {'latencies': [], 'queries': [], 'errors': 0}, lock)
+        collected = {'latencies': [], 'queries': [], 'errors': 0}
+        threads = [
+            threading.Thread(
+                target=_drive, args=(base_url, path, time.perf_counter() + duration, max_requests, host, collected, lock),
+            )
+            for _ in range(concurrency)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        results[name] = summarize(collected['latencies'], collected['queries'], collected['errors'], elapsed)
+        results[name]['concurrency'] = concurrency
+    return results
+
+
+def metadata(dataset=None):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit,
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'dataset': dataset or {},
+    }
+
+
+def dataset_size():
+    from apps.agents.models import Agent
+    from apps.inquiries.models import Inquiry
+    from apps.listings.models import ListingImage
+
+    return {
+        'listings': Listing.objects.count(),
+        'published_listings': Listing.objects.published().count(),
+        'agents': Agent.objects.count(),
+        'inquiries': Inquiry.objects.count(),
+        'images': ListingImage.objects.count(),
+    }
+
+
+def write_baseline(path, results, meta):
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def read_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _change(old, new):
+    if not old:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(baseline, results, threshold=10.0):
+    """
+    [(mode, scenario, metric, old, new, change %, regressed)] for every
+    metric present in both. Latency and query counts regress when they grow,
+    throughput when it drops, by more than `threshold` percent (any growth,
+    for query counts).
+    """
+    rows = []
+    for mode, scenarios in results.items():
+        for name, new_stats in scenarios.items():
+            old_stats = baseline.get('results', {}).get(mode, {}).get(name)
+            if not old_stats:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries'):
+                if metric not in old_stats or metric not in new_stats:
+                    continue
+                old, new = old_stats[metric], new_stats[metric]
+                change = _change(old, new)
+                if metric == 'queries':
+                    regressed = new > old
+                elif metric == 'throughput_rps':
+                    regressed = change is not None and change < -threshold
+                else:
+                    regressed = change is not None and change > threshold
+                rows.append((mode, name, metric, old, new, change, regressed))
+    return rows
@@ -0,0 +1,94 @@
+"""
+Template compilation and fragment caching.
+
+Templates are compiled once per process by the cached loader (see TEMPLATES
+in settings). `precompile` compiles every template up front, so the first
+requests a worker serves don't pay for it: gunicorn.conf.py runs it as each
+worker boots, and the warm_templates command runs it as a check that every
+template compiles.
+
+Parts of pages that rarely change are cached as rendered HTML, in the
+``fragments`` cache (a dummy cache in development, where templates change
+under a running server):
+
+- the navbar, per sign-in state and whether it shows the dashboard link;
+- the footer;
+- listing cards, per listing and its ``updated_at`` (changes to a listing's
+  images, location, category or agent move it too, see
+  apps/listings/signals.py).
+
+They use ``{% cache fragment_timeout <name> fragment_version ... using="fragments" %}``
+with the context from `fragment_cache`, a context processor.
+``fragment_version`` is a digest of every template's source and of the
+static files manifest, so after a deploy that changes either no fragment
+rendered by the old ones (or linking old static files) is served.
+"""
+import functools
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template import TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+
+
+def _django_engines():
+    return [backend.engine for backend in engines.all() if isinstance(backend, DjangoTemplates)]
+
+
+def template_files():
+    """{template name: path} of every template the project can load, first match winning as in the loaders."""
+    files = {}
+    for engine in _django_engines():
+        for loader in engine.template_loaders:
+            for directory in loader.get_dirs() if hasattr(loader, 'get_dirs') else ():
+                for root, dirnames, filenames in os.walk(directory):
+                    dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+                    for filename in sorted(filenames):
+                        if filename.startswith('.'):
+                            continue
+                        path = os.path.join(root, filename)
+                        name = os.path.relpath(path, directory).replace(os.sep, '/')
+                        files.setdefault(name, path)
+    return files
+
+
+@functools.cache
+def templates_digest():
+    """A short digest of every template's name and source, stable across processes."""
+    digest = hashlib.sha256()
+    # Hashed static file names (ManifestStaticFilesStorage) end up in fragments too.
+    digest.update((getattr(staticfiles_storage, 'manifest_hash', None) or '').encode())
+    for name, path in sorted(template_files().items()):
+        digest.update(name.encode())
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:12]
+
+
+def precompile():
+    """
+    Compile every template into the cached loaders. Returns (number
+    compiled, {name: error} for the ones that failed).
+    """
+    compiled, failed = 0, {}
+    names = template_files()
+    for engine in _django_engines():
+        for name in names:
+            try:
+                engine.get_template(name)
+            except (TemplateSyntaxError, UnicodeDecodeError) as error:
+                failed[name] = error
+            else:
+                compiled += 1
+    templates_digest()
+    return compiled, failed
+
+
+def fragment_cache(request):
+    """Context for `{% cache fragment_timeout <name> fragment_version ... %}` fragments."""
+    return {
+        'fragment_timeout': getattr(settings, 'TEMPLATE_FRAGMENT_TIMEOUT', 60 * 60 * 24),
+        'fragment_version': templates_digest(),
+    }
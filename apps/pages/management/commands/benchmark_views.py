@@ -0,0 +1,120 @@
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from apps.pages import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the public hot paths (home, listing_list, search, agent_list, '
+        'listing_detail) with the test client and/or a threaded HTTP load driver, '
+        'and records latency percentiles, throughput and query counts to a JSON '
+        'baseline that later runs can be compared with. --mode templates reports '
+        'render time per template instead.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=('client', 'wsgi', 'both', 'templates'), default='client')
+        parser.add_argument('--requests', type=int, default=100, help='Requests per scenario (client and templates modes).')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--cold', action='store_true', help='Invalidate the catalogue cache before each request (client and templates modes).')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per scenario (wsgi mode).')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent connections (wsgi mode).')
+        parser.add_argument(
+            '--base-url',
+            help='Load an already running server (wsgi mode); by default the project is served in-process.',
+        )
+        parser.add_argument('--host', default='localhost', help='Host header to send (must be in ALLOWED_HOSTS).')
+        parser.add_argument('--scenario', action='append', default=[], help='Only run this scenario (repeatable).')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--compare', help='Compare the results with this JSON baseline.')
+        parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold, in percent.')
+        parser.add_argument(
+            '--fail-on-regression', action='store_true', help='Exit with an error if anything regressed.',
+        )
+
+    def handle(self, *args, **options):
+        scenarios = benchmark.default_scenarios()
+        if options['scenario']:
+            unknown = set(options['scenario']) - {name for name, _ in scenarios}
+            if unknown:
+                raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+            scenarios = [(name, path) for name, path in scenarios if name in options['scenario']]
+        baseline = benchmark.read_baseline(options['compare']) if options['compare'] else None
+
+        results = {}
+        if options['mode'] in ('client', 'both'):
+            results['client'] = benchmark.run_client(
+                scenarios, requests=options['requests'], warmup=options['warmup'],
+                cold=options['cold'], host=options['host'],
+            )
+            self.report('client', results['client'])
+        if options['mode'] in ('wsgi', 'both'):
+            results['wsgi'] = self.run_wsgi(scenarios, options)
+            self.report('wsgi', results['wsgi'])
+        if options['mode'] == 'templates':
+            results['templates'] = benchmark.run_templates(
+                scenarios, requests=options['requests'], warmup=options['warmup'],
+                cold=options['cold'], host=options['host'],
+            )
+            self.report_templates(results['templates'])
+
+        if options['output']:
+            meta = benchmark.metadata(benchmark.dataset_size())
+            meta['options'] = {
+                name: options[name] for name in ('requests', 'warmup', 'cold', 'duration', 'concurrency')
+            }
+            benchmark.write_baseline(options['output'], results, meta)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if baseline is not None:
+            self.report_comparison(baseline, results, options)
+
+    def run_wsgi(self, scenarios, options):
+        kwargs = {
+            'duration': options['duration'], 'concurrency': options['concurrency'],
+            'warmup': options['warmup'], 'host': options['host'],
+        }
+        if options['base_url']:
+            return benchmark.run_wsgi(scenarios, options['base_url'], **kwargs)
+        # In-process: plain HTTP, and Server-Timing on so query counts come back.
+        with override_settings(SECURE_SSL_REDIRECT=False, PROFILING_SERVER_TIMING=True):
+            with benchmark.serve(WSGIHandler()) as base_url:
+                return benchmark.run_wsgi(scenarios, base_url, **kwargs)
+
+    def report(self, mode, results):
+        self.stdout.write(f'\n{mode}')
+        self.stdout.write(
+            f'{"scenario":<24} {"requests":>8} {"errors":>6} {"p50 ms":>8} {"p90 ms":>8} {"p95 ms":>8} '
+            f'{"p99 ms":>8} {"req/s":>8} {"queries":>8}'
+        )
+        for name, stats in results.items():
+            self.stdout.write(
+                f'{name:<24} {stats["requests"]:>8} {stats["errors"]:>6} '
+                + ' '.join(f'{stats.get(key, 0):>8.1f}' for key in ('p50_ms', 'p90_ms', 'p95_ms', 'p99_ms', 'throughput_rps'))
+                + f' {stats.get("queries", "-"):>8}'
+            )
+
+    def report_templates(self, results):
+        self.stdout.write('\ntemplates (slowest self time first; self excludes included and extended templates)')
+        self.stdout.write(
+            f'{"template":<48} {"renders":>8} {"per req":>8} {"mean ms":>8} {"self ms":>8} {"total ms":>9} {"self total":>10}'
+        )
+        for name, stats in results.items():
+            self.stdout.write(
+                f'{name:<48} {stats["renders"]:>8} {stats["renders_per_request"]:>8.2f} {stats["mean_ms"]:>8.3f} '
+                f'{stats["self_mean_ms"]:>8.3f} {stats["total_ms"]:>9.1f} {stats["self_total_ms"]:>10.1f}'
+            )
+
+    def report_comparison(self, baseline, results, options):
+        rows = benchmark.compare(baseline, results, options['threshold'])
+        meta = baseline.get('meta', {})
+        self.stdout.write(f'\nCompared with {options["compare"]} (commit {meta.get("commit") or "?"}, {meta.get("created", "?")})')
+        regressions = 0
+        for mode, name, metric, old, new, change, regressed in rows:
+            regressions += regressed
+            change = '' if change is None else f'{change:+.1f}%'
+            line = f'{mode:<7} {name:<24} {metric:<15} {old:>10} {new:>10} {change:>9}'
+            self.stdout.write(self.style.ERROR(line + '  REGRESSION') if regressed else line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{regressions} metric(s) regressed by more than {options["threshold"]}%.')
@@ -0,0 +1,60 @@
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from ikr_project.profiling import query_budget
+
+DEFAULT_PATHS = (
+    ('home', ''),
+    ('search', 'q=apartment'),
+    ('listing_list', ''),
+    ('listing_list', 'bedrooms=3'),
+    ('listing_facets', ''),
+    ('agents:agent_list', ''),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Requests pages in-process and prints what the profiling middleware '
+        'recorded for each: wall time, queries, duplicate queries, cache hits '
+        'and misses, template time, and the view\'s query budget.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--host', default='localhost', help='Host header to send (must be in ALLOWED_HOSTS).')
+        parser.add_argument('paths', nargs='*', metavar='PATH', help='Paths to request instead of the built-in ones.')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [
+            reverse(name) + (f'?{querystring}' if querystring else '') for name, querystring in DEFAULT_PATHS
+        ]
+        client = Client(HTTP_HOST=options['host'])
+        self.stdout.write(
+            f'{"path":<40} {"view":<28} {"status":>6} {"ms":>8} {"first ms":>9} {"queries":>8} '
+            f'{"dup":>4} {"cache":>9} {"tpl ms":>7} {"budget":>7}'
+        )
+        over = 0
+        for path in paths:
+            profiles = []
+            for _ in range(options['repeat']):
+                response = client.get(path, secure=True)
+                profiles.append(response.wsgi_request.profile)
+            first, last = profiles[0], profiles[-1]
+            budget = query_budget(first.view)
+            if budget is not None and first.queries > budget:
+                over += 1
+            # The first request runs with whatever the cache held; later ones are warm.
+            self.stdout.write(
+                f'{path:<40} {first.view:<28} {first.status:>6} '
+                f'{statistics.median(profile.seconds for profile in profiles) * 1000:>8.1f} '
+                f'{first.seconds * 1000:>9.1f} {f"{first.queries}/{last.queries}":>8} '
+                f'{first.duplicate_queries:>4} {f"{last.cache_hits}/{last.cache_misses}":>9} '
+                f'{statistics.median(profile.template_seconds for profile in profiles) * 1000:>7.1f} '
+                f'{"-" if budget is None else budget:>7}'
+            )
+        if over:
+            self.stderr.write(f'{over} path(s) over their query budget on the first request.')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.listings.recommendations import rebuild_neighbours
+from apps.pages import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the database with a synthetic catalogue for benchmark_views: '
+        'agents, buyers, listings with images and amenities, and inquiries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100_000)
+        parser.add_argument('--agents', type=int, default=5_000)
+        parser.add_argument('--buyers', type=int, default=20_000)
+        parser.add_argument('--inquiries', type=int, default=1_000_000)
+        parser.add_argument('--images-per-listing', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--neighbours', action='store_true',
+            help='Also precompute related listings (slow for large catalogues).',
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete previously generated data first (or only, with --listings 0).',
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted = synthetic.clear()
+            self.stdout.write(f'Deleted {deleted} synthetic rows.')
+            if not options['listings']:
+                return
+        try:
+            counts = synthetic.generate(
+                listings=options['listings'], agents=options['agents'], buyers=options['buyers'],
+                inquiries=options['inquiries'], images_per_listing=options['images_per_listing'],
+                seed=options['seed'], batch_size=options['batch_size'], log=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(f'{exc} (use --clear)')
+        if options['neighbours']:
+            self.stdout.write(f'Related listings computed for {rebuild_neighbours()} listings.')
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {name}' for name, count in counts.items()) + '.'
+        ))
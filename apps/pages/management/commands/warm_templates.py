@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.pages import fragments
+
+
+class Command(BaseCommand):
+    help = (
+        'Compiles every template, failing if any does not compile, and prints '
+        'the fragment cache version. Workers precompile their own templates as '
+        'they boot (gunicorn.conf.py); run this in a build to catch broken '
+        'templates before they are deployed.'
+    )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        compiled, failed = fragments.precompile()
+        elapsed = time.perf_counter() - start
+        for name, error in sorted(failed.items()):
+            self.stderr.write(f'{name}: {error}')
+        self.stdout.write(
+            f'Compiled {compiled} template(s) in {elapsed * 1000:.0f}ms; '
+            f'fragment version {fragments.templates_digest()}.'
+        )
+        if failed:
+            raise CommandError(f'{len(failed)} template(s) failed to compile.')
@@ -0,0 +1,323 @@
+"""
+Synthetic catalogue for benchmarks.
+
+`generate` fills the database with agents, buyers, locations, listings (with
+amenities, images, search documents and cards) and inquiries, using bulk
+inserts in batches so that e.g. 100k listings and 1M inquiries take minutes
+rather than hours. The data is deterministic for a given seed.
+
+Bulk inserts skip model save() and signals, so everything those would
+maintain is written directly: location geohashes, inquiry message digests,
+image renditions, agent listing counts, search documents and listing cards.
+Timestamps are spread over the past two years instead of all being "now".
+
+Every synthetic user has an address at SYNTHETIC_EMAIL_DOMAIN, which is how
+`clear` finds (and cascades to) the generated rows again.
+"""
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from apps.agents.models import Agent
+from apps.agents.search import index_agents
+from apps.inquiries.models import Inquiry, message_digest
+from apps.listings.cache import bump_versions
+from apps.listings.cards import update_cards
+from apps.listings.geo import encode as encode_geohash
+from apps.listings.images import build_renditions
+from apps.listings.models import Amenity, Category, Listing, ListingImage, Location, PropertyType
+from apps.listings.search import index_listings
+from apps.users.models import Profile
+
+User = get_user_model()
+
+SYNTHETIC_EMAIL_DOMAIN = 'synthetic.invalid'
+PASSWORD = 'benchmark'
+HISTORY_DAYS = 730
+
+CITIES = (
+    ('Nairobi', 'Nairobi', -1.2921, 36.8219),
+    ('Mombasa', 'Mombasa', -4.0435, 39.6682),
+    ('Kisumu', 'Kisumu', -0.0917, 34.7680),
+    ('Nakuru', 'Nakuru', -0.3031, 36.0800),
+    ('Eldoret', 'Uasin Gishu', 0.5143, 35.2698),
+    ('Thika', 'Kiambu', -1.0333, 37.0693),
+    ('Malindi', 'Kilifi', -3.2192, 40.1169),
+    ('Naivasha', 'Nakuru', -0.7167, 36.4333),
+)
+AREAS = (
+    'Hillview', 'Riverside', 'Greenpark', 'Lakeside', 'Sunrise', 'Garden Estate', 'Old Town', 'Milimani',
+    'Highridge', 'Southfield', 'Kileleshwa Park', 'Valley View', 'Pinecrest', 'Bayside', 'Hilltop',
+    'Meadows', 'Acacia', 'Jacaranda', 'Baobab Court', 'Savannah', 'Cedar Heights', 'Palm Grove',
+    'Coral Ridge', 'Mango Gardens', 'Kings Park',
+)
+CATEGORIES = ('Apartments', 'Houses', 'Villas', 'Land', 'Commercial', 'Townhouses', 'Bungalows', 'Studios')
+PROPERTY_TYPES = ('Apartment', 'House', 'Townhouse', 'Condo', 'Land', 'Office', 'Retail', 'Warehouse')
+AMENITIES = (
+    'Swimming Pool', 'Gym', 'Parking', 'Garden', 'Security', 'Borehole', 'Backup Generator', 'Balcony',
+    'Lift', 'CCTV', 'Servant Quarters', 'Solar Water Heating', 'Fibre Internet', 'Playground', 'Sea View',
+)
+ADJECTIVES = ('Spacious', 'Modern', 'Cosy', 'Elegant', 'Bright', 'Secure', 'Luxury', 'Affordable', 'Classic', 'New')
+FEATURES = (
+    'an open-plan kitchen', 'a private garden', 'a rooftop terrace', 'fitted wardrobes', 'a home office',
+    'a large balcony', 'ample parking', 'a backup water tank', 'a modern bathroom', 'a guest wing',
+)
+SUBJECTS = ('Viewing request', 'Price enquiry', 'Is this still available?', 'Payment plan', '')
+MESSAGES = tuple(
+    f'Hello, I am interested in this property. {question} Please get back to me.'
+    for question in (
+        'When can I view it?', 'Is the price negotiable?', 'Are pets allowed?', 'Is there a service charge?',
+        'How far is it from the main road?', 'Is it still on the market?', 'Can I pay in instalments?',
+        'Does it come furnished?', 'What are the neighbours like?', 'Is the title deed ready?',
+    )
+)
+# Cloudinary public ids for the image rows; URLs are built but never fetched.
+IMAGE_IDS = tuple(f'listings/synthetic/photo-{i:02d}' for i in range(20))
+IMAGE_SIZE = (1600, 1067)
+
+
+class Counts(dict):
+    """Rows created per model, reported by the command."""
+
+    def add(self, name, count):
+        self[name] = self.get(name, 0) + count
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create write the given created_at/updated_at values instead of now."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _batches(count, size):
+    for start in range(0, count, size):
+        yield start, min(size, count - start)
+
+
+class Generator:
+    def __init__(self, seed=1, batch_size=5000, log=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.counts = Counts()
+        self.password = make_password(PASSWORD)
+        self._renditions = {}
+
+    def timestamp(self):
+        return self.now - timedelta(seconds=self.random.randrange(HISTORY_DAYS * 86400))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        yield
+        self.log(f'{name}: {self.counts.get(name, 0)} rows in {time.perf_counter() - start:.1f}s')
+
+    def lookups(self):
+        """Categories, property types, amenities and locations, shared with real data."""
+        for model, names in ((Category, CATEGORIES), (PropertyType, PROPERTY_TYPES), (Amenity, AMENITIES)):
+            model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+        self.categories = list(Category.objects.filter(name__in=CATEGORIES).values_list('pk', flat=True))
+        self.property_types = list(PropertyType.objects.filter(name__in=PROPERTY_TYPES).values_list('pk', flat=True))
+        self.amenities = list(Amenity.objects.filter(name__in=AMENITIES).values_list('pk', flat=True))
+
+        locations = []
+        for city, state, latitude, longitude in CITIES:
+            for area in AREAS:
+                lat = round(latitude + self.random.uniform(-0.08, 0.08), 6)
+                lng = round(longitude + self.random.uniform(-0.08, 0.08), 6)
+                locations.append(Location(
+                    name=area, city=city, state=state, country='Kenya',
+                    latitude=lat, longitude=lng, geohash=encode_geohash(lat, lng),
+                ))
+        Location.objects.bulk_create(locations, ignore_conflicts=True)
+        self.locations = list(Location.objects.filter(
+            city__in=[city for city, _, _, _ in CITIES], name__in=AREAS,
+        ).values_list('pk', 'name', 'city'))
+
+    def users(self, prefix, count):
+        """Create `count` users (with profiles); returns their ids."""
+        ids = []
+        for start, size in _batches(count, self.batch_size):
+            users = [
+                User(
+                    email=f'{prefix}{i}@{SYNTHETIC_EMAIL_DOMAIN}', username=f'{prefix}{i}.synthetic',
+                    password=self.password, date_joined=self.timestamp(),
+                )
+                for i in range(start, start + size)
+            ]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                if users[0].pk is None:  # backends that don't return ids
+                    users = list(User.objects.filter(email__in=[user.email for user in users]))
+                Profile.objects.bulk_create([
+                    Profile(user=user, phone_number=f'07{self.random.randrange(10 ** 8):08d}') for user in users
+                ])
+            ids.extend(user.pk for user in users)
+            self.counts.add('users', len(users))
+        return ids
+
+    def agents(self, count):
+        user_ids = self.users('agent', count)
+        agents = []
+        for i, user_id in enumerate(user_ids):
+            city = self.random.choice(CITIES)[0]
+            agents.append(Agent(
+                user_id=user_id, agency_name=f'{self.random.choice(AREAS)} Realty {i}',
+                license_number=f'SYN-{i:07d}', years_of_experience=self.random.randrange(30),
+                specialization=self.random.choice(CATEGORIES), office_address=f'{city}, Kenya',
+                verification_status='verified' if self.random.random() < 0.8 else 'pending',
+                is_featured=self.random.random() < 0.02,
+            ))
+        with explicit_timestamps(Agent):
+            for agent in agents:
+                agent.created_at = agent.updated_at = self.timestamp()
+            for start in range(0, len(agents), self.batch_size):
+                Agent.objects.bulk_create(agents[start:start + self.batch_size])
+        # bulk_create skips Agent.save(), which fills in search_text.
+        index_agents(Agent.objects.filter(user_id__in=user_ids), batch_size=self.batch_size)
+        self.counts.add('agents', len(agents))
+        self.agent_ids = list(
+            Agent.objects.filter(user_id__in=user_ids).values_list('pk', 'user_id')
+        )
+
+    def renditions(self, public_id):
+        # Only a handful of distinct images, so build each one's URLs once.
+        if public_id not in self._renditions:
+            self._renditions[public_id] = build_renditions(
+                ListingImage(image=public_id, width=IMAGE_SIZE[0], height=IMAGE_SIZE[1]),
+            )
+        return self._renditions[public_id]
+
+    def listing(self, number):
+        agent_id, user_id = self.random.choice(self.agent_ids)
+        location_id, area, city = self.random.choice(self.locations)
+        bedrooms = self.random.choice((None, 1, 1, 2, 2, 2, 3, 3, 4, 5, 6))
+        adjective = self.random.choice(ADJECTIVES)
+        kind = self.random.choice(PROPERTY_TYPES)
+        title = f'{adjective} {bedrooms or ""}{" bedroom " if bedrooms else ""}{kind.lower()} in {area}, {city}'
+        # Log-normal prices: mostly 1M-20M, with a long tail.
+        price = round(min(self.random.lognormvariate(15.5, 1.0), 9.9e9), -3)
+        created_at = self.timestamp()
+        return Listing(
+            user_id=user_id, agent_id=agent_id, location_id=location_id,
+            category_id=self.random.choice(self.categories),
+            property_type_obj_id=self.random.choice(self.property_types),
+            title=title, slug=f'synthetic-{number}',
+            description=(
+                f'{adjective} {kind.lower()} in {area} with {self.random.choice(FEATURES)} and '
+                f'{self.random.choice(FEATURES)}. Close to schools, shops and transport in {city}.'
+            ),
+            price=price, bedrooms=bedrooms,
+            bathrooms=max(1, (bedrooms or 1) - self.random.randrange(2)) if bedrooms else None,
+            square_feet=self.random.randrange(400, 6000), year_built=self.random.randrange(1970, 2026),
+            is_featured=self.random.random() < 0.05,
+            is_published=self.random.random() < 0.9,
+            status=self.random.choices(('available', 'pending', 'sold'), (85, 5, 10))[0],
+            created_at=created_at, updated_at=created_at,
+        )
+
+    def listings(self, count, images_per_listing):
+        self.listing_ids = []
+        totals = {}
+        for start, size in _batches(count, self.batch_size):
+            listings = [self.listing(i) for i in range(start, start + size)]
+            with transaction.atomic(), explicit_timestamps(Listing, ListingImage):
+                Listing.objects.bulk_create(listings)
+                if listings[0].pk is None:
+                    by_slug = dict(Listing.objects.filter(
+                        slug__in=[listing.slug for listing in listings],
+                    ).values_list('slug', 'pk'))
+                    for listing in listings:
+                        listing.pk = by_slug[listing.slug]
+                Listing.amenities.through.objects.bulk_create([
+                    Listing.amenities.through(listing_id=listing.pk, amenity_id=amenity_id)
+                    for listing in listings
+                    for amenity_id in self.random.sample(self.amenities, self.random.randrange(6))
+                ])
+                images = []
+                for listing in listings:
+                    for position in range(images_per_listing):
+                        public_id = self.random.choice(IMAGE_IDS)
+                        images.append(ListingImage(
+                            listing_id=listing.pk, image=public_id, is_main=position == 0,
+                            width=IMAGE_SIZE[0], height=IMAGE_SIZE[1], created_at=listing.created_at,
+                            renditions=self.renditions(public_id),
+                        ))
+                ListingImage.objects.bulk_create(images)
+                index_listings(Listing.objects.filter(pk__in=[listing.pk for listing in listings]))
+                update_cards(Listing.objects.filter(pk__in=[listing.pk for listing in listings]))
+            for listing in listings:
+                totals[listing.agent_id] = totals.get(listing.agent_id, 0) + 1
+            self.listing_ids.extend(listing.pk for listing in listings)
+            self.counts.add('listings', len(listings))
+            self.counts.add('images', len(images))
+            self.log(f'  {start + size}/{count} listings')
+        # Only synthetic agents own these listings, and they have no others.
+        for agent_id, total in totals.items():
+            Agent.objects.filter(pk=agent_id).update(total_listings=total)
+
+    def inquiries(self, count, buyer_ids):
+        digests = {message: message_digest(message) for message in MESSAGES}
+        for start, size in _batches(count, self.batch_size):
+            inquiries = []
+            for _ in range(size):
+                message = self.random.choice(MESSAGES)
+                created_at = self.timestamp()
+                status = self.random.choices(('new', 'read', 'responded', 'closed'), (40, 30, 20, 10))[0]
+                inquiries.append(Inquiry(
+                    user_id=self.random.choice(buyer_ids), listing_id=self.random.choice(self.listing_ids),
+                    subject=self.random.choice(SUBJECTS), message=message, message_digest=digests[message],
+                    status=status, created_at=created_at, updated_at=created_at,
+                    responded_at=created_at + timedelta(hours=self.random.randrange(1, 96))
+                    if status == 'responded' else None,
+                ))
+            with explicit_timestamps(Inquiry):
+                Inquiry.objects.bulk_create(inquiries)
+            self.counts.add('inquiries', len(inquiries))
+            if (start + size) % (self.batch_size * 20) == 0 or start + size == count:
+                self.log(f'  {start + size}/{count} inquiries')
+
+
+def generate(listings=100_000, agents=5_000, buyers=20_000, inquiries=1_000_000, images_per_listing=3,
+             seed=1, batch_size=5000, log=None):
+    """Add a synthetic catalogue to the database. Returns rows created per model."""
+    if Agent.objects.filter(user__email__endswith=f'@{SYNTHETIC_EMAIL_DOMAIN}').exists():
+        raise ValueError('Synthetic data already exists; clear it first.')
+    generator = Generator(seed=seed, batch_size=batch_size, log=log)
+    generator.lookups()
+    with generator.phase('agents'):
+        generator.agents(max(1, agents))
+    with generator.phase('listings'):
+        generator.listings(listings, images_per_listing)
+    with generator.phase('users'):
+        buyer_ids = generator.users('buyer', max(1, buyers))
+    if generator.listing_ids:
+        with generator.phase('inquiries'):
+            generator.inquiries(inquiries, buyer_ids)
+    bump_versions('listings', 'agents', 'categories')
+    return generator.counts
+
+
+def clear():
+    """Delete every synthetic user and, by cascade, their agents, listings and inquiries."""
+    deleted, _ = User.objects.filter(email__endswith=f'@{SYNTHETIC_EMAIL_DOMAIN}').delete()
+    bump_versions('listings', 'agents', 'categories')
+    return deleted
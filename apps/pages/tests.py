@@ -0,0 +1,312 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from apps.agents.models import Agent
+from apps.agents.search import search_agents
+from apps.agents.stats import drifted_agents
+from apps.inquiries.models import Inquiry, message_digest
+from apps.listings.models import Listing, ListingImage
+from apps.listings.search import ranked_listing_ids
+from apps.listings.tests import SharedCacheMixin, create_catalogue
+from . import benchmark, fragments, synthetic
+from ikr_project.profiling import QueryBudgetExceeded, metrics_registry
+
+
+class PageViewQueryCountTests(TestCase):
+    """Query counts must not grow with the number of listings rendered."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_home(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(len(response.context['featured_listings']), 6)
+
+    def test_search(self):
+        # The first search on a connection looks for the FTS tables.
+        ranked_listing_ids('warm up')
+        search_agents(Agent.objects.all(), 'warm up')
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('search'), {'q': 'apartment'})
+        self.assertEqual(len(response.context['listings']), 10)
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(listing_count=3, images_per_listing=1)
+
+    def setUp(self):
+        cache.clear()
+        metrics_registry.reset()
+
+    def test_profile_is_tagged_with_the_view_and_counts_cache_use(self):
+        response = self.client.get(reverse('home'))
+        profile = response.wsgi_request.profile
+        self.assertEqual(profile.view, 'home')
+        self.assertEqual(profile.status, 200)
+        self.assertEqual(profile.queries, 3)
+        self.assertGreater(profile.cache_misses, 0)
+        self.assertGreater(profile.template_seconds, 0)
+
+        profile = self.client.get(reverse('home')).wsgi_request.profile
+        self.assertEqual(profile.queries, 0)
+        self.assertGreater(profile.cache_hits, 0)
+
+    def test_duplicate_queries(self):
+        profile = self.client.get(reverse('home')).wsgi_request.profile
+        self.assertEqual(profile.duplicate_queries, 0)
+        profile._statements[('default', 'SELECT 1', '()')] = 3
+        self.assertEqual(profile.duplicate_queries, 2)
+        self.assertEqual(profile.most_repeated(), (3, 'SELECT 1'))
+
+    @override_settings(PROFILING_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('home'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="3 queries, 0 duplicate"')
+
+    def test_no_server_timing_header_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+
+    @override_settings(QUERY_BUDGETS={'home': 2})
+    def test_over_budget_fails(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'home ran 3 queries, over its budget of 2'):
+            self.client.get(reverse('home'))
+        # Warm, it is within budget again.
+        self.client.get(reverse('home'))
+
+    @override_settings(QUERY_BUDGETS={'home': 2}, QUERY_BUDGETS_STRICT=False)
+    def test_over_budget_is_logged_outside_tests(self):
+        with self.assertLogs('ikr_project.profiling', 'WARNING') as logs:
+            self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertIn('OVER BUDGET (2)', logs.output[0])
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'}).status_code, 404,
+        )
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('ikr_http_responses_total{view="home",method="GET",status="2xx"} 2', body)
+        self.assertIn('ikr_http_request_duration_seconds_count{view="home"} 2', body)
+        self.assertIn('ikr_db_queries_total{view="home"} 3', body)
+
+    def test_metrics_for_staff_without_token(self):
+        user = get_user_model().objects.create_user(
+            email='staff@example.com', username='staff', password='password', is_staff=True,
+        )
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class SyntheticDataTests(TestCase):
+    def test_generate_and_clear(self):
+        counts = synthetic.generate(listings=30, agents=4, buyers=5, inquiries=60, images_per_listing=2, batch_size=7)
+        self.assertEqual(counts, {'users': 9, 'agents': 4, 'listings': 30, 'images': 60, 'inquiries': 60})
+        self.assertEqual(Listing.objects.count(), 30)
+        self.assertEqual(ListingImage.objects.filter(is_main=True).count(), 30)
+        self.assertEqual(list(drifted_agents()), [])
+        self.assertFalse(Listing.objects.filter(location__geohash='').exists())
+        inquiry = Inquiry.objects.first()
+        self.assertEqual(inquiry.message_digest, message_digest(inquiry.message))
+        self.assertEqual(Listing.objects.filter(search_document__isnull=True).count(), 0)
+        # Spread over time rather than all created now.
+        self.assertGreater(Listing.objects.values('created_at').distinct().count(), 1)
+
+        with self.assertRaises(ValueError):
+            synthetic.generate(listings=1, agents=1, buyers=1, inquiries=1)
+
+        synthetic.clear()
+        self.assertFalse(Listing.objects.exists())
+        self.assertFalse(Agent.objects.exists())
+        self.assertFalse(Inquiry.objects.exists())
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(listing_count=3, images_per_listing=1)
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def test_baseline_and_comparison(self):
+        call_command('benchmark_views', '--scenario', 'home', '--requests', '3', '--warmup', '1',
+                     '--output', self.path, stdout=open(os.devnull, 'w'))
+        baseline = benchmark.read_baseline(self.path)
+        stats = baseline['results']['client']['home']
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['errors'], 0)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertEqual(baseline['meta']['dataset']['listings'], 3)
+
+        # Pretend the baseline ran one query fewer and was much faster.
+        results = {'client': {'home': dict(stats)}}
+        stats.update(queries=stats['queries'] - 1, p95_ms=stats['p95_ms'] / 100)
+        rows = benchmark.compare(baseline, results)
+        self.assertEqual({metric for _, _, metric, *_, regressed in rows if regressed}, {'queries', 'p95_ms'})
+
+        with open(self.path, 'w') as f:
+            json.dump(baseline, f)
+        with self.assertRaisesMessage(CommandError, 'regressed'):
+            call_command('benchmark_views', '--scenario', 'home', '--requests', '3', '--compare', self.path,
+                         '--fail-on-regression', stdout=open(os.devnull, 'w'))
+
+    def test_unknown_scenario(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown scenario(s): nope'):
+            call_command('benchmark_views', '--scenario', 'nope')
+
+    def test_template_render_times(self):
+        results = benchmark.run_templates([('home', reverse('home'))], requests=2, warmup=1)
+        self.assertEqual(results['base.html']['renders'], 2)
+        self.assertEqual(results['home.html']['renders_per_request'], 1)
+        # home.html extends base.html, so its time includes base.html's but its self time doesn't.
+        self.assertGreaterEqual(results['home.html']['total_ms'], results['base.html']['total_ms'])
+        self.assertLess(results['home.html']['self_total_ms'], results['home.html']['total_ms'])
+
+    def test_wsgi_driver(self):
+        def application(environ, start_response):
+            start_response('200 OK', [('Server-Timing', 'total;dur=1, db;dur=0.5;desc="3 queries, 0 duplicate"')])
+            return [environ['PATH_INFO'].encode()]
+
+        with benchmark.serve(application) as base_url:
+            results = benchmark.run_wsgi([('ping', '/ping/')], base_url, concurrency=2, max_requests=5, warmup=1)
+        self.assertEqual(results['ping']['requests'], 10)
+        self.assertEqual(results['ping']['errors'], 0)
+        self.assertEqual(results['ping']['queries'], 3)
+        self.assertGreater(results['ping']['throughput_rps'], 0)
+
+
+@override_settings(CACHES={
+    **settings.CACHES,
+    'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragment-tests'},
+})
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, listings = create_catalogue(listing_count=1, images_per_listing=1)
+        cls.listing = listings[0]
+
+    def setUp(self):
+        caches['fragments'].clear()
+
+    def render_card(self, listing):
+        return render_to_string(
+            'listings/partials/_listing_card.html', {'listing': listing}, request=RequestFactory().get('/'),
+        )
+
+    def test_listing_card_is_cached_per_updated_at(self):
+        listing = Listing.objects.get(pk=self.listing.pk)
+        self.assertIn('Apartment 0', self.render_card(listing))
+        listing.title = 'Renamed'
+        self.assertIn('Apartment 0', self.render_card(listing))
+        listing.save()
+        self.assertIn('Renamed', self.render_card(listing))
+
+    def test_image_and_location_changes_move_updated_at(self):
+        updated_at = Listing.objects.get(pk=self.listing.pk).updated_at
+        ListingImage.objects.create(listing=self.listing, image='listings/new.jpg')
+        touched = Listing.objects.get(pk=self.listing.pk).updated_at
+        self.assertGreater(touched, updated_at)
+        self.listing.location.save()
+        self.assertGreater(Listing.objects.get(pk=self.listing.pk).updated_at, touched)
+
+    def test_category_and_agent_changes_refresh_cached_card(self):
+        self.assertIn('Apartments', self.render_card(Listing.objects.get(pk=self.listing.pk)))
+        category = self.listing.category
+        category.name = 'Flats'
+        category.save()
+        user = self.agent.user
+        user.username = 'broker'
+        user.save()
+        card = self.render_card(Listing.objects.get(pk=self.listing.pk))
+        self.assertIn('Flats', card)
+        self.assertIn('broker', card)
+
+    def test_navbar_varies_with_sign_in(self):
+        self.assertContains(self.client.get(reverse('home')), 'Sign Up')
+        self.client.force_login(self.agent.user)
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Sign Out')
+        self.assertContains(response, reverse('agents:agent_dashboard'))
+
+    def test_warm_templates(self):
+        out = StringIO()
+        call_command('warm_templates', stdout=out)
+        self.assertIn(f'fragment version {fragments.templates_digest()}', out.getvalue())
+        self.assertIn('partials/_navbar.html', fragments.template_files())
+
+
+@override_settings(EDGE_CACHE_SECONDS=10)
+class EdgeCacheTests(SharedCacheMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent, listings = create_catalogue(listing_count=1, images_per_listing=0)
+        cls.url = reverse('listing_detail', args=[listings[0].slug])
+        cls.slug = listings[0].slug
+
+    def setUp(self):
+        cache.clear()
+
+    def assertShell(self, response):
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0, s-maxage=10')
+        self.assertFalse(response.cookies)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertContains(response, 'data-session-fragment="inquiry-form"')
+        self.assertContains(response, reverse('session_fragments'))
+
+    def test_shells_are_the_same_for_everyone(self):
+        anonymous = self.client.get(self.url)
+        self.assertShell(anonymous)
+        self.client.force_login(self.agent.user)
+        signed_in = self.client.get(self.url)
+        self.assertShell(signed_in)
+        self.assertNotContains(signed_in, 'Sign Out')
+        self.assertEqual(signed_in['ETag'], anonymous['ETag'])
+        for url in (reverse('home'), reverse('listing_list'), reverse('agents:agent_list')):
+            self.assertEqual(self.client.get(url)['Cache-Control'], 'public, max-age=0, s-maxage=10')
+
+    def test_session_fragments(self):
+        names = {'name': ['navbar-account', 'inquiry-form', 'alerts', 'unknown'], 'listing': self.slug}
+        response = self.client.get(reverse('session_fragments'), names)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertEqual(list(response.json()['fragments']), ['alerts'])
+
+        self.client.force_login(self.agent.user)
+        self.client.post(reverse('agents:agent_detail', args=[self.agent.pk]), {'rating': '5'})
+        with self.assertNumQueries(3):  # session (which holds the message), user, agent
+            data = self.client.get(reverse('session_fragments'), names).json()
+        self.assertIn('Sign Out', data['fragments']['navbar-account'])
+        self.assertIn('csrfmiddlewaretoken', data['fragments']['inquiry-form'])
+        self.assertIn('Your rating has been submitted.', data['fragments']['alerts'])
+        self.assertTrue(data['csrf_token'])
+
+    @override_settings(EDGE_CACHE_SECONDS=0)
+    def test_off_by_default(self):
+        self.client.force_login(self.agent.user)
+        response = self.client.get(self.url)
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+        self.assertContains(response, 'Sign Out')
+        self.assertNotContains(response, reverse('session_fragments'))
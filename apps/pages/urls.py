@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
     path('search/', views.search_view, name='search'),
+    path('fragments/session/', views.session_fragments, name='session_fragments'),
     path('404/', views.custom_404_view, name='404'),
     path('500/', views.custom_500_view, name='500'),
     path('licensing/', views.LicensingView.as_view(), name='licensing'),
@@ -1,22 +1,44 @@
+from django.core.validators import slug_re
+from django.http import JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
 from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
 from django.views.generic import TemplateView
-from apps.listings.models import Listing, Category
+from apps.listings.models import Category, ListingCard
+from apps.listings.search import search_listings
+from apps.listings import cache as catalogue_cache
+from apps.listings.conditional import catalogue_condition
 from apps.agents.models import Agent
+from apps.agents.search import search_agents
+from apps.inquiries.forms import InquiryForm
 
 
+@method_decorator(catalogue_condition('listings', 'categories', 'agents'), name='dispatch')
 class HomeView(TemplateView):
     template_name = 'home.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['featured_listings'] = Listing.objects.filter(
-            is_featured=True, is_published=True, status='available'
-        )[:6]
-        context['categories'] = Category.objects.all()[:8]
-        context['featured_agents'] = Agent.objects.filter(
-            verification_status='verified', is_featured=True
-        )[:4]
+        # Each block is cached on its own so e.g. a new category does not
+        # throw away the featured listings.
+        context['featured_listings'] = catalogue_cache.get_or_set(
+            'home_featured_listings', ['listings'],
+            lambda: list(ListingCard.objects.published().filter(is_featured=True).order_by('-created_at')[:6]),
+        )
+        context['categories'] = catalogue_cache.get_or_set(
+            'home_categories', ['categories'],
+            lambda: list(Category.objects.all()[:8]),
+        )
+        context['featured_agents'] = catalogue_cache.get_or_set(
+            'home_featured_agents', ['agents'],
+            lambda: list(Agent.objects.select_related('user__profile').filter(
+                verification_status='verified', is_featured=True
+            )[:4]),
+        )
+        context.update(catalogue_cache.template_cache_context('listings'))
         return context
 
 
@@ -35,24 +57,16 @@ def search_view(request):
     if not query:
         return redirect('home')
 
-    # Search listings
-    listings = Listing.objects.filter(
-        Q(title__icontains=query) |
-        Q(description__icontains=query) |
-        Q(location__name__icontains=query) |
-        Q(location__city__icontains=query) |
-        Q(category__name__icontains=query),
-        is_active=True,
-        status='available'
+    # Search listings (title, description, location, category, property type and amenities);
+    # cards share their listing's id.
+    listings = search_listings(
+        query,
+        ListingCard.objects.filter(is_active=True, status='available'),
     )[:10]  # Limit to 10 results
 
     # Search agents
-    agents = Agent.objects.filter(
-        Q(user__first_name__icontains=query) |
-        Q(user__last_name__icontains=query) |
-        Q(agency_name__icontains=query) |
-        Q(specialization__icontains=query),
-        verification_status='verified'
+    agents = search_agents(
+        Agent.objects.select_related('user__profile').filter(verification_status='verified'), query,
     )[:10]  # Limit to 10 results
 
     # Search categories
@@ -70,6 +84,42 @@ def search_view(request):
     return render(request, 'search_results.html', context)
 
 
+# The parts of edge-cached page shells that depend on the visitor (see
+# ikr_project/edge.py), by the name of their data-session-fragment element:
+# (template, the query parameter it needs if any).
+SESSION_FRAGMENTS = {
+    'alerts': ('partials/_alerts.html', None),
+    'navbar-account': ('partials/_navbar_account.html', None),
+    'navbar-account-mobile': ('partials/_navbar_account_mobile.html', None),
+    'listing-actions': ('listings/partials/_listing_actions.html', None),
+    'inquiry-form': ('listings/partials/_inquiry_form.html', 'listing'),
+    'agent-list-actions': ('agents/partials/_agent_list_actions.html', None),
+    'agent-actions': ('agents/partials/_agent_actions.html', 'agent'),
+}
+
+
+@never_cache
+def session_fragments(request):
+    """The visitor's version of each `name` fragment in the query string, and a CSRF token, as JSON."""
+    listing = request.GET.get('listing', '')
+    agent = request.GET.get('agent', '')
+    given = {'listing': slug_re.match(listing) is not None, 'agent': agent.isdigit()}
+    names = [
+        name for name in request.GET.getlist('name')
+        if name in SESSION_FRAGMENTS and given.get(SESSION_FRAGMENTS[name][1], True)
+    ]
+    if not request.user.is_authenticated:
+        # Shells already show the rest as anonymous visitors see it.
+        names = [name for name in names if name == 'alerts']
+    context = {'listing': {'slug': listing}, 'agent': {'id': agent}, 'form': InquiryForm()}
+    return JsonResponse({
+        'fragments': {
+            name: render_to_string(SESSION_FRAGMENTS[name][0], context, request=request) for name in names
+        },
+        'csrf_token': get_token(request),
+    })
+
+
 class LicensingView(TemplateView):
     template_name = 'pages/licensing.html'
 
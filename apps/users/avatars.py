@@ -0,0 +1,71 @@
+"""
+Avatar renditions.
+
+Avatars are stored with the default file storage (the local filesystem when
+Cloudinary is not configured), which has no on-the-fly resizing, so square
+WebP copies in AVATAR_SIZES are generated with Pillow on the background
+worker pool (ikr_project.celery.enqueue) after an avatar changes. Their URLs
+are memoized in Profile.avatar_renditions, keyed by size.
+"""
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+AVATAR_SIZES = (64, 128, 256, 512)
+RENDITION_DIR = 'avatars/renditions'
+
+
+def rendition_name(avatar_name, size):
+    stem = os.path.splitext(os.path.basename(avatar_name))[0]
+    return f'{RENDITION_DIR}/{stem}-{size}.webp'
+
+
+def generate_avatar_renditions(profile):
+    """Write every size of `profile.avatar` to storage and record their URLs."""
+    from .models import Profile
+
+    renditions = {}
+    if profile.avatar:
+        with profile.avatar.open('rb') as f:
+            source = ImageOps.exif_transpose(Image.open(f)).convert('RGB')
+        for size in AVATAR_SIZES:
+            picture = ImageOps.fit(source, (size, size), Image.LANCZOS)
+            content = ContentFile(b'')
+            picture.save(content, 'WEBP', quality=80, method=6)
+            name = rendition_name(profile.avatar.name, size)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            name = default_storage.save(name, content)
+            renditions[str(size)] = default_storage.url(name)
+    Profile.objects.filter(pk=profile.pk).update(avatar_renditions=renditions)
+    profile.avatar_renditions = renditions
+    # A queryset update, so no post_save.
+    from apps.agents.signals import invalidate_agent_user_cache
+
+    invalidate_agent_user_cache(profile.user_id)
+    return renditions
+
+
+def process_avatar(profile_id):
+    from .models import Profile
+
+    profile = Profile.objects.filter(pk=profile_id).first()
+    if profile is None:
+        return
+    try:
+        generate_avatar_renditions(profile)
+    except OSError as exc:
+        logger.warning('Avatar renditions for profile %s failed: %s', profile_id, exc)
+
+
+def schedule_avatar_renditions(profile_id):
+    from ikr_project.celery import enqueue
+    from .tasks import process_avatar_task
+
+    transaction.on_commit(lambda: enqueue(process_avatar_task, profile_id))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -50,12 +50,35 @@ class Profile(models.Model):
     zip_code = models.CharField(max_length=20, blank=True)
     bio = models.TextField(blank=True, max_length=500)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    # Resized copies' URLs by size, generated in the background (avatars.py).
+    avatar_renditions = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'{self.user.email} Profile'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'avatar' in instance.__dict__:
+            instance._loaded_avatar = instance.avatar.name
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .avatars import schedule_avatar_renditions
+
+        avatar_changed = (self.avatar.name or None) != (getattr(self, '_loaded_avatar', None) or None)
+        if avatar_changed:
+            self.avatar_renditions = {}
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'avatar_renditions'}
+        super().save(*args, **kwargs)
+        if avatar_changed:
+            self._loaded_avatar = self.avatar.name
+            if self.avatar:
+                schedule_avatar_renditions(self.pk)
+
     class Meta:
         verbose_name = 'Profile'
         verbose_name_plural = 'Profiles'
\ No newline at end of file
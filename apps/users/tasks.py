@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from .avatars import process_avatar
+
+
+@shared_task(name='users.process_avatar')
+def process_avatar_task(profile_id):
+    process_avatar(profile_id)
@@ -0,0 +1,48 @@
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from .avatars import AVATAR_SIZES, generate_avatar_renditions
+from .models import Profile
+
+User = get_user_model()
+
+
+class AvatarRenditionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, MEDIA_URL='/media/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self):
+        content = io.BytesIO()
+        Image.new('RGB', (800, 600), (10, 20, 30)).save(content, 'PNG')
+        return SimpleUploadedFile('me.png', content.getvalue(), content_type='image/png')
+
+    def test_avatar_change_schedules_renditions(self):
+        user = User.objects.create_user(email='me@example.com', username='me', password='password')
+        with self.captureOnCommitCallbacks() as callbacks:
+            profile = Profile.objects.create(user=user, avatar=self.upload())
+        self.assertEqual(len(callbacks), 1)
+
+        renditions = generate_avatar_renditions(profile)
+        self.assertEqual(sorted(renditions, key=int), [str(size) for size in AVATAR_SIZES])
+        self.assertTrue(renditions['128'].startswith('/media/avatars/renditions/me'))
+        profile = Profile.objects.get(pk=profile.pk)
+        self.assertEqual(profile.avatar_renditions, renditions)
+        with profile.avatar.storage.open(renditions['64'][len('/media/'):]) as f:
+            self.assertEqual(Image.open(f).size, (64, 64))
+
+        # Saving without changing the avatar keeps the renditions.
+        with self.captureOnCommitCallbacks() as callbacks:
+            profile.bio = 'Hello'
+            profile.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(Profile.objects.get(pk=profile.pk).avatar_renditions, renditions)
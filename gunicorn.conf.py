@@ -0,0 +1,19 @@
+# Read by gunicorn from the working directory (Procfile, render.yaml and the
+# Dockerfile all start it from the project root).
+
+
+def post_worker_init(worker):
+    # Compile every template before serving, rather than on each worker's
+    # first requests (see apps/pages/fragments.py).
+    from apps.pages.fragments import precompile
+
+    compiled, failed = precompile()
+    worker.log.info('Precompiled %d templates', compiled)
+    for name, error in sorted(failed.items()):
+        worker.log.warning('Template %s failed to compile: %s', name, error)
+
+    # Without a Celery broker, periodic tasks (the inquiry outbox sweep) run
+    # in each worker (see ikr_project/celery.py).
+    from ikr_project.celery import start_local_beat
+
+    start_local_beat()
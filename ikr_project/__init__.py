@@ -6,3 +6,6 @@ if environment == 'production':
     from .settings.production import *
 else:
     from .settings.development import *
+
+# Load the Celery app whenever Django starts so shared tasks bind to it.
+from .celery import app as celery_app  # noqa: E402
@@ -0,0 +1,114 @@
+"""
+Celery application and background-task dispatch.
+
+Tasks are plain Celery tasks. `enqueue` sends them to the broker when
+CELERY_BROKER_URL is configured; without a broker (local development, or a
+Render instance without Redis) they run on a small in-process thread pool
+instead, so callers never block on the work either way.
+
+Periodic tasks (CELERY_BEAT_SCHEDULE) run on Celery beat with a broker.
+Without one, `start_local_beat` (called from gunicorn.conf.py as each worker
+boots) runs the entries with a schedule in seconds on a daemon thread, which
+hands them to the same thread pool. Every web worker runs them, so periodic
+tasks must be safe to run concurrently.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ikr_project.settings')
+
+app = Celery('ikr_project')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _local_executor():
+    global _executor
+    if _executor is None:
+        from django.conf import settings
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BACKGROUND_WORKERS', 4),
+            thread_name_prefix='ikr-background',
+        )
+    return _executor
+
+
+def _run_locally(task, args, kwargs):
+    from django.db import close_old_connections
+    try:
+        return task(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', getattr(task, 'name', task.__qualname__))
+    finally:
+        # Worker threads get their own DB connections; don't leak them.
+        close_old_connections()
+
+
+def run_locally(func, *args, **kwargs):
+    """Run `func` on this process's thread pool, with or without a broker."""
+    return _local_executor().submit(_run_locally, func, args, kwargs)
+
+
+def enqueue(task, *args, **kwargs):
+    """Run `task` in the background: on Celery if a broker is configured, else locally."""
+    from django.conf import settings
+    if getattr(settings, 'CELERY_BROKER_URL', ''):
+        return task.delay(*args, **kwargs)
+    return _local_executor().submit(_run_locally, task, args, kwargs)
+
+
+_beat = None
+_beat_lock = threading.Lock()
+
+
+def _local_beat_entries():
+    """(task, interval in seconds) for each CELERY_BEAT_SCHEDULE entry the local beat can run."""
+    from django.conf import settings
+    app.loader.import_default_modules()
+    entries = []
+    for name, entry in getattr(settings, 'CELERY_BEAT_SCHEDULE', {}).items():
+        if not isinstance(entry['schedule'], (int, float)):
+            logger.warning('Periodic task %s has a crontab schedule; run it on Celery beat', name)
+            continue
+        entries.append((app.tasks[entry['task']], float(entry['schedule'])))
+    return entries
+
+
+def _run_local_beat(entries, stop):
+    due = [time.monotonic() + interval for _, interval in entries]
+    while entries:
+        now = time.monotonic()
+        for i, (task, interval) in enumerate(entries):
+            if due[i] <= now:
+                _local_executor().submit(_run_locally, task, (), {})
+                due[i] = now + interval
+        if stop.wait(max(0.0, min(due) - time.monotonic())):
+            return
+
+
+def start_local_beat():
+    """
+    Run periodic tasks in this process when no broker is configured. Returns
+    the event that stops them, or None when Celery beat runs them instead.
+    """
+    global _beat
+    from django.conf import settings
+    if getattr(settings, 'CELERY_BROKER_URL', ''):
+        return None
+    with _beat_lock:
+        if _beat is None:
+            _beat = threading.Event()
+            threading.Thread(
+                target=_run_local_beat, args=(_local_beat_entries(), _beat),
+                name='ikr-beat', daemon=True,
+            ).start()
+    return _beat
@@ -0,0 +1,62 @@
+"""
+Edge-cacheable page shells.
+
+With EDGE_CACHE_SECONDS set, GET and HEAD requests to the views in
+EDGE_CACHED_VIEWS are rendered as shells: the page as an anonymous visitor
+sees it, rendered without reading the session. Shells are sent with
+``Cache-Control: public, max-age=0, s-maxage=EDGE_CACHE_SECONDS``, so nginx
+(see nginx.conf) or a CDN serves one copy to everyone for that long, while
+browsers revalidate theirs on every visit (see
+apps/listings/conditional.py).
+
+The parts of a page that depend on who is looking (the navbar's account
+menu, messages, the inquiry and rating forms, staff actions) are elements
+with a ``data-session-fragment`` attribute. A script in the shell replaces
+them with the visitor's version, fetched from the session_fragments view
+(apps/pages/views.py), which is never cached.
+
+A shell that turns out to depend on cookies anyway (it set one, or read the
+session) is sent as private instead, so no visitor is ever given another's
+page. Shells are read from a replica for signed-in users too, except by
+browsers pinned to the primary after a write (see routers.py); nginx.conf
+doesn't cache or serve cached shells for those.
+"""
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.utils.cache import has_vary_header, patch_cache_control
+
+
+def edge_cache_seconds():
+    return getattr(settings, 'EDGE_CACHE_SECONDS', 0)
+
+
+class EdgeCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, 'edge_shell', False):
+            if (
+                response.status_code in (200, 304)
+                and not response.cookies
+                and not has_vary_header(response, 'Cookie')
+            ):
+                patch_cache_control(response, public=True, max_age=0, s_maxage=edge_cache_seconds())
+            else:
+                patch_cache_control(response, private=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            edge_cache_seconds()
+            and request.method in ('GET', 'HEAD')
+            and request.resolver_match.view_name in getattr(settings, 'EDGE_CACHED_VIEWS', ())
+        ):
+            request.edge_shell = True
+            # Rendered for nobody in particular; the session is left unread.
+            request.user = AnonymousUser()
+            # allauth's AccountMiddleware would read it after every page to drop
+            # abandoned login flows; the session_fragments request does that.
+            request._account_login_accessed = True
+        return None
@@ -0,0 +1,330 @@
+"""
+Per-request profiling.
+
+ProfilingMiddleware records, for every request, the wall time, the number
+and total time of SQL queries (and how many of them were exact repeats of an
+earlier query in the same request), cache hits and misses, and the time
+spent rendering templates. Records are tagged with the view name the URL
+resolved to (``listing_list``, ``agents:agent_dashboard``, ...) and:
+
+- are added to per-process totals served in the Prometheus text format by
+  `metrics` (``/metrics/``);
+- are sent as a ``Server-Timing`` header when PROFILING_SERVER_TIMING is on,
+  so they show up in the browser's network panel;
+- are logged at DEBUG, or at WARNING for slow requests and for GET requests
+  over the view's query budget (QUERY_BUDGETS). With QUERY_BUDGETS_STRICT
+  (set by the test runner, see test_runner.py) going over budget raises
+  QueryBudgetExceeded instead, failing the test that made the request.
+
+Cache and template timings come from the cache backends and the template
+backend defined here, which settings use in place of Django's own.
+"""
+import hmac
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+from django.core.cache.backends.redis import RedisCache as BaseRedisCache
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_profile', default=None)
+_MISSING = object()
+UNRESOLVED = '<unresolved>'
+# Request duration histogram buckets, in seconds.
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view = UNRESOLVED
+        self.method = ''
+        self.status = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_seconds = 0.0
+        self._statements = {}
+        self._in_get_many = False
+        self._rendering = False
+
+    def record_query(self, execute, sql, params, many, context):
+        """execute_wrapper callback."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - start
+            self.queries += 1
+            key = (context['connection'].alias, sql, repr(params))
+            self._statements[key] = self._statements.get(key, 0) + 1
+
+    @property
+    def duplicate_queries(self):
+        """Queries that repeated an earlier one exactly (same SQL and parameters)."""
+        return sum(count - 1 for count in self._statements.values())
+
+    def most_repeated(self):
+        """(count, sql) of the most repeated statement, or None."""
+        if not self._statements:
+            return None
+        (_, sql, _), count = max(self._statements.items(), key=lambda item: item[1])
+        return (count, sql) if count > 1 else None
+
+    def finish(self, request, response):
+        self.seconds = time.perf_counter() - self.started
+        self.method = request.method
+        self.status = response.status_code
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            self.view = match.view_name
+
+    def server_timing(self):
+        duplicates = self.duplicate_queries
+        return ', '.join([
+            f'total;dur={self.seconds * 1000:.1f}',
+            f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries, {duplicates} duplicate"',
+            f'tpl;dur={self.template_seconds * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ])
+
+
+def current_profile():
+    """The profile of the request being handled on this thread, or None."""
+    return _current.get()
+
+
+class Metrics:
+    """Per-process totals by view, in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._responses = {}
+
+    def observe(self, profile, over_budget=False):
+        status = f'{profile.status // 100}xx'
+        with self._lock:
+            key = (profile.view, profile.method, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+            stats = self._views.get(profile.view)
+            if stats is None:
+                stats = self._views[profile.view] = {
+                    'buckets': [0] * len(BUCKETS), 'count': 0, 'seconds': 0.0, 'queries': 0,
+                    'query_seconds': 0.0, 'duplicate_queries': 0, 'cache_hits': 0, 'cache_misses': 0,
+                    'template_seconds': 0.0, 'over_budget': 0,
+                }
+            for i, bound in enumerate(BUCKETS):
+                if profile.seconds <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['seconds'] += profile.seconds
+            stats['queries'] += profile.queries
+            stats['query_seconds'] += profile.query_seconds
+            stats['duplicate_queries'] += profile.duplicate_queries
+            stats['cache_hits'] += profile.cache_hits
+            stats['cache_misses'] += profile.cache_misses
+            stats['template_seconds'] += profile.template_seconds
+            stats['over_budget'] += over_budget
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._responses.clear()
+
+    def render(self):
+        with self._lock:
+            views = {view: dict(stats, buckets=list(stats['buckets'])) for view, stats in self._views.items()}
+            responses = dict(self._responses)
+
+        lines = [
+            '# HELP ikr_http_responses_total Responses by view, method and status class.',
+            '# TYPE ikr_http_responses_total counter',
+        ]
+        for (view, method, status), count in sorted(responses.items()):
+            lines.append(f'ikr_http_responses_total{{view="{_label(view)}",method="{method}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP ikr_http_request_duration_seconds Wall time of requests by view.',
+            '# TYPE ikr_http_request_duration_seconds histogram',
+        ]
+        for view, stats in sorted(views.items()):
+            label = _label(view)
+            for bound, count in zip(BUCKETS, stats['buckets']):
+                lines.append(f'ikr_http_request_duration_seconds_bucket{{view="{label}",le="{bound}"}} {count}')
+            lines.append(f'ikr_http_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'ikr_http_request_duration_seconds_sum{{view="{label}"}} {stats["seconds"]:.6f}')
+            lines.append(f'ikr_http_request_duration_seconds_count{{view="{label}"}} {stats["count"]}')
+
+        for name, key, help_text in (
+            ('db_queries_total', 'queries', 'SQL queries run by view.'),
+            ('db_query_seconds_total', 'query_seconds', 'Time spent in SQL queries by view.'),
+            ('db_duplicate_queries_total', 'duplicate_queries', 'Exact repeats of a query within a request.'),
+            ('cache_hits_total', 'cache_hits', 'Cache hits by view.'),
+            ('cache_misses_total', 'cache_misses', 'Cache misses by view.'),
+            ('template_seconds_total', 'template_seconds', 'Time spent rendering templates by view.'),
+            ('query_budget_exceeded_total', 'over_budget', 'Requests over their view\'s query budget.'),
+        ):
+            lines += [f'# HELP ikr_{name} {help_text}', f'# TYPE ikr_{name} counter']
+            for view, stats in sorted(views.items()):
+                value = stats[key]
+                value = f'{value:.6f}' if isinstance(value, float) else value
+                lines.append(f'ikr_{name}{{view="{_label(view)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+metrics_registry = Metrics()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        request.profile = profile
+        token = _current.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        profile.finish(request, response)
+
+        budget = query_budget(profile.view) if request.method in ('GET', 'HEAD') else None
+        over_budget = budget is not None and profile.queries > budget
+        metrics_registry.observe(profile, over_budget)
+        if getattr(settings, 'PROFILING_SERVER_TIMING', False):
+            response['Server-Timing'] = profile.server_timing()
+        if over_budget and getattr(settings, 'QUERY_BUDGETS_STRICT', False):
+            raise QueryBudgetExceeded(
+                f'{profile.view} ran {profile.queries} queries, over its budget of {budget} '
+                f'({profile.duplicate_queries} duplicate).'
+            )
+        self.log(profile, budget, over_budget)
+        return response
+
+    def log(self, profile, budget, over_budget):
+        slow = profile.seconds * 1000 >= getattr(settings, 'PROFILING_SLOW_REQUEST_MS', 1000)
+        level = logging.WARNING if over_budget or slow else logging.DEBUG
+        if not logger.isEnabledFor(level):
+            return
+        repeated = profile.most_repeated()
+        logger.log(
+            level,
+            '%s %s %s %.1fms db=%d/%.1fms duplicate=%d cache=%d/%d tpl=%.1fms%s%s',
+            profile.method, profile.view, profile.status, profile.seconds * 1000, profile.queries,
+            profile.query_seconds * 1000, profile.duplicate_queries, profile.cache_hits, profile.cache_misses,
+            profile.template_seconds * 1000,
+            f' OVER BUDGET ({budget})' if over_budget else '',
+            f' most repeated ({repeated[0]}x): {repeated[1][:200]}' if repeated else '',
+        )
+
+
+def query_budget(view):
+    """The most queries a GET of `view` may run, or None if it has no budget."""
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view)
+
+
+def metrics(request):
+    """Prometheus metrics, for METRICS_TOKEN bearers (or staff, without a token)."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        authorized = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        authorized = request.user.is_staff
+    if not authorized:
+        raise Http404
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfiledCacheMixin:
+    """Counts get() and get_many() hits and misses against the current request."""
+
+    def get(self, key, default=None, version=None):
+        profile = _current.get()
+        if profile is None or profile._in_get_many:
+            return super().get(key, default, version)
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            profile.cache_misses += 1
+            return default
+        profile.cache_hits += 1
+        return value
+
+    def get_many(self, keys, version=None):
+        profile = _current.get()
+        if profile is None or profile._in_get_many:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        # The base implementation calls get() for each key; count them once here.
+        profile._in_get_many = True
+        try:
+            found = super().get_many(keys, version)
+        finally:
+            profile._in_get_many = False
+        profile.cache_hits += len(found)
+        profile.cache_misses += len(keys) - len(found)
+        return found
+
+
+class LocMemCache(ProfiledCacheMixin, BaseLocMemCache):
+    pass
+
+
+class RedisCache(ProfiledCacheMixin, BaseRedisCache):
+    pass
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None or profile._rendering:
+            return self._template.render(context, request)
+        # Templates rendered while rendering this one are already timed by it.
+        profile._rendering = True
+        start = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            profile._rendering = False
+            profile.template_seconds += time.perf_counter() - start
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """Django's template backend, timing renders against the current request."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,111 @@
+"""
+Read-replica routing.
+
+When replicas are configured (DATABASE_REPLICAS, set in production from
+DATABASE_REPLICA_URLS), ReplicaRoutingMiddleware picks one of them at random
+for anonymous GET and HEAD requests to the public catalogue views in
+REPLICA_VIEWS, and ReplicaRouter sends those requests' reads of listings and
+agents tables to it. Everything else reads from the primary: signed-in
+users, users and sessions, background tasks, reads inside a transaction and
+reads after a write in the same request.
+
+Read-your-writes: a request that writes to the database (other than its
+session) sets the READ_YOUR_WRITES_COOKIE cookie, and for the next
+READ_YOUR_WRITES_SECONDS that browser's requests read from the primary too,
+so e.g. an agent who signs out right after an edit still sees it.
+
+A replica can lag the primary by a moment. Catalogue cache entries built
+from replica reads are kept apart from the ones built from the primary (so
+primary readers never see a replica's stale page) and expire after at most
+REPLICA_CACHE_TIMEOUT seconds (see apps/listings/cache.py).
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_APPS = {'listings', 'agents'}
+READ_YOUR_WRITES_COOKIE = 'ikr_primary'
+# Writes that don't pin a browser to the primary.
+UNPINNED_APPS = {'sessions'}
+
+_replica = ContextVar('replica', default=None)
+# False during a request until it writes; None outside requests.
+_wrote = ContextVar('wrote', default=None)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def reading_from_replica():
+    """True while the current request may read from a replica."""
+    return _replica.get() is not None and not _wrote.get()
+
+
+def pinned_to_primary(request):
+    """Whether the browser wrote something recently enough to need the primary."""
+    try:
+        return float(request.COOKIES.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            # Set by process_view; TemplateResponses have been rendered by now.
+            _replica.set(None)
+            _wrote.set(None)
+        if wrote:
+            seconds = getattr(settings, 'READ_YOUR_WRITES_SECONDS', 30)
+            response.set_cookie(
+                READ_YOUR_WRITES_COOKIE, str(int(time.time() + seconds)), max_age=seconds,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas = replica_aliases()
+        if (
+            replicas
+            and request.method in ('GET', 'HEAD')
+            and request.resolver_match.view_name in getattr(settings, 'REPLICA_VIEWS', ())
+            and not pinned_to_primary(request)
+            and not request.user.is_authenticated
+        ):
+            _replica.set(random.choice(replicas))
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            not reading_from_replica()
+            or model._meta.app_label not in REPLICA_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return None
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        if _wrote.get() is False and model._meta.app_label not in UNPINNED_APPS:
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are migrated by replication from the primary.
+        return db not in replica_aliases()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,8 +58,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ikr_project.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Outside the session and CSRF middleware, to see the cookies and Vary they add.
+    'ikr_project.edge.EdgeCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,21 +70,32 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "allauth.account.middleware.AccountMiddleware",
+    'ikr_project.routers.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'ikr_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, timing renders for ikr_project.profiling.
+        'BACKEND': 'ikr_project.profiling.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.pages.fragments.fragment_cache',
+            ],
+            # Each template is compiled once per process (runserver's
+            # autoreloader clears them when a template changes). See
+            # apps/pages/fragments.py for precompiling them at worker boot.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -99,6 +114,101 @@ DATABASES = {
     }
 }
 
+# Anonymous visitors to public catalogue pages read listings and agents from
+# a replica when production.py configures any (DATABASE_REPLICA_URLS). After a
+# write a browser reads from the primary for READ_YOUR_WRITES_SECONDS.
+# See ikr_project/routers.py.
+DATABASE_ROUTERS = ['ikr_project.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_VIEWS = {
+    'home', 'search', 'listing_list', 'listing_detail', 'listing_facets',
+    'agents:agent_list', 'agents:agent_detail',
+}
+READ_YOUR_WRITES_SECONDS = config('READ_YOUR_WRITES_SECONDS', default=30, cast=int)
+# Upper bound on how long catalogue cache entries built from replica reads
+# live, so a lagging replica cannot pin stale pages until the next change.
+REPLICA_CACHE_TIMEOUT = config('REPLICA_CACHE_TIMEOUT', default=60, cast=int)
+
+# Public catalogue pages rendered as shells the same for every visitor, which
+# nginx or a CDN may cache for EDGE_CACHE_SECONDS (0: off); the visitor's own
+# parts are loaded separately. See ikr_project/edge.py.
+EDGE_CACHE_SECONDS = config('EDGE_CACHE_SECONDS', default=0, cast=int)
+EDGE_CACHED_VIEWS = {
+    'home', 'listing_list', 'listing_detail', 'agents:agent_list', 'agents:agent_detail',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Redis when REDIS_URL is set, otherwise a per-process in-memory cache. The
+# backends are Django's, counting hits and misses for ikr_project.profiling.
+
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'ikr_project.profiling.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'ikr_project.profiling.LocMemCache',
+            'LOCATION': 'ikr-catalogue',
+        }
+    }
+
+# Rendered navbar, footer and listing card HTML (apps/pages/fragments.py).
+# Entries are keyed on what they show and on the templates' source, so the
+# timeout only bounds how long unused ones are kept.
+TEMPLATE_FRAGMENT_TIMEOUT = config('TEMPLATE_FRAGMENT_TIMEOUT', default=60 * 60 * 24, cast=int)
+if config('TEMPLATE_FRAGMENT_CACHE', default=True, cast=bool):
+    CACHES['fragments'] = {**CACHES['default'], 'KEY_PREFIX': 'fragments'}
+else:
+    CACHES['fragments'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+# How long catalogue pages and fragments stay cached (seconds). Entries are
+# invalidated on change by apps/listings/signals.py, so this is only an upper bound.
+CATALOGUE_CACHE_TIMEOUT = config('CATALOGUE_CACHE_TIMEOUT', default=60 * 15, cast=int)
+
+# Show a planner-estimated result count with cursor pagination (PostgreSQL only;
+# ignored on other databases). See apps/listings/pagination.py.
+PAGINATION_APPROXIMATE_COUNTS = config('PAGINATION_APPROXIMATE_COUNTS', default=True, cast=bool)
+
+# Filter listing pages against an in-memory NumPy snapshot of the published
+# catalogue instead of the database. See apps/listings/columns.py.
+LISTING_COLUMN_STORE = config('LISTING_COLUMN_STORE', default=False, cast=bool)
+# Without a shared cache (REDIS_URL), changes made by other processes only
+# reach a process's snapshot when it is rebuilt at this age (seconds).
+LISTING_COLUMN_STORE_MAX_AGE = config('LISTING_COLUMN_STORE_MAX_AGE', default=60, cast=int)
+
+
+# Request profiling (ikr_project/profiling.py): per-view timings, query
+# counts and cache hits, served to Prometheus at /metrics/ (with
+# "Authorization: Bearer <METRICS_TOKEN>", or to staff without a token).
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILING_SERVER_TIMING = config('PROFILING_SERVER_TIMING', default=DEBUG, cast=bool)
+PROFILING_SLOW_REQUEST_MS = config('PROFILING_SLOW_REQUEST_MS', default=1000, cast=int)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Most SQL queries a GET of each view may run with a cold cache, for a
+# signed-in user (the session and user lookups are 2 of them). Going over is
+# logged, and fails the test suite (QUERY_BUDGETS_STRICT, set by the runner).
+QUERY_BUDGETS = {
+    'home': 6,
+    'search': 7,
+    'listing_list': 12,  # full-text search
+    'listing_detail': 9,
+    'listing_facets': 6,
+    'session_fragments': 4,
+    'agents:agent_list': 4,
+    'agents:agent_detail': 5,
+    'agents:agent_dashboard': 7,
+    'agents:agent_dashboard_listings': 6,
+}
+QUERY_BUDGETS_STRICT = False
+TEST_RUNNER = 'ikr_project.test_runner.BudgetTestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -188,3 +298,35 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@yourdomain.com')
+
+# Inquiry emails are queued in the outbox (apps/inquiries/notifications.py)
+# and sent in the background, over at most this many SMTP connections per process.
+EMAIL_CONNECTION_POOL_SIZE = config('EMAIL_CONNECTION_POOL_SIZE', default=2, cast=int)
+# Hold agent notifications this long so several inquiries go out as one digest
+# (0 sends each one immediately).
+INQUIRY_AGENT_DIGEST_SECONDS = config('INQUIRY_AGENT_DIGEST_SECONDS', default=0, cast=int)
+
+# Background tasks
+# With a broker, tasks run on Celery workers; without one they run on an
+# in-process thread pool of BACKGROUND_WORKERS threads (ikr_project/celery.py).
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='')
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    'send-outbox': {
+        'task': 'inquiries.send_outbox',
+        'schedule': 60.0,
+    },
+}
+BACKGROUND_WORKERS = config('BACKGROUND_WORKERS', default=4, cast=int)
+# Related listings are refreshed this long (seconds) after the first change,
+# together with every listing changed meanwhile (apps/listings/recommendations.py).
+NEIGHBOUR_REFRESH_DELAY = config('NEIGHBOUR_REFRESH_DELAY', default=1.0, cast=float)
+
+# Listing photos from the listing form are written here and uploaded to
+# Cloudinary in the background (apps/listings/images.py). With Celery
+# workers on other machines this must be a shared volume.
+LISTING_IMAGE_STAGING_ROOT = config(
+    'LISTING_IMAGE_STAGING_ROOT', default=os.path.join(tempfile.gettempdir(), 'ikr-listing-uploads'),
+)
+# Concurrent Cloudinary uploads per upload task.
+LISTING_IMAGE_UPLOAD_WORKERS = config('LISTING_IMAGE_UPLOAD_WORKERS', default=4, cast=int)
@@ -3,3 +3,14 @@ from .base import *
 DEBUG = True
 ALLOWED_HOSTS = ['localhost', '127.0.0.1', '127.0.0.1:8000', 'testserver']
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Uncomment for console logging
+
+# Fragment keys follow the templates' source as of startup, and runserver
+# reloads templates without restarting: don't cache fragments unless asked to.
+if not config('TEMPLATE_FRAGMENT_CACHE', default=False, cast=bool):
+    CACHES['fragments'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+
+# Replica routing harness: the same database under a second alias. Tests
+# route to it with override_settings(DATABASE_REPLICAS=['replica']);
+# DATABASE_REPLICA_MIRROR=True does the same for runserver.
+DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = ['replica'] if config('DATABASE_REPLICA_MIRROR', default=False, cast=bool) else []
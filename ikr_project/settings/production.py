@@ -1,5 +1,6 @@
 from .base import *
 import dj_database_url
+import importlib.util
 import os
 from decouple import config
 
@@ -28,23 +29,74 @@ if not DEBUG:
     SESSION_COOKIE_SECURE = True
 
 # Database
+# Connections persist for DB_CONN_MAX_AGE seconds and are health-checked
+# before reuse, instead of a new TCP + auth handshake on every request.
+#
+# DB_POOL=True uses Django's native connection pool instead (min/max size
+# DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE per process). It needs psycopg 3: replace
+# psycopg2-binary with "psycopg[binary,pool]" in requirements.txt. Django picks
+# psycopg 3 automatically when it is installed; nothing else changes.
+#
+# DB_PGBOUNCER=True is for PgBouncer in transaction pooling mode, where
+# consecutive statements may run on different server connections: no
+# server-side cursors (QuerySet.iterator() would lose its cursor) and no
+# prepared statements (psycopg 3 prepares repeated queries by default).
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+DB_PGBOUNCER = config('DB_PGBOUNCER', default=False, cast=bool)
+
+
+def database_config(url=None, **fields):
+    if url:
+        database = dj_database_url.parse(url)
+    else:
+        database = {'ENGINE': 'django.db.backends.postgresql', **fields}
+    database.setdefault('OPTIONS', {})
+    if DB_POOL:
+        # Pooled connections are returned to the pool after each request;
+        # persistent connections and the pool are mutually exclusive.
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        }
+    else:
+        database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+        database['CONN_HEALTH_CHECKS'] = True
+    if DB_PGBOUNCER:
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+        if importlib.util.find_spec('psycopg'):  # psycopg2 never prepares statements
+            database['OPTIONS']['prepare_threshold'] = None
+    return database
+
+
 DATABASE_URL = config('DATABASE_URL', default='')
 if DATABASE_URL:
     DATABASES = {
-        'default': dj_database_url.config(default=DATABASE_URL)
+        'default': database_config(DATABASE_URL)
     }
 else:
     DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.postgresql',
-            'NAME': config('DB_NAME', default='ikr_project'),
-            'USER': config('DB_USER', default='ikr_user'),
-            'PASSWORD': config('DB_PASSWORD', default='ikr_password'),
-            'HOST': config('DB_HOST', default='localhost'),
-            'PORT': config('DB_PORT', default='5432'),
-        }
+        'default': database_config(
+            NAME=config('DB_NAME', default='ikr_project'),
+            USER=config('DB_USER', default='ikr_user'),
+            PASSWORD=config('DB_PASSWORD', default='ikr_password'),
+            HOST=config('DB_HOST', default='localhost'),
+            PORT=config('DB_PORT', default='5432'),
+        )
     }
 
+# Read replicas for public listing and agent pages (ikr_project/routers.py),
+# comma-separated. Tests use the primary for them.
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='')
+DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, (url.strip() for url in DATABASE_REPLICA_URLS.split(','))), start=1):
+    alias = 'replica' if number == 1 else f'replica_{number}'
+    DATABASES[alias] = database_config(url)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
 # Static files
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATIC_URL = '/static/'
@@ -77,13 +129,22 @@ if EMAIL_BACKEND == 'django.core.mail.backends.smtp.EmailBackend':
     DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL')
 
 # Logging
+# Our own loggers (apps.*, ikr_project.*) go to the console too. Profiling
+# records slow and over-budget requests at WARNING; set PROFILING_LOG_LEVEL=DEBUG
+# to log every request.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'default': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
     'handlers': {
         'console': {
-            'level': 'INFO',
+            'level': 'DEBUG',
             'class': 'logging.StreamHandler',
+            'formatter': 'default',
         },
     },
     'loggers': {
@@ -92,5 +153,20 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'apps': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'ikr_project': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'ikr_project.profiling': {
+            'handlers': ['console'],
+            'level': config('PROFILING_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
     },
 }
@@ -0,0 +1,10 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class BudgetTestRunner(DiscoverRunner):
+    """Fails any test whose GET request runs more queries than its view's QUERY_BUDGETS entry."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGETS_STRICT = True
@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from apps.pages.views import custom_404_view, custom_500_view
+from ikr_project.profiling import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -28,6 +29,7 @@ urlpatterns = [
     path('listings/', include('apps.listings.urls')),
     path('inquiries/', include('apps.inquiries.urls')),
     path('accounts/', include('allauth.urls')),
+    path('metrics/', metrics, name='metrics'),
 ]
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)